@@ -0,0 +1,367 @@
+# global_tools/archive_engine.py
+# Archive writer for project packaging: zip, tar.gz, tar.xz and tar.zst.
+# Compression runs on a thread pool (zlib, lzma and zstandard release the GIL)
+# while a single writer emits the results in order:
+#   zip  - one task per file (raw deflate + CRC); already-compressed assets are stored
+#   tar  - the tar stream is cut into chunks compressed as independent
+#          gzip members / xz streams / zstd frames, which standard tools read as one stream
+# Output is deterministic: entries sorted by name, fixed timestamps, normalized modes and
+# owners, so identical inputs give byte-identical archives. With a manifest, zip builds are
+# incremental: unchanged files (same size+mtime, or same content hash) have their compressed
+# bytes copied raw from the previous archive instead of being recompressed. Files of
+# LARGE_FILE_SIZE and up are streamed in chunks by the writer instead of being read whole.
+import os
+import sys
+import lzma
+import zlib
+import struct
+import hashlib
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+try: import zstandard # Optional: only needed for tar.zst
+except ImportError: zstandard = None
+from . import utils
+
+FORMATS = {'zip': '.zip', 'tar.gz': '.tar.gz', 'tar.xz': '.tar.xz', 'tar.zst': '.tar.zst'}
+DEFAULT_LEVELS = {'zip': 6, 'tar.gz': 6, 'tar.xz': 6, 'tar.zst': 3}
+LEVEL_RANGES = {'zip': (0, 9), 'tar.gz': (0, 9), 'tar.xz': (0, 9), 'tar.zst': (1, 22)}
+# Stored as-is in zip archives: recompressing them costs time and gains nothing
+STORED_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.ico', '.woff', '.woff2', '.gz', '.tgz', '.br',
+                   '.zst', '.xz', '.bz2', '.zip', '.7z', '.rar', '.jar', '.whl', '.mp3', '.mp4', '.webm', '.ogg', '.m4a')
+CHUNK_SIZE = 4 * 1024 * 1024 # Uncompressed bytes per gzip member / zstd frame
+XZ_CHUNK_SIZE = 16 * 1024 * 1024 # xz needs larger blocks to keep its ratio
+LARGE_FILE_SIZE = 64 * 1024 * 1024 # Zip entries from this size on are streamed, not read into memory
+MAX_IN_FLIGHT_BYTES = 256 * 1024 * 1024 # Upper bound on file data held by pending zip tasks
+FIXED_MTIME = 315532800 # 1980-01-01 00:00:00 UTC, the earliest zip date
+MANIFEST_VERSION = 1
+PACKAGE_MANIFEST_FILE_NAME = "package_manifest.json"
+
+def available_formats():
+    """Formats usable here (tar.zst needs the optional zstandard package). SILENT."""
+    return [fmt for fmt in FORMATS if fmt != 'tar.zst' or zstandard is not None]
+
+def get_default_workers():
+    return os.cpu_count() or 1
+
+def get_configured_format():
+    """[Packaging] Format, falling back to zip when unknown or unavailable. SILENT."""
+    fmt = utils.get_config_value("Packaging", "Format", "zip").strip().lower()
+    return fmt if fmt in available_formats() else 'zip'
+
+def get_configured_level(fmt):
+    """[Packaging] Level clamped to the format's range, else the format default. SILENT."""
+    try: level = int(utils.get_config_value("Packaging", "Level", str(DEFAULT_LEVELS[fmt])))
+    except ValueError: return DEFAULT_LEVELS[fmt]
+    return max(LEVEL_RANGES[fmt][0], min(LEVEL_RANGES[fmt][1], level))
+
+def prompt_archive_options():
+    """Asks for format and level (defaults from [Packaging]) and stores the choice. Returns (fmt, level) or None."""
+    formats = available_formats(); current = get_configured_format()
+    if zstandard is None: print("提示: 安装 'zstandard' 后可使用 tar.zst 格式。")
+    fmt = utils.get_user_choice("请选择归档格式:", formats, formats.index(current))
+    if not fmt: return None
+    low, high = LEVEL_RANGES[fmt]
+    default_level = get_configured_level(fmt) if fmt == current else DEFAULT_LEVELS[fmt]
+    level_str = utils.get_user_input(f"请输入压缩级别 ({low}-{high})", default=str(default_level))
+    if level_str is None: return None
+    try: level = max(low, min(high, int(level_str)))
+    except ValueError: print(f"无效的压缩级别 '{level_str}'，使用 {default_level}。"); level = default_level
+    utils.set_config_value("Packaging", "Format", fmt); utils.set_config_value("Packaging", "Level", str(level))
+    return fmt, level
+
+# --- Parallel Stream Compression ---
+class ParallelCompressWriter:
+    """
+    File-like writer: input is cut into chunk_size blocks, compressed concurrently
+    by compress(bytes) -> bytes and written in order. At most 2 x workers blocks are in flight.
+    """
+    def __init__(self, fileobj, compress, chunk_size=CHUNK_SIZE, max_workers=None):
+        self.fileobj = fileobj; self.compress = compress; self.chunk_size = chunk_size; self.buffer = bytearray()
+        self.max_workers = max_workers or get_default_workers()
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.pending = []; self.max_pending = self.max_workers * 2
+
+    def _drain(self, keep):
+        while len(self.pending) > keep: self.fileobj.write(self.pending.pop(0).result())
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.chunk_size:
+            chunk = bytes(self.buffer[:self.chunk_size]); del self.buffer[:self.chunk_size]
+            self.pending.append(self.pool.submit(self.compress, chunk))
+            self._drain(self.max_pending)
+        return len(data)
+
+    def close(self):
+        if self.buffer or not self.pending: self.pending.append(self.pool.submit(self.compress, bytes(self.buffer)))
+        self.buffer = bytearray(); self._drain(0); self.pool.shutdown()
+
+class ParallelGzipWriter(ParallelCompressWriter):
+    """Multi-member gzip stream; gzip.open and `tar xzf` read it as one stream."""
+    def __init__(self, fileobj, level=6, max_workers=None):
+        super().__init__(fileobj, lambda data: self._gzip(data, level), CHUNK_SIZE, max_workers)
+
+    @staticmethod
+    def _gzip(data, level):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits 31: gzip header + trailer
+        return compressor.compress(data) + compressor.flush()
+
+def _stream_writer(fmt, fileobj, level, max_workers):
+    if fmt == 'tar.gz': return ParallelGzipWriter(fileobj, level, max_workers)
+    if fmt == 'tar.xz': return ParallelCompressWriter(fileobj, lambda data: lzma.compress(data, format=lzma.FORMAT_XZ, preset=level), XZ_CHUNK_SIZE, max_workers)
+    compressor_level = level # zstandard compressors are not thread-safe: one per chunk
+    return ParallelCompressWriter(fileobj, lambda data: zstandard.ZstdCompressor(level=compressor_level).compress(data), CHUNK_SIZE, max_workers)
+
+# --- Zip Writer ---
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+_ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+_ZIP64_LOCATOR = struct.Struct('<4sLQL')
+_ZIP64_LIMIT = 0xFFFFFFFF
+_METHOD_STORED, _METHOD_DEFLATED = 0, 8
+_UTF8_FLAG = 0x800
+
+_FIXED_DOS_TIME, _FIXED_DOS_DATE = 0, (1 << 5) | 1 # 1980-01-01 00:00:00
+
+def _normalized_mode(st_mode):
+    return 0o100755 if st_mode & 0o111 else 0o100644
+
+class ZipStreamWriter:
+    """
+    Sequential zip writer for entries whose compressed bytes are already known
+    (raw deflate or stored). Writes Zip64 records only when sizes, offsets or counts need them.
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj; self.offset = 0; self.entries = []
+
+    def add(self, name, payload, crc, file_size, method, mode):
+        """Appends one entry (payload is the raw deflated or stored data). Returns the payload's offset."""
+        encoded = name.encode('utf-8'); flags = _UTF8_FLAG if not name.isascii() else 0
+        dos_time, dos_date = _FIXED_DOS_TIME, _FIXED_DOS_DATE; zip64 = file_size >= _ZIP64_LIMIT or len(payload) >= _ZIP64_LIMIT
+        extra = struct.pack('<HHQQ', 1, 16, file_size, len(payload)) if zip64 else b''
+        header = _LOCAL_HEADER.pack(b'PK\003\004', 45 if zip64 else 20, 0, flags, method, dos_time, dos_date, crc,
+                                    _ZIP64_LIMIT if zip64 else len(payload), _ZIP64_LIMIT if zip64 else file_size, len(encoded), len(extra))
+        self.entries.append((encoded, flags, method, dos_time, dos_date, crc, len(payload), file_size, mode, self.offset))
+        for part in (header, encoded, extra, payload): self.fileobj.write(part)
+        data_offset = self.offset + len(header) + len(encoded) + len(extra)
+        self.offset = data_offset + len(payload)
+        return data_offset
+
+    def add_streamed(self, name, file_size, method, mode, produce):
+        """
+        Appends one entry whose payload is written by produce(write) -> crc, for data too
+        large to hold in memory. The local header always carries a Zip64 extra and is
+        patched once crc and compressed size are known (fileobj must be seekable).
+        On error the partial entry is truncated away. Returns (payload offset, crc, compressed size).
+        """
+        encoded = name.encode('utf-8'); flags = _UTF8_FLAG if not name.isascii() else 0; start = self.offset
+        header_size = _LOCAL_HEADER.size + len(encoded) + 20; data_offset = start + header_size
+        written = [0]
+        def write(data): self.fileobj.write(data); written[0] += len(data)
+        try:
+            self.fileobj.write(b'\0' * header_size)
+            crc = produce(write)
+            header = _LOCAL_HEADER.pack(b'PK\003\004', 45, 0, flags, method, _FIXED_DOS_TIME, _FIXED_DOS_DATE, crc,
+                                        _ZIP64_LIMIT, _ZIP64_LIMIT, len(encoded), 20)
+            self.fileobj.seek(start)
+            for part in (header, encoded, struct.pack('<HHQQ', 1, 16, file_size, written[0])): self.fileobj.write(part)
+            self.fileobj.seek(data_offset + written[0])
+        except BaseException:
+            self.fileobj.seek(start); self.fileobj.truncate()
+            raise
+        self.entries.append((encoded, flags, method, _FIXED_DOS_TIME, _FIXED_DOS_DATE, crc, written[0], file_size, mode, start))
+        self.offset = data_offset + written[0]
+        return data_offset, crc, written[0]
+
+    def close(self):
+        cd_start = self.offset
+        for encoded, flags, method, dos_time, dos_date, crc, csize, fsize, mode, offset in self.entries:
+            zip64_fields = [v for v in (fsize, csize, offset) if v >= _ZIP64_LIMIT]
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b''
+            header = _CENTRAL_HEADER.pack(b'PK\001\002', 45 if extra else 20, 3, 45 if extra else 20, 0, flags, method, dos_time, dos_date, crc,
+                                          min(csize, _ZIP64_LIMIT), min(fsize, _ZIP64_LIMIT), len(encoded), len(extra), 0, 0, 0,
+                                          (mode & 0xFFFF) << 16, min(offset, _ZIP64_LIMIT))
+            for part in (header, encoded, extra): self.fileobj.write(part)
+            self.offset += len(header) + len(encoded) + len(extra)
+        count = len(self.entries); cd_size = self.offset - cd_start
+        if count >= 0xFFFF or cd_start >= _ZIP64_LIMIT or cd_size >= _ZIP64_LIMIT:
+            self.fileobj.write(_ZIP64_END_RECORD.pack(b'PK\006\006', 44, 45, 45, 0, 0, count, count, cd_size, cd_start))
+            self.fileobj.write(_ZIP64_LOCATOR.pack(b'PK\006\007', 0, self.offset, 1))
+        self.fileobj.write(_END_RECORD.pack(b'PK\005\006', 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                            min(cd_size, _ZIP64_LIMIT), min(cd_start, _ZIP64_LIMIT), 0))
+
+def compress_zip_data(name, data, level):
+    """Compresses one file's content. Returns (payload, crc, method); stores when deflate would not help. SILENT."""
+    crc = zlib.crc32(data)
+    if level == 0 or name.lower().endswith(STORED_SUFFIXES): return data, crc, _METHOD_STORED
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15) # Raw deflate, as zip expects
+    payload = compressor.compress(data) + compressor.flush()
+    if len(payload) >= len(data): return data, crc, _METHOD_STORED
+    return payload, crc, _METHOD_DEFLATED
+
+# --- Incremental Manifest ---
+def load_reusable_entries(manifest_path, output_path, fmt, level):
+    """
+    Previous manifest entries {arcname: {...}} whose bytes can be copied from output_path:
+    only when the manifest describes that exact archive file (same size and mtime) built
+    as zip at the same level. Otherwise {}. SILENT.
+    """
+    manifest = utils.load_json_file(manifest_path) if manifest_path and fmt == 'zip' else None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION: return {}
+    try: st = os.stat(output_path)
+    except OSError: return {}
+    archive = manifest.get('archive') or {}
+    if archive.get('path') != os.path.abspath(output_path) or archive.get('size') != st.st_size or archive.get('mtime_ns') != st.st_mtime_ns: return {}
+    if manifest.get('format') != fmt or manifest.get('level') != level: return {}
+    return manifest.get('entries') or {}
+
+def save_manifest(manifest_path, output_path, fmt, level, entries):
+    st = os.stat(output_path)
+    utils.save_json_file(manifest_path, {'version': MANIFEST_VERSION, 'format': fmt, 'level': level, 'entries': entries,
+                                         'archive': {'path': os.path.abspath(output_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}})
+
+def _read_raw(archive_path, entry):
+    with open(archive_path, 'rb') as f:
+        f.seek(entry['offset']); payload = f.read(entry['csize'])
+    return payload if len(payload) == entry['csize'] else None
+
+def _copy_raw(archive_path, entry, write):
+    """Streams an entry's stored bytes from the previous archive. Returns its crc."""
+    remaining = entry['csize']
+    with open(archive_path, 'rb') as f:
+        f.seek(entry['offset'])
+        while remaining:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data: raise OSError(f"旧归档 '{archive_path}' 已截断")
+            write(data); remaining -= len(data)
+    return entry['crc']
+
+def _stream_zip_file(path, level, method, write, digest):
+    """Compresses (or stores) a file chunk by chunk, updating digest. Returns (crc, bytes read)."""
+    crc = 0; size = 0; compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == _METHOD_DEFLATED else None
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(CHUNK_SIZE)
+            if not data: break
+            crc = zlib.crc32(data, crc); size += len(data); digest.update(data)
+            write(compressor.compress(data) if compressor else data)
+    if compressor: write(compressor.flush())
+    return crc, size
+
+def _add_large_zip_entry(writer, arcname, path, st, level, previous, old_archive):
+    """
+    Writes a LARGE_FILE_SIZE+ entry on the calling thread, streaming instead of reading it whole.
+    Unchanged size+mtime copies the old bytes; there is no content-hash reuse. Returns (entry, reused).
+    """
+    mode = _normalized_mode(st.st_mode)
+    if previous and previous['size'] == st.st_size and previous['mtime_ns'] == st.st_mtime_ns:
+        try:
+            offset, crc, csize = writer.add_streamed(arcname, st.st_size, previous['method'], mode, lambda write: _copy_raw(old_archive, previous, write))
+            return dict(previous, offset=offset), True
+        except OSError: pass # Old archive unusable: recompress below
+    method = _METHOD_STORED if level == 0 or arcname.lower().endswith(STORED_SUFFIXES) else _METHOD_DEFLATED
+    digest = hashlib.sha256()
+    def produce(write):
+        crc, size = _stream_zip_file(path, level, method, write, digest)
+        if size != st.st_size: raise OSError(f"文件在打包过程中被修改: '{path}'") # The header records st_size
+        return crc
+    offset, crc, csize = writer.add_streamed(arcname, st.st_size, method, mode, produce)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest.hexdigest(), 'crc': crc, 'csize': csize, 'method': method, 'offset': offset}, False
+
+def _build_zip_entry(arcname, path, st, level, previous, by_hash, old_archive):
+    """
+    Worker task. Returns (payload, manifest entry without offset, reused). Unchanged
+    size+mtime reuses the old bytes without reading the file; otherwise the content
+    hash is looked up among all old entries (renames and touched-but-equal files reuse too).
+    """
+    if previous and previous['size'] == st.st_size and previous['mtime_ns'] == st.st_mtime_ns:
+        payload = _read_raw(old_archive, previous)
+        if payload is not None: return payload, dict(previous), True
+    with open(path, 'rb') as f: data = f.read()
+    digest = hashlib.sha256(data).hexdigest(); match = by_hash.get(digest)
+    entry = {'size': len(data), 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+    if match and match['size'] == len(data):
+        payload = _read_raw(old_archive, match)
+        if payload is not None: return payload, dict(entry, crc=match['crc'], csize=match['csize'], method=match['method']), True
+    payload, crc, method = compress_zip_data(arcname, data, level)
+    return payload, dict(entry, crc=crc, csize=len(payload), method=method), False
+
+# --- Archive Creation ---
+def create_archive(output_path, files, fmt='zip', level=None, max_workers=None, manifest_path=None):
+    """
+    Writes files ([(arcname, source_path)]) to output_path via a temp file, sorted by
+    arcname with fixed timestamps. With manifest_path (zip only), unchanged entries are
+    copied from the previous archive and the manifest is rewritten for the next run.
+    Returns {'files', 'stored', 'reused', 'bytes_in', 'bytes_out'}.
+    """
+    if fmt not in FORMATS: raise ValueError(f"不支持的归档格式: {fmt}")
+    if fmt == 'tar.zst' and zstandard is None: raise RuntimeError("tar.zst 需要安装可选依赖 'zstandard' (pip install zstandard)")
+    level = DEFAULT_LEVELS[fmt] if level is None else max(LEVEL_RANGES[fmt][0], min(LEVEL_RANGES[fmt][1], int(level)))
+    files = sorted(files); previous = load_reusable_entries(manifest_path, output_path, fmt, level)
+    stats = {'files': 0, 'stored': 0, 'reused': 0, 'bytes_in': 0, 'bytes_out': 0}; entries = {}
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            if fmt == 'zip': _write_zip(raw, files, level, max_workers, stats, previous, output_path, entries)
+            else: _write_tar(raw, files, fmt, level, max_workers, stats)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    stats['bytes_out'] = os.path.getsize(output_path)
+    if manifest_path and fmt == 'zip':
+        try: save_manifest(manifest_path, output_path, fmt, level, entries)
+        except OSError as e: print(f"警告: 无法保存打包清单 '{manifest_path}': {e}", file=sys.stderr)
+    return stats
+
+def _write_zip(raw, files, level, max_workers, stats, previous, old_archive, entries):
+    """
+    Small files are read and compressed on the pool, at most 4 x workers tasks and
+    MAX_IN_FLIGHT_BYTES of file data pending; large files are streamed in order by
+    this thread. A file that cannot be read is skipped with a warning.
+    """
+    writer = ZipStreamWriter(raw); by_hash = {e['sha256']: e for e in previous.values()}
+    workers = max_workers or get_default_workers()
+    def record(arcname, entry, reused):
+        entries[arcname] = entry
+        stats['files'] += 1; stats['bytes_in'] += entry['size']
+        stats['stored'] += entry['method'] == _METHOD_STORED; stats['reused'] += reused
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []; in_flight = [0]; max_pending = workers * 4
+        def drain(keep):
+            while pending and (len(pending) > keep or in_flight[0] > MAX_IN_FLIGHT_BYTES):
+                (arcname, st), future = pending.pop(0); in_flight[0] -= st.st_size
+                try: payload, entry, reused = future.result()
+                except OSError as e: print(f"警告: 跳过 '{arcname}': {e}", file=sys.stderr); continue
+                entry['offset'] = writer.add(arcname, payload, entry['crc'], entry['size'], entry['method'], _normalized_mode(st.st_mode))
+                record(arcname, entry, reused)
+        for arcname, path in files:
+            try: st = os.stat(path)
+            except OSError as e: print(f"警告: 跳过 '{arcname}': {e}", file=sys.stderr); continue
+            if st.st_size >= LARGE_FILE_SIZE:
+                drain(0) # Keep entries in sorted order
+                try: entry, reused = _add_large_zip_entry(writer, arcname, path, st, level, previous.get(arcname), old_archive)
+                except OSError as e: print(f"警告: 跳过 '{arcname}': {e}", file=sys.stderr); continue
+                record(arcname, entry, reused); continue
+            task = pool.submit(_build_zip_entry, arcname, path, st, level, previous.get(arcname), by_hash, old_archive)
+            pending.append(((arcname, st), task)); in_flight[0] += st.st_size
+            drain(max_pending)
+        drain(0)
+    writer.close()
+
+def _write_tar(raw, files, fmt, level, max_workers, stats):
+    writer = _stream_writer(fmt, raw, level, max_workers)
+    with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        for arcname, path in files:
+            try:
+                info = tar.gettarinfo(path, arcname=arcname)
+                info.mtime = FIXED_MTIME; info.uid = info.gid = 0; info.uname = info.gname = ''
+                if info.isreg():
+                    info.mode = _normalized_mode(info.mode) & 0o7777
+                    with open(path, 'rb') as f: tar.addfile(info, f)
+                else: tar.addfile(info)
+            except OSError as e: print(f"警告: 跳过 '{arcname}': {e}", file=sys.stderr); continue
+            stats['files'] += 1; stats['bytes_in'] += info.size
+    writer.close()
@@ -0,0 +1,232 @@
+# global_tools/benchmarks.py
+# Micro-benchmarks for the tool's hot paths.
+# Usage: python -m global_tools.benchmarks <name> [args...]   (no name lists them)
+import os
+import sys
+import time
+import shutil
+import tempfile
+import statistics
+import zipfile
+import subprocess
+from pathlib import Path
+from . import utils
+from . import env_runner
+from . import conda_backend
+from . import local_mirror
+from . import conda_manager
+from . import node_packager
+from . import archive_engine
+
+def _timed_runs(func, iterations):
+    """Calls func `iterations` times and returns the per-call durations in seconds."""
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter(); func(); durations.append(time.perf_counter() - start)
+    return durations
+
+def _print_timing(label, durations):
+    """Prints mean/min/max of a series of durations."""
+    print(f"  {label:<28} 平均 {statistics.mean(durations) * 1000:9.1f} ms  "
+          f"最小 {min(durations) * 1000:9.1f} ms  最大 {max(durations) * 1000:9.1f} ms  (n={len(durations)})")
+
+def _make_fake_env(root):
+    """Creates a minimal conda-like prefix with one no-op command and one activate.d script."""
+    prefix = os.path.join(root, 'fake_env')
+    utils.ensure_dir_exists(os.path.join(prefix, 'conda-meta'))
+    utils.ensure_dir_exists(os.path.join(prefix, 'etc', 'conda', 'activate.d'))
+    open(os.path.join(prefix, 'conda-meta', 'history'), 'w').close()
+    if utils.is_windows():
+        with open(os.path.join(prefix, 'fakecmd.bat'), 'w') as f: f.write("@exit /b 0\n")
+        with open(os.path.join(prefix, 'etc', 'conda', 'activate.d', 'bench.bat'), 'w') as f: f.write("@set BENCH_ACTIVATED=1\n")
+    else:
+        bin_dir = os.path.join(prefix, 'bin'); utils.ensure_dir_exists(bin_dir)
+        cmd_path = os.path.join(bin_dir, 'fakecmd')
+        with open(cmd_path, 'w') as f: f.write("#!/bin/sh\nexit 0\n")
+        os.chmod(cmd_path, 0o755)
+        with open(os.path.join(prefix, 'etc', 'conda', 'activate.d', 'bench.sh'), 'w') as f: f.write("export BENCH_ACTIVATED=1\n")
+    return prefix
+
+def bench_env_execution(iterations=5):
+    """Compares `conda run -p <prefix>` with direct prefix execution on a fake env."""
+    iterations = int(iterations)
+    print(f"\n--- 基准测试: conda run vs 直接执行 (每种 {iterations} 次) ---")
+    root = tempfile.mkdtemp(prefix='env_assist_bench_')
+    try:
+        prefix = _make_fake_env(root)
+        args = ['fakecmd']
+
+        env_runner._activation_cache.pop(prefix, None)
+        cold = _timed_runs(lambda: env_runner.build_activated_env(prefix), 1)
+        _print_timing("构建激活环境 (首次)", cold)
+        _print_timing("构建激活环境 (缓存)", _timed_runs(lambda: env_runner.build_activated_env(prefix), iterations))
+
+        def run_direct():
+            command, env = env_runner.build_prefix_command(prefix, args)
+            subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+        direct = _timed_runs(run_direct, iterations)
+        _print_timing("直接执行", direct)
+
+        conda_exe = shutil.which('conda')
+        if not conda_exe: print("  未找到 'conda'，跳过 conda run 对比。"); return
+        def run_conda():
+            subprocess.run([conda_exe, 'run', '-p', prefix, '--no-capture-output'] + args, check=True, stdout=subprocess.DEVNULL)
+        try: wrapped = _timed_runs(run_conda, iterations)
+        except subprocess.CalledProcessError as e: print(f"  conda run 执行失败 (返回码 {e.returncode})，跳过对比。"); return
+        _print_timing("conda run", wrapped)
+        saved = statistics.mean(wrapped) - statistics.mean(direct)
+        print(f"  每条命令节省约 {saved * 1000:.1f} ms ({statistics.mean(wrapped) / statistics.mean(direct):.1f}x)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def _make_node_tree(root, total_files):
+    """
+    Synthetic Next.js-like project: ~95% of files under node_modules (nested packages),
+    the rest in src/ and public/, plus a .next build dir and a .gitignore. Returns the source file count.
+    """
+    def make_files(directory, count, suffix):
+        utils.ensure_dir_exists(directory)
+        for i in range(count):
+            with open(os.path.join(directory, f"f{i}{suffix}"), 'w') as f: f.write("x")
+    project = os.path.join(root, 'project'); module_files = int(total_files * 0.95); per_dir = 50
+    for i in range(module_files // per_dir): make_files(os.path.join(project, 'node_modules', f'pkg{i // 40}', 'lib', f'm{i % 40}'), per_dir, '.js')
+    source_files = total_files - module_files - 200
+    for i in range(max(1, source_files // per_dir)): make_files(os.path.join(project, 'src', f'feature{i // 10}', f'c{i % 10}'), per_dir, '.tsx')
+    make_files(os.path.join(project, '.next', 'cache'), 100, '.pack'); make_files(os.path.join(project, 'coverage'), 100, '.json')
+    with open(os.path.join(project, '.gitignore'), 'w') as f: f.write("node_modules/\n.next/\ncoverage/\n*.log\n")
+    with open(os.path.join(project, 'package.json'), 'w') as f: f.write('{"name": "bench"}')
+    return project
+
+def _legacy_node_walk(project_root):
+    """The previous package_nodejs_project selection: rglob everything, filter afterwards."""
+    exclude_list = {'node_modules', '.git', '.vscode', 'dist', 'build', '.DS_Store', 'Thumbs.db'}
+    root_path = Path(project_root); zip_path = root_path / 'bench_package.zip'; files = 0
+    for item_path in root_path.rglob('*'):
+        relative_path = item_path.relative_to(root_path)
+        if item_path.resolve() == zip_path.resolve(): continue
+        if {part for part in relative_path.parts}.intersection(exclude_list): continue
+        if item_path.name.endswith(('.log', '.env', '.zip', '.tgz')) or item_path.name.startswith('.env.'): continue
+        if item_path.is_file(): files += 1
+    return files
+
+def bench_node_packaging(files=200000, iterations=3):
+    """Selects files to package from a synthetic Node.js tree: legacy rglob vs pruned scandir walker."""
+    files = int(files); iterations = int(iterations)
+    print(f"\n--- 基准测试: Node.js 打包文件遍历 ({files} 个文件, 每种 {iterations} 次) ---")
+    root = tempfile.mkdtemp(prefix='env_assist_bench_')
+    try:
+        start = time.perf_counter(); project = _make_node_tree(root, files)
+        print(f"  生成测试目录用时 {time.perf_counter() - start:.1f}s")
+        counts = {}
+        def run_walker(): counts['walker'] = sum(1 for _ in node_packager.iter_package_files(project))
+        def run_legacy(): counts['legacy'] = _legacy_node_walk(project)
+        walker = _timed_runs(run_walker, iterations); _print_timing("scandir 剪枝遍历", walker)
+        legacy = _timed_runs(run_legacy, 1); _print_timing("rglob 后过滤 (旧)", legacy)
+        print(f"  选中文件: 新 {counts['walker']} / 旧 {counts['legacy']} (旧实现不识别 .gitignore 中的 .next/ coverage/)")
+        print(f"  加速约 {statistics.mean(legacy) / statistics.mean(walker):.0f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def _make_asset_tree(root, files):
+    """
+    Source-like text files plus ~10% incompressible assets (as .png/.woff2), and
+    (where supported) a symlinked directory and a dangling link, which the walk must skip.
+    """
+    project = os.path.join(root, 'project'); text = "".join(f"export const value{i} = compute({i}, 'item');\n" for i in range(400))
+    for i in range(files):
+        directory = os.path.join(project, f"d{i // 100}"); utils.ensure_dir_exists(directory)
+        if i % 10 == 0:
+            with open(os.path.join(directory, f"a{i}{'.png' if i % 20 else '.woff2'}"), 'wb') as f: f.write(os.urandom(64 * 1024))
+        else:
+            with open(os.path.join(directory, f"f{i}.js"), 'w') as f: f.write(text)
+    try:
+        os.symlink(os.path.join(project, 'd0'), os.path.join(project, 'linked_dir'), target_is_directory=True)
+        os.symlink(os.path.join(project, 'missing'), os.path.join(project, 'dangling_link'))
+    except (OSError, NotImplementedError): pass # No symlink privilege (Windows)
+    return project
+
+def bench_archive_formats(files=3000, iterations=3):
+    """Builds the same archive with zipfile (old) and archive_engine per format and worker count."""
+    files = int(files); iterations = int(iterations)
+    print(f"\n--- 基准测试: 归档引擎 ({files} 个文件, 每种 {iterations} 次, CPU {archive_engine.get_default_workers()} 核) ---")
+    root = tempfile.mkdtemp(prefix='env_assist_bench_')
+    try:
+        project = _make_asset_tree(root, files)
+        entries = [(rel, entry.path) for rel, entry in node_packager.iter_package_files(project)]
+        output = os.path.join(root, 'out')
+        def run_zipfile():
+            with zipfile.ZipFile(output + '.zip', 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for rel, path in entries: zipf.write(path, arcname=rel)
+        _print_timing("zipfile ZIP_DEFLATED (旧)", _timed_runs(run_zipfile, iterations))
+        print(f"    大小 {os.path.getsize(output + '.zip') / 1024 / 1024:.1f}MB")
+        worker_counts = sorted({1, archive_engine.get_default_workers()})
+        for fmt in archive_engine.available_formats():
+            for workers in worker_counts:
+                sizes = {}
+                def run_engine(): sizes['out'] = archive_engine.create_archive(output + archive_engine.FORMATS[fmt], entries, fmt, max_workers=workers)['bytes_out']
+                _print_timing(f"{fmt} ({workers} 线程)", _timed_runs(run_engine, iterations))
+                print(f"    大小 {sizes['out'] / 1024 / 1024:.1f}MB")
+        manifest_path = os.path.join(root, 'manifest.json')
+        archive_engine.create_archive(output + '.zip', entries, 'zip', manifest_path=manifest_path)
+        def run_incremental(): archive_engine.create_archive(output + '.zip', entries, 'zip', manifest_path=manifest_path)
+        _print_timing("zip 增量 (无变化, 复用)", _timed_runs(run_incremental, iterations))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+def bench_solver_backends(iterations=1, packages='python', extra='pip'):
+    """Runs identical create/install operations on every available solver backend."""
+    iterations = int(iterations); packages = packages.split(','); extra = extra.split(',')
+    print(f"\n--- 基准测试: 求解后端 (本地文件通道, 每种 {iterations} 次) ---")
+    backends = conda_backend.detect_backends(refresh=True)
+    if not backends: print("  未找到 conda/mamba/micromamba。"); return
+    root = tempfile.mkdtemp(prefix='env_assist_bench_')
+    try:
+        channel_dir = os.path.join(root, 'channel')
+        count, _ = local_mirror.build_conda_channel(channel_dir, local_mirror.collect_cache_packages())
+        if not count: print("  包缓存为空，无法构建本地通道。"); return
+        channel = Path(channel_dir).as_uri()
+        print(f"  本地通道: {channel}  可用后端: {', '.join(backends)}")
+        channel_args = ['--override-channels', '-c', channel, '--offline', '-y', '-q']
+        for backend in conda_backend.BACKENDS:
+            if backend not in backends: continue
+            prefix = os.path.join(root, f'env_{backend}')
+            def create(): subprocess.run(conda_backend.build_command(['create', '-p', prefix] + packages + channel_args, backend),
+                                         check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            def install(): subprocess.run(conda_backend.build_command(['install', '-p', prefix] + extra + channel_args, backend),
+                                          check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            create_times, install_times = [], []
+            try:
+                for _ in range(iterations):
+                    shutil.rmtree(prefix, ignore_errors=True)
+                    create_times += _timed_runs(create, 1); install_times += _timed_runs(install, 1)
+            except subprocess.CalledProcessError as e: print(f"  {backend}: 执行失败 (返回码 {e.returncode})，跳过。"); continue
+            finally: shutil.rmtree(prefix, ignore_errors=True)
+            _print_timing(f"{backend} 创建 ({' '.join(packages)})", create_times)
+            _print_timing(f"{backend} 安装 ({' '.join(extra)})", install_times)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        _unregister_prefixes(root)
+
+def _unregister_prefixes(root):
+    """Drops envs created under root from environments.txt (conda registers every prefix it creates)."""
+    env_txt = conda_manager.get_environments_txt_path()
+    try:
+        with open(env_txt, 'r', encoding='utf-8') as f: lines = f.read().splitlines()
+        kept = [line for line in lines if not line.strip().startswith(root)]
+        if len(kept) != len(lines):
+            with open(env_txt, 'w', encoding='utf-8') as f: f.write(''.join(line + '\n' for line in kept))
+    except OSError: pass
+
+BENCHMARKS = {
+    'env_exec': bench_env_execution,
+    'solver': bench_solver_backends,
+    'node_pack': bench_node_packaging,
+    'archive': bench_archive_formats,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("用法: python -m global_tools.benchmarks <名称> [参数...]")
+        for name, func in BENCHMARKS.items(): print(f"  {name:<12} {func.__doc__}")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,118 @@
+# global_tools/conda_backend.py
+# Which executable/solver runs env operations (create/install/remove/export):
+#   conda       plain `conda` with its configured solver
+#   libmamba    `conda ... --solver=libmamba` (needs conda-libmamba-solver in base)
+#   mamba       `mamba`, a drop-in replacement for the conda CLI (2.x spells a few flags like micromamba)
+#   micromamba  standalone `micromamba`, pointed at the conda root prefix
+# Selected by [Conda] SolverBackend = auto (default) / one of the above.
+import os
+import re
+import glob
+import shutil
+import subprocess
+from . import utils
+from . import conda_manager
+
+BACKENDS = ('conda', 'libmamba', 'mamba', 'micromamba')
+AUTO_ORDER = ('conda', 'mamba', 'micromamba') # Plain conda unless it is missing; faster backends are opt-in
+SOLVING_SUBCOMMANDS = {'create', 'install', 'update', 'remove', 'uninstall'}
+
+_detected = None # {backend: executable path} for available backends
+_mamba_major = None
+
+def _find_executable(name, env_var=None):
+    path = os.environ.get(env_var) if env_var else None
+    return path if path and os.path.isfile(path) else shutil.which(name)
+
+def _has_libmamba_solver(conda_exe):
+    """True if conda-libmamba-solver is installed in the conda root. SILENT."""
+    root = os.path.dirname(os.path.dirname(os.path.realpath(conda_exe)))
+    return bool(glob.glob(os.path.join(root, 'conda-meta', 'conda-libmamba-solver-*.json')))
+
+def detect_backends(refresh=False):
+    """Returns {backend: executable} for every backend usable on this machine. SILENT."""
+    global _detected
+    if _detected is not None and not refresh: return dict(_detected)
+    detected = {}
+    conda_exe = _find_executable('conda', 'CONDA_EXE')
+    if conda_exe:
+        detected['conda'] = conda_exe
+        if _has_libmamba_solver(conda_exe): detected['libmamba'] = conda_exe
+    mamba_exe = _find_executable('mamba')
+    if mamba_exe: detected['mamba'] = mamba_exe
+    micromamba_exe = _find_executable('micromamba', 'MAMBA_EXE')
+    if micromamba_exe and os.path.basename(micromamba_exe).lower().startswith('micromamba'): detected['micromamba'] = micromamba_exe
+    _detected = detected
+    return dict(detected)
+
+def get_mamba_major_version():
+    """Major version of the detected mamba (1 or 2), cached; 1 if unknown. SILENT."""
+    global _mamba_major
+    if _mamba_major is not None: return _mamba_major
+    _mamba_major = 1
+    mamba_exe = detect_backends().get('mamba')
+    if not mamba_exe: return _mamba_major
+    try: output = subprocess.run([mamba_exe, '--version'], capture_output=True, text=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError): return _mamba_major
+    match = re.search(r'(?:^|mamba\s+)(\d+)\.', output.strip()) # 1.x: "mamba 1.5.8\nconda ...", 2.x: "2.0.5"
+    if match: _mamba_major = int(match.group(1))
+    return _mamba_major
+
+def get_configured_backend():
+    """The raw [Conda] SolverBackend setting ('auto' or a backend name). SILENT."""
+    value = utils.get_config_value("Conda", "SolverBackend", "auto").strip().lower()
+    return value if value in BACKENDS else 'auto'
+
+def set_configured_backend(backend):
+    """Stores [Conda] SolverBackend."""
+    utils.set_config_value("Conda", "SolverBackend", backend)
+
+def get_backend():
+    """
+    The backend to use: the configured one if available, otherwise the first
+    available in AUTO_ORDER (conda when installed, so 'auto' keeps conda's behaviour).
+    Falls back to 'conda' (which then fails as before if missing). SILENT.
+    """
+    available = detect_backends(); configured = get_configured_backend()
+    if configured != 'auto' and configured in available: return configured
+    return next((b for b in AUTO_ORDER if b in available), 'conda')
+
+def _translate_for_micromamba(args):
+    """Maps conda CLI spellings to micromamba's (and mamba 2's) where they differ."""
+    return ['--no-build' if a == '--no-builds' else a for a in args]
+
+def build_command(args, backend=None):
+    """
+    Builds the command for conda-style args (e.g. ['create', '-n', 'x', 'python=3.10', '-y'])
+    on a backend (default: get_backend()). `--clone` always goes through conda,
+    since micromamba cannot clone envs.
+    """
+    backend = backend or get_backend(); available = detect_backends(); args = list(args)
+    if backend == 'micromamba' and '--clone' in args: backend = 'conda'
+    if backend == 'micromamba':
+        command = [available.get('micromamba', 'micromamba')] + _translate_for_micromamba(args)
+        root_prefix = conda_manager.get_conda_root()
+        return command + (['--root-prefix', root_prefix] if root_prefix else [])
+    if backend == 'mamba':
+        return [available.get('mamba', 'mamba')] + (_translate_for_micromamba(args) if get_mamba_major_version() >= 2 else args)
+    command = ['conda'] + args
+    if backend == 'libmamba' and args and args[0] in SOLVING_SUBCOMMANDS: command.append('--solver=libmamba')
+    return command
+
+def describe_backend(backend=None):
+    backend = backend or get_backend()
+    return {'conda': "conda (默认求解器)", 'libmamba': "conda + libmamba 求解器", 'mamba': "mamba", 'micromamba': "micromamba"}[backend]
+
+# --- Menu Action ---
+def configure_backend():
+    """Menu action: shows detected backends and stores the choice."""
+    global _mamba_major
+    available = detect_backends(refresh=True); _mamba_major = None
+    print(f"当前设置: {get_configured_backend()} (实际使用: {describe_backend()})")
+    print("检测到的后端: " + (', '.join(available) if available else "无"))
+    if len(available) <= 1: print("只有一个可用后端，无需选择。"); return
+    options = ['auto'] + [b for b in BACKENDS if b in available]
+    choice = utils.get_user_choice("请选择求解后端:", options, options.index(get_configured_backend()) if get_configured_backend() in options else 0)
+    if not choice: print("操作取消。"); return
+    set_configured_backend(choice)
+    print(f"求解后端已设置为: {choice} (实际使用: {describe_backend()})")
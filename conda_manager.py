@@ -2,47 +2,564 @@
 import os
 import re
 import json
+import time
+import hashlib
 import sys
 import subprocess # Need subprocess for terminal opening and install
 import traceback # Need traceback
 import platform # Need platform
 import shutil # Need shutil to find executables on Linux/macOS
+from concurrent.futures import ThreadPoolExecutor
 from . import utils
 from . import config as tool_config
+from . import package_index
+from . import disk_usage
+from . import conda_backend
+from . import local_mirror
 
 # Cached list of environments
 _env_list_cache = None
-def invalidate_env_cache(): global _env_list_cache; _env_list_cache = None
+_env_index_cache = None # List of env records (name, prefix, python, history_mtime; size once computed)
+_env_name_index = {} # Lowercased env name -> env record, for O(1) lookups
+def invalidate_env_cache(): global _env_list_cache; _env_list_cache = None; _set_env_index_cache(None)
 
-def list_conda_envs(use_cache=True):
-    """Lists Conda environments. SILENT. Uses cache."""
-    global _env_list_cache
-    if use_cache and _env_list_cache is not None: return _env_list_cache
-    envs = []
+def _set_env_index_cache(records):
+    """Stores the env records in memory and rebuilds the case-insensitive name index."""
+    global _env_index_cache, _env_name_index
+    _env_index_cache = records; _env_name_index = {}
+    for record in records or []: _env_name_index.setdefault(record['name'].lower(), record) # First match wins, like `conda activate`
+
+# --- Persistent Env Index ---
+# The index lives in the user's cache dir and is validated against the mtimes of
+# environments.txt, the .condarc files, every envs dir and every env's conda-meta/history
+# (plus the env vars that relocate envs), so a cold start can list envs without spawning
+# conda at all. Env sizes are filled in lazily by ensure_env_sizes (GC view only).
+ENV_INDEX_FILE_NAME = "env_index.json"
+ENV_INDEX_VERSION = 2
+_INDEX_ENV_VARS = ('CONDA_ENVS_PATH', 'CONDA_ENVS_DIRS', 'CONDARC')
+
+def get_conda_root():
+    """Best-effort lookup of the conda root prefix without running conda. SILENT."""
+    root = os.environ.get('CONDA_ROOT')
+    if root and os.path.isdir(os.path.join(root, 'conda-meta')): return os.path.normpath(root)
+    conda_exe = os.environ.get('CONDA_EXE') or shutil.which('conda')
+    if conda_exe:
+        # <root>/bin/conda, <root>/condabin/conda(.bat) or <root>/Scripts/conda.exe
+        candidate = os.path.dirname(os.path.dirname(os.path.realpath(conda_exe)))
+        if os.path.isdir(os.path.join(candidate, 'conda-meta')): return candidate
+    return None
+
+def get_environments_txt_path():
+    """Path of conda's user-level environment registry (~/.conda/environments.txt)."""
+    return os.path.join(os.path.expanduser('~'), '.conda', 'environments.txt')
+
+def get_default_envs_dirs(root_prefix=None):
+    """Conda's built-in envs_dirs defaults (root envs dir first, then ~/.conda/envs)."""
+    root_prefix = root_prefix or get_conda_root(); dirs = []
+    if root_prefix: dirs.append(os.path.join(root_prefix, 'envs'))
+    dirs.append(os.path.join(os.path.expanduser('~'), '.conda', 'envs'))
+    return dirs
+
+def get_env_python_version(prefix):
+    """Reads the Python version of an env from its conda-meta records. SILENT."""
+    try:
+        for entry in os.scandir(os.path.join(prefix, 'conda-meta')):
+            match = re.match(r'^python-(\d+(?:\.\d+)*)-[^-]+\.json$', entry.name)
+            if match: return match.group(1)
+    except OSError: pass
+    return None
+
+def get_dir_size(path, exclude_paths=()):
+    """Returns the on-disk size of a directory tree (hardlinks inside it counted once). SILENT."""
+    total = 0; seen_inodes = set(); stack = [path]; excluded = set(exclude_paths)
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.path not in excluded: stack.append(entry.path)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_nlink > 1:
+                            if (st.st_dev, st.st_ino) in seen_inodes: continue
+                            seen_inodes.add((st.st_dev, st.st_ino))
+                        total += st.st_size
+                    except OSError: continue
+        except OSError: continue
+    return total
+
+def _build_env_record(prefix, root_prefix, previous=None):
+    """Builds one env index record (no size walk), reusing python and any computed size from `previous` if the env is unchanged."""
+    history_mtime = utils.get_path_mtime(os.path.join(prefix, 'conda-meta', 'history'))
+    is_base = bool(root_prefix) and os.path.normcase(os.path.normpath(prefix)) == os.path.normcase(os.path.normpath(root_prefix))
+    record = {'name': 'base' if is_base else os.path.basename(prefix), 'prefix': prefix, 'is_base': is_base, 'history_mtime': history_mtime}
+    if previous and previous.get('history_mtime') == history_mtime:
+        record['python'] = previous.get('python')
+        if previous.get('size') is not None: record['size'] = previous['size']
+    else: record['python'] = get_env_python_version(prefix)
+    return record
+
+def ensure_env_sizes(records, max_workers=None):
+    """
+    Fills in 'size' (get_dir_size) for records that lack it, concurrently, and stores
+    the results in the on-disk index so unchanged envs are not walked again. SILENT.
+    """
+    missing = [r for r in records if r.get('size') is None]
+    if not missing: return records
+    def size_of(record):
+        exclude = [os.path.join(record['prefix'], 'pkgs'), os.path.join(record['prefix'], 'envs')] if record.get('is_base') else () # Not part of base itself
+        return get_dir_size(record['prefix'], exclude)
+    with ThreadPoolExecutor(max_workers=max_workers or min(8, len(missing))) as pool:
+        sizes = dict(zip((r['prefix'] for r in missing), pool.map(size_of, missing)))
+    for record in missing: record['size'] = sizes[record['prefix']]
+    data = utils.load_json_file(utils.get_cache_dir() / ENV_INDEX_FILE_NAME)
+    if isinstance(data, dict) and data.get('version') == ENV_INDEX_VERSION:
+        for record in data.get('envs') or []:
+            if record.get('prefix') in sizes: record['size'] = sizes[record['prefix']]
+        utils.save_json_file(utils.get_cache_dir() / ENV_INDEX_FILE_NAME, data)
+    for record in _env_index_cache or []:
+        if record['prefix'] in sizes: record['size'] = sizes[record['prefix']]
+    return records
+
+def _collect_watched_mtimes(records, envs_dirs):
+    """Collects the mtimes the index must be validated against (missing .condarc files as None, so creating one invalidates)."""
+    root_prefix = next((r['prefix'] for r in records if r.get('is_base')), None) or get_conda_root()
+    paths = [get_environments_txt_path()] + get_condarc_paths(root_prefix) + list(envs_dirs)
+    paths += [os.path.dirname(r['prefix']) for r in records if not r.get('is_base')] # Envs created outside envs_dirs
+    paths += [os.path.join(r['prefix'], 'conda-meta', 'history') for r in records]
+    return {path: utils.get_path_mtime(path) for path in dict.fromkeys(paths)}
+
+def _load_env_index():
+    """Loads the on-disk env index if it is still valid, else None. SILENT."""
+    data = utils.load_json_file(utils.get_cache_dir() / ENV_INDEX_FILE_NAME)
+    if not isinstance(data, dict) or data.get('version') != ENV_INDEX_VERSION: return None
+    watched = data.get('watched') or {}
+    if not watched or any(utils.get_path_mtime(path) != mtime for path, mtime in watched.items()): return None
+    if data.get('env_vars') != {name: os.environ.get(name) for name in _INDEX_ENV_VARS}: return None
+    return data.get('envs')
+
+def _save_env_index(records, envs_dirs):
+    """Writes the env index together with the mtimes used to validate it."""
+    data = {'version': ENV_INDEX_VERSION, 'envs_dirs': list(envs_dirs), 'env_vars': {name: os.environ.get(name) for name in _INDEX_ENV_VARS},
+            'watched': _collect_watched_mtimes(records, envs_dirs), 'envs': records}
+    utils.save_json_file(utils.get_cache_dir() / ENV_INDEX_FILE_NAME, data)
+
+def _query_conda_env_list():
+    """Runs `conda env list --json`. Returns (prefixes, root_prefix, envs_dirs) or None. SILENT."""
     try:
         result = utils.run_command(['conda', 'env', 'list', '--json'], capture_output=True, text=True, shell=False, verbose=False)
         if result.returncode == 0 and result.stdout:
             data = json.loads(result.stdout)
-            envs_paths = data.get('envs', [])
-            envs = [os.path.basename(p) for p in envs_paths if os.path.basename(p).lower() != 'base']
+            root_prefix = data.get('root_prefix') or get_conda_root()
+            envs_dirs = data.get('envs_dirs') or get_default_envs_dirs(root_prefix)
+            return data.get('envs', []), root_prefix, envs_dirs
         else: print("内部错误: 无法获取 Conda 环境列表 (JSON)。", file=sys.stderr)
     except json.JSONDecodeError as e: print(f"内部错误: 解析 Conda 环境列表 (JSON) 失败: {e}", file=sys.stderr)
     except FileNotFoundError: print("错误: 'conda' 命令未找到。", file=sys.stderr)
     except Exception as e: print(f"内部错误: 获取 Conda 环境列表时出错: {e}", file=sys.stderr)
+    return None
+
+# --- Native (subprocess-free) Env Discovery ---
+DISCOVERY_MODES = ('native', 'cli', 'compat')
+
+def get_discovery_mode():
+    """'native' (filesystem, default), 'cli' (`conda env list`) or 'compat' (both, results compared)."""
+    mode = utils.get_config_value("Conda", "DiscoveryMode", "native").strip().lower()
+    return mode if mode in DISCOVERY_MODES else 'native'
+
+def get_condarc_paths(root_prefix=None):
+    """Lists the .condarc files conda would read, in increasing priority."""
+    home = os.path.expanduser('~'); paths = []
+    if root_prefix: paths += [os.path.join(root_prefix, '.condarc'), os.path.join(root_prefix, 'condarc')]
+    paths += [os.path.join(home, '.config', 'conda', '.condarc'), os.path.join(home, '.conda', '.condarc'),
+              os.path.join(home, '.conda', 'condarc'), os.path.join(home, '.condarc')]
+    if os.environ.get('CONDARC'): paths.append(os.environ['CONDARC'])
+    return paths
+
+def read_condarc_list(condarc_path, key):
+    """Reads a top-level list key (block or inline style) from a .condarc without a YAML parser. SILENT."""
+    values = []; in_key = False
+    try:
+        with open(condarc_path, 'r', encoding='utf-8') as f: lines = f.read().splitlines()
+    except OSError: return values
+    for line in lines:
+        stripped = line.split(' #', 1)[0].rstrip()
+        if not stripped.strip() or stripped.lstrip().startswith('#'): continue
+        if not line[0].isspace() and not stripped.startswith('-'):
+            in_key = False
+            name, _, rest = stripped.partition(':')
+            if name.strip() == key:
+                rest = rest.strip()
+                if rest.startswith('['): values += [v.strip().strip('\'"') for v in rest.strip('[]').split(',') if v.strip()]
+                else: in_key = True
+        elif in_key and stripped.strip().startswith('-'):
+            values.append(stripped.strip()[1:].strip().strip('\'"'))
+    return values
+
+def get_envs_dirs(root_prefix=None):
+    """envs_dirs in conda's priority order: $CONDA_ENVS_PATH, .condarc entries, then defaults. SILENT."""
+    root_prefix = root_prefix or get_conda_root(); dirs = []
+    env_var = os.environ.get('CONDA_ENVS_PATH') or os.environ.get('CONDA_ENVS_DIRS')
+    if env_var: dirs += [d for d in env_var.split(os.pathsep) if d]
+    for condarc in reversed(get_condarc_paths(root_prefix)): dirs += read_condarc_list(condarc, 'envs_dirs')
+    dirs += get_default_envs_dirs(root_prefix)
+    normalized = [os.path.normpath(os.path.expandvars(os.path.expanduser(d))) for d in dirs]
+    return list(dict.fromkeys(normalized))
+
+def _is_conda_prefix(path):
+    """An env prefix is any directory holding a conda-meta/ marker directory."""
+    return os.path.isdir(os.path.join(path, 'conda-meta'))
+
+def discover_conda_envs():
+    """Finds env prefixes from the filesystem only. Returns (prefixes, root_prefix, envs_dirs) or None. SILENT."""
+    root_prefix = get_conda_root(); envs_dirs = get_envs_dirs(root_prefix); prefixes = []
+    if root_prefix and _is_conda_prefix(root_prefix): prefixes.append(root_prefix)
+    for envs_dir in envs_dirs:
+        try:
+            with os.scandir(envs_dir) as it:
+                prefixes += sorted(e.path for e in it if e.is_dir() and _is_conda_prefix(e.path))
+        except OSError: continue
+    try:
+        with open(get_environments_txt_path(), 'r', encoding='utf-8') as f:
+            prefixes += [line.strip() for line in f if line.strip() and _is_conda_prefix(line.strip())]
+    except OSError: pass
+    if not prefixes: return None # Nothing found: let the caller fall back to the CLI
+    seen = set(); unique = []
+    for prefix in prefixes:
+        key = os.path.normcase(os.path.normpath(prefix))
+        if key not in seen: seen.add(key); unique.append(os.path.normpath(prefix))
+    return unique, root_prefix, envs_dirs
+
+def verify_env_discovery():
+    """Compares native discovery against `conda env list`. Returns (only_native, only_cli) or None. SILENT."""
+    native, cli = discover_conda_envs(), _query_conda_env_list()
+    if cli is None: return None
+    key = lambda p: os.path.normcase(os.path.normpath(p))
+    native_set = {key(p) for p in (native[0] if native else [])}; cli_set = {key(p) for p in cli[0]}
+    return sorted(native_set - cli_set), sorted(cli_set - native_set)
+
+def refresh_env_index():
+    """Rebuilds the env index (native discovery, CLI as fallback) and persists it. SILENT."""
+    mode = get_discovery_mode()
+    queried = discover_conda_envs() if mode != 'cli' else None
+    if mode == 'compat' or queried is None:
+        cli_queried = _query_conda_env_list()
+        if mode == 'compat' and queried and cli_queried:
+            key = lambda p: os.path.normcase(os.path.normpath(p))
+            mismatched = {key(p) for p in queried[0]} ^ {key(p) for p in cli_queried[0]}
+            if mismatched: print(f"警告: 原生环境发现与 conda CLI 结果不一致: {', '.join(sorted(mismatched))}", file=sys.stderr)
+        queried = cli_queried or queried
+    if queried is None: _set_env_index_cache([]); return []
+    prefixes, root_prefix, envs_dirs = queried
+    stale = utils.load_json_file(utils.get_cache_dir() / ENV_INDEX_FILE_NAME) or {}
+    previous = {r.get('prefix'): r for r in stale.get('envs') or [] if isinstance(r, dict)}
+    # Only cheap per-env reads here; sizes are computed on demand by ensure_env_sizes
+    with ThreadPoolExecutor(max_workers=min(8, len(prefixes) or 1)) as pool:
+        records = list(pool.map(lambda p: _build_env_record(p, root_prefix, previous.get(p)), prefixes))
+    _save_env_index(records, envs_dirs)
+    _set_env_index_cache(records)
+    return records
+
+def get_env_index(use_cache=True):
+    """Returns env records, from memory, the validated on-disk index, or a fresh discovery (in that order). SILENT."""
+    if use_cache and _env_index_cache is not None: return _env_index_cache
+    records = _load_env_index()
+    if records is None: return refresh_env_index()
+    _set_env_index_cache(records)
+    return records
+
+def get_env_record(env_name, use_cache=True):
+    """Returns the index record of an env (case-insensitive), or None. SILENT."""
+    if not env_name: return None
+    get_env_index(use_cache=use_cache)
+    return _env_name_index.get(env_name.lower())
+
+def get_env_prefix(env_name, use_cache=True):
+    """Returns the prefix path of an env (case-insensitive), or None. SILENT."""
+    record = get_env_record(env_name, use_cache=use_cache)
+    return record['prefix'] if record else None
+
+def list_conda_envs(use_cache=True):
+    """Lists Conda environments (excluding base and pool templates). SILENT. Uses cache."""
+    global _env_list_cache
+    if use_cache and _env_list_cache is not None: return _env_list_cache
+    envs = [r['name'] for r in get_env_index(use_cache=use_cache) if not r.get('is_base') and not is_pool_env(r['name'])]
     _env_list_cache = envs
     return envs
 
-def find_env_by_name(env_name, use_cache=True):
-    """Finds env by name (case-insensitive). SILENT. Uses cache."""
-    if not env_name: return None
-    envs = list_conda_envs(use_cache=use_cache); env_name_lower = env_name.lower()
-    for existing_env in envs:
-        if existing_env.lower() == env_name_lower: return existing_env
+def find_env_by_name(env_name, use_cache=True, include_base=False):
+    """Finds env by name (case-insensitive); base only if include_base. SILENT. Uses cache."""
+    record = get_env_record(env_name, use_cache=use_cache)
+    if not record or (record.get('is_base') and not include_base): return None
+    return record['name']
+
+def env_exists(env_name, use_cache=True, include_base=False):
+    """Checks if env exists (case-insensitive); base only if include_base. SILENT. Uses cache."""
+    return find_env_by_name(env_name, use_cache=use_cache, include_base=include_base) is not None
+
+# --- Explicit Specs (solver-free creation) ---
+_SUBDIR_MACHINES = {'x86_64': '64', 'amd64': '64', 'aarch64': 'aarch64', 'arm64': 'arm64', 'ppc64le': 'ppc64le', 's390x': 's390x'}
+
+def get_current_conda_subdir():
+    """The conda platform subdir of this machine, e.g. 'linux-64', 'osx-arm64', 'win-64'."""
+    system = {'Linux': 'linux', 'Darwin': 'osx', 'Windows': 'win'}.get(platform.system(), platform.system().lower())
+    machine = platform.machine().lower()
+    if system == 'linux' and machine == 'arm64': machine = 'aarch64'
+    return f"{system}-{_SUBDIR_MACHINES.get(machine, machine)}"
+
+def _read_explicit_record(json_path):
+    """Reads name/depends/url/md5 from one conda-meta record. SILENT."""
+    data = utils.load_json_file(json_path)
+    if not isinstance(data, dict) or 'name' not in data: return None
+    url = data.get('url')
+    if not url and data.get('channel') and data.get('fn'): # Older records only store the channel
+        url = f"{data['channel'].rstrip('/')}/{data.get('subdir', 'noarch')}/{data['fn']}"
+    return {'name': data['name'], 'url': url, 'md5': data.get('md5'), 'subdir': data.get('subdir', ''),
+            'depends': [d.split()[0] for d in data.get('depends', []) if d]}
+
+def get_explicit_specs(prefix):
+    """
+    Reads an env's conda packages from conda-meta as explicit `url#md5` specs in
+    dependency order (like `conda list --explicit --md5`), without running conda.
+    Returns (specs, subdir) or (None, None) if a package lacks a URL.
+    """
+    files = [os.path.join(prefix, 'conda-meta', n) for n in os.listdir(os.path.join(prefix, 'conda-meta')) if n.endswith('.json')]
+    with ThreadPoolExecutor(max_workers=8) as pool: records = [r for r in pool.map(_read_explicit_record, files) if r]
+    if any(not r['url'] for r in records): return None, None
+    by_name = {r['name']: r for r in records}; ordered = []; visited = set()
+    def visit(name, trail):
+        if name in visited or name in trail or name not in by_name: return
+        trail.add(name)
+        for dep in sorted(by_name[name]['depends']): visit(dep, trail)
+        visited.add(name); ordered.append(by_name[name])
+    for name in sorted(by_name): visit(name, set())
+    subdir = next((r['subdir'] for r in records if r['subdir'] and r['subdir'] != 'noarch'), get_current_conda_subdir())
+    return [f"{r['url']}#{r['md5']}" if r['md5'] else r['url'] for r in ordered], subdir
+
+def write_explicit_file(path, specs, subdir, header_lines=()):
+    """Writes an @EXPLICIT spec file accepted by `conda create --file`."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# Generated by environment auxiliary tool\n")
+        for header in header_lines: f.write(f"# {header}\n")
+        f.write(f"# platform: {subdir}\n@EXPLICIT\n")
+        f.write("\n".join(specs)); f.write("\n")
+
+def read_explicit_file_platform(path):
+    """Returns the '# platform:' recorded in an explicit file, or None. SILENT."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('# platform:'): return line.split(':', 1)[1].strip()
+                if line.startswith('@EXPLICIT'): break
+    except OSError: pass
     return None
 
-def env_exists(env_name, use_cache=True):
-    """Checks if env exists (case-insensitive). SILENT. Uses cache."""
-    return find_env_by_name(env_name, use_cache=use_cache) is not None
+def create_env_from_explicit(env_name, explicit_path, verbose=True):
+    """Creates an env from an @EXPLICIT file (no solver run). Returns True on success."""
+    platform_tag = read_explicit_file_platform(explicit_path)
+    if platform_tag and platform_tag != get_current_conda_subdir():
+        print(f"错误: '{os.path.basename(explicit_path)}' 适用于 {platform_tag}，当前平台为 {get_current_conda_subdir()}。", file=sys.stderr)
+        return False
+    command = conda_backend.build_command(['create', '-n', env_name, '--file', explicit_path, '-y'])
+    try: utils.run_command(command, check=True, verbose=verbose, capture_output=False, shell=False, stream=True)
+    except subprocess.CalledProcessError as e: print(f"从显式清单创建环境失败 (返回码: {e.returncode})。", file=sys.stderr); return False
+    except Exception as e: print(f"从显式清单创建环境时发生异常: {e}", file=sys.stderr); return False
+    invalidate_env_cache()
+    return True
+
+# --- Explicit Spec Snapshots ---
+# After a spec (packages + channels) is solved once, the resulting explicit list is
+# stored under its hash; later creations of the same spec replay it without solving.
+SNAPSHOT_DIR_NAME = "env_snapshots"
+
+def snapshots_enabled():
+    """[Conda] Snapshots = on (default) / off."""
+    return utils.get_config_value("Conda", "Snapshots", "on").strip().lower() not in ('off', 'false', '0', 'no')
+
+def get_snapshot_max_age_days():
+    """[Conda] SnapshotMaxAgeDays: older snapshots are re-solved so envs pick up new builds (default 30, 0 = never expire)."""
+    try: return max(0, int(utils.get_config_value("Conda", "SnapshotMaxAgeDays", "30")))
+    except ValueError: return 30
+
+def get_spec_hash(packages, channels=()):
+    """Stable hash of a creation spec: sorted package specs, channel order, local mirror args and platform."""
+    spec = {'packages': sorted(p.strip().lower().replace(' ', '') for p in packages), 'channels': list(channels),
+            'mirror': local_mirror.get_conda_channel_args(), 'subdir': get_current_conda_subdir()}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()[:24]
+
+def get_snapshot_path(packages, channels=()):
+    snapshot_dir = utils.get_cache_dir() / SNAPSHOT_DIR_NAME
+    utils.ensure_dir_exists(snapshot_dir)
+    return snapshot_dir / f"{get_spec_hash(packages, channels)}.txt"
+
+def find_snapshot(packages, channels=()):
+    """Returns the snapshot file for a spec if one exists and has not expired. SILENT."""
+    path = get_snapshot_path(packages, channels); mtime = utils.get_path_mtime(path)
+    if mtime is None: return None
+    max_age = get_snapshot_max_age_days()
+    if max_age and time.time() - mtime / 1e9 > max_age * 86400: return None
+    return path
+
+def record_snapshot(prefix, packages, channels=()):
+    """Stores the explicit list of a freshly solved env for its spec. Returns the snapshot path or None."""
+    specs, subdir = get_explicit_specs(prefix)
+    if not specs: return None
+    path = get_snapshot_path(packages, channels)
+    write_explicit_file(path, specs, subdir, [f"Spec: {' '.join(packages)}" + (f" (channels: {', '.join(channels)})" if channels else ''),
+                                             f"Recorded: {time.strftime('%Y-%m-%d %H:%M:%S')}"])
+    return path
+
+def _create_env_unpooled(env_name, packages, channels=()):
+    """Creates an env from a recorded snapshot (no solve) or by solving and recording one. Returns True on success."""
+    if snapshots_enabled():
+        snapshot = find_snapshot(packages, channels)
+        if snapshot:
+            print(f"找到相同配置的环境快照，跳过求解直接创建 '{env_name}'...")
+            if create_env_from_explicit(env_name, str(snapshot)): return True
+            print("快照回放失败，改为常规创建。", file=sys.stderr)
+            if find_env_by_name(env_name, use_cache=False): remove_env_quietly(env_name) # Remove a half-created env before retrying
+    args = ['create', '-n', env_name] + list(packages) + local_mirror.get_conda_channel_args() # Local channel first
+    for channel in channels: args += ['-c', channel]
+    utils.run_command(conda_backend.build_command(args + ['-y']), check=True, verbose=True, capture_output=False, shell=False, stream=True)
+    invalidate_env_cache()
+    prefix = get_env_prefix(env_name, use_cache=False)
+    if not prefix: print(f"错误: 创建后未找到环境 '{env_name}'。", file=sys.stderr); return False
+    if snapshots_enabled() and record_snapshot(prefix, packages, channels): print("已记录环境快照，下次创建相同配置时将跳过求解。")
+    return True
+
+def create_env_from_spec(env_name, packages, channels=()):
+    """
+    Creates an env for a package spec. A warm pool template of the same spec is
+    hardlink-cloned; otherwise a recorded snapshot is replayed with
+    `conda create --file` (no solve), or conda solves it and the result is
+    recorded. A spec is added to the pool from its second creation on, so one-off
+    envs don't pay for a template clone. Returns True only if the env exists afterwards.
+    """
+    if pool_enabled():
+        template = get_pool_template(packages, channels)
+        if template:
+            print(f"从环境池模板 '{template}' 克隆 '{env_name}' (硬链接，无需求解/下载)...")
+            if clone_env(template, env_name):
+                _touch_pool_entry(get_spec_hash(packages, channels)); return True
+            print("模板克隆失败，改为常规创建。", file=sys.stderr)
+            if find_env_by_name(env_name, use_cache=False): remove_env_quietly(env_name)
+    if not _create_env_unpooled(env_name, packages, channels): return False
+    if pool_enabled() and _record_spec_demand(get_spec_hash(packages, channels)) >= POOL_MIN_DEMAND:
+        print("该配置已多次创建，正在将其加入环境池以加速后续创建...")
+        add_pool_template(env_name, packages, channels)
+    return True
+
+def remove_env_quietly(env_name):
+    """Removes an env without prompting. Returns True on success."""
+    result = utils.run_command(conda_backend.build_command(['env', 'remove', '-n', env_name, '-y']), verbose=False, shell=False)
+    invalidate_env_cache()
+    return result.returncode == 0
+
+def clone_env(source_env, env_name):
+    """`conda create --clone` from local files only; conda hardlinks from the package cache. Returns True on success."""
+    command = conda_backend.build_command(['create', '-n', env_name, '--clone', source_env, '--offline', '-y'])
+    try: result = utils.run_command(command, verbose=False, capture_output=True, shell=False)
+    except Exception as e: print(f"克隆环境时发生异常: {e}", file=sys.stderr); return False
+    invalidate_env_cache()
+    return result.returncode == 0
+
+# --- Warm Env Pool ---
+# Template envs (one per creation spec, e.g. python=3.10 or nodejs+pnpm) kept under
+# hidden names; new envs of the same spec are cloned from them. Templates are
+# refilled from freshly created envs once a spec has been created POOL_MIN_DEMAND
+# times, and evicted by count (LRU) and age.
+POOL_ENV_PREFIX = "_env_assist_pool_"
+POOL_STATE_FILE_NAME = "env_pool.json"
+POOL_DEMAND_FILE_NAME = "env_pool_demand.json"
+POOL_MIN_DEMAND = 2
+
+def pool_enabled():
+    """[Pool] Enabled = on (default) / off."""
+    return utils.get_config_value("Pool", "Enabled", "on").strip().lower() not in ('off', 'false', '0', 'no')
+
+def _get_pool_int(key, default):
+    try: return max(0, int(utils.get_config_value("Pool", key, str(default))))
+    except ValueError: return default
+
+def is_pool_env(env_name):
+    return bool(env_name) and env_name.lower().startswith(POOL_ENV_PREFIX)
+
+def _load_pool_state():
+    data = utils.load_json_file(utils.get_cache_dir() / POOL_STATE_FILE_NAME)
+    return data if isinstance(data, dict) else {}
+
+def _save_pool_state(state):
+    utils.save_json_file(utils.get_cache_dir() / POOL_STATE_FILE_NAME, state)
+
+def _record_spec_demand(spec_hash):
+    """Counts one unpooled creation of a spec and returns its total; entries unseen for MaxAgeDays are dropped. SILENT."""
+    path = utils.get_cache_dir() / POOL_DEMAND_FILE_NAME; now = time.time()
+    data = utils.load_json_file(path); data = data if isinstance(data, dict) else {}
+    max_age = _get_pool_int("MaxAgeDays", 30)
+    if max_age: data = {k: v for k, v in data.items() if isinstance(v, dict) and now - v.get('last_seen', 0) <= max_age * 86400}
+    entry = data.setdefault(spec_hash, {'count': 0}); entry['count'] = entry.get('count', 0) + 1; entry['last_seen'] = now
+    utils.save_json_file(path, data)
+    return entry['count']
+
+def _touch_pool_entry(spec_hash):
+    state = _load_pool_state()
+    if spec_hash in state:
+        state[spec_hash]['last_used'] = time.time(); state[spec_hash]['uses'] = state[spec_hash].get('uses', 0) + 1
+        _save_pool_state(state)
+
+def _register_pool_template(spec_hash, template, packages, channels):
+    state = _load_pool_state(); now = time.time()
+    state[spec_hash] = {'env': template, 'packages': list(packages), 'channels': list(channels), 'created': now, 'last_used': now, 'uses': 0}
+    _save_pool_state(state)
+
+def get_pool_template(packages, channels=()):
+    """Returns the template env for a spec if it exists and is younger than [Pool] MaxAgeDays. SILENT."""
+    entry = _load_pool_state().get(get_spec_hash(packages, channels))
+    if not entry or not find_env_by_name(entry['env'], use_cache=False): return None
+    max_age = _get_pool_int("MaxAgeDays", 30)
+    if max_age and time.time() - entry.get('created', 0) > max_age * 86400: return None
+    return entry['env']
+
+def add_pool_template(source_env, packages, channels=()):
+    """Refills the pool: clones a freshly created env into the template for its spec, then evicts. SILENT on success."""
+    spec_hash = get_spec_hash(packages, channels); template = f"{POOL_ENV_PREFIX}{spec_hash[:12]}"
+    if find_env_by_name(template, use_cache=False): remove_env_quietly(template) # Stale template of the same spec
+    if not clone_env(source_env, template): print("警告: 无法将新环境加入环境池。", file=sys.stderr); return None
+    _register_pool_template(spec_hash, template, packages, channels); evict_pool_templates()
+    return template
+
+def evict_pool_templates():
+    """Drops templates that are missing, older than MaxAgeDays, or beyond MaxTemplates (least recently used first). Returns removed spec hashes."""
+    state = _load_pool_state(); removed = []; kept = 0; now = time.time()
+    max_age = _get_pool_int("MaxAgeDays", 30); max_templates = _get_pool_int("MaxTemplates", 4)
+    for spec_hash, entry in sorted(state.items(), key=lambda item: item[1].get('last_used', 0), reverse=True):
+        exists = find_env_by_name(entry['env'], use_cache=False) is not None
+        if exists and not (max_age and now - entry.get('created', 0) > max_age * 86400) and kept < max_templates: kept += 1; continue
+        if exists: remove_env_quietly(entry['env'])
+        removed.append(spec_hash)
+    for spec_hash in removed: del state[spec_hash]
+    if removed: _save_pool_state(state)
+    return removed
+
+def get_pool_specs():
+    """The specs kept warm by default: the default Python version and the Node.js stack."""
+    return [([f"python={tool_config.get_default_python_version()}"], []), (['nodejs', 'pnpm'], ['conda-forge'])]
+
+def warm_env_pool():
+    """Builds missing templates for get_pool_specs() and evicts stale ones."""
+    for packages, channels in get_pool_specs():
+        label = ' '.join(packages)
+        if get_pool_template(packages, channels): print(f"  [已就绪] {label}"); continue
+        spec_hash = get_spec_hash(packages, channels); template = f"{POOL_ENV_PREFIX}{spec_hash[:12]}"
+        print(f"  [创建中] {label} -> {template}")
+        try:
+            if find_env_by_name(template, use_cache=False): remove_env_quietly(template)
+            if not _create_env_unpooled(template, packages, channels): print("  创建模板失败。", file=sys.stderr); continue
+        except Exception as e: print(f"  创建模板失败: {e}", file=sys.stderr); continue
+        _register_pool_template(spec_hash, template, packages, channels)
+    removed = evict_pool_templates()
+    if removed: print(f"已清理 {len(removed)} 个过期/超额的模板。")
 
 def open_env_terminal(env_name):
     """Attempts to open a new terminal with the specified Conda environment activated."""
@@ -88,16 +605,14 @@ def create_conda_env(project_root):
     py_version = utils.get_user_input(f"请输入 Python 版本", default=default_py_version)
     if not py_version: print("需要 Python 版本。"); return None
     print(f"正在创建环境 '{env_name_input}' (Python {py_version})...")
-    command = ['conda', 'create', '-n', env_name_input, f'python={py_version}', '-y']
     created_env_name = None
     try:
-        result = utils.run_command(command, check=True, verbose=True, capture_output=False, shell=False)
-        if result.returncode == 0:
+        if create_env_from_spec(env_name_input, [f'python={py_version}']):
             print(f"环境 '{env_name_input}' 创建命令已成功执行。")
             invalidate_env_cache(); created_env_name = find_env_by_name(env_name_input, use_cache=False) or env_name_input
             print(f"环境 '{created_env_name}' 已确认创建。")
             return created_env_name
-        # else case handled by check=True raising an error
+        print(f"创建环境 '{env_name_input}' 失败。", file=sys.stderr); return None
     except subprocess.CalledProcessError as e: print(f"创建环境 '{env_name_input}' 失败 (返回码: {e.returncode})。", file=sys.stderr); return None
     except Exception as e: print(f"创建环境时发生异常: {e}", file=sys.stderr); return None
 
@@ -109,12 +624,17 @@ def delete_conda_env(project_root):
     default_env_name_lower = utils.get_default_env_name(project_root).lower()
     for i, env in enumerate(envs):
         if env.lower() == default_env_name_lower: default_selection_index = i; break
-    selected_env = utils.get_user_choice("请选择要删除的环境:", envs, default_selection_index)
-    if not selected_env: print("未选择环境。"); return
+    print("正在统计各环境磁盘占用...")
+    try: size_labels = disk_usage.get_env_size_labels(envs)
+    except Exception as e: print(f"警告: 无法统计磁盘占用: {e}", file=sys.stderr); size_labels = {}
+    labels = [f"{env} ({size_labels[env]})" if env in size_labels else env for env in envs]
+    selected_label = utils.get_user_choice("请选择要删除的环境:", labels, default_selection_index)
+    if not selected_label: print("未选择环境。"); return
+    selected_env = envs[labels.index(selected_label)]
     confirm = utils.get_user_choice(f"警告：确定要永久删除 '{selected_env}'?", ["否", "是"], 0)
     if confirm == "是":
         print(f"正在删除环境 '{selected_env}'...")
-        command = ['conda', 'env', 'remove', '-n', selected_env, '-y']
+        command = conda_backend.build_command(['env', 'remove', '-n', selected_env, '-y'])
         try:
             result = utils.run_command(command, check=True, verbose=True, capture_output=False, shell=False)
             if result.returncode == 0: print(f"环境 '{selected_env}' 删除命令已成功执行。"); invalidate_env_cache()
@@ -138,7 +658,7 @@ def clone_current_env(project_root):
     output_dir = os.path.join(project_root, '.env'); output_file = os.path.join(output_dir, f"{actual_env}_environment.yml")
     utils.ensure_dir_exists(output_dir)
     print(f"正在导出 '{actual_env}' 配置到 '{os.path.relpath(output_file, project_root)}'...")
-    command = ['conda', 'env', 'export', '-n', actual_env, '--no-builds']
+    command = conda_backend.build_command(['env', 'export', '-n', actual_env, '--no-builds'])
     try:
         result = utils.run_command(command, capture_output=True, text=True, check=True, verbose=False)
         if result.stdout:
@@ -172,10 +692,21 @@ def install_packages_to_env(project_root, current_env_name_cased):
     packages_input = utils.get_user_input(f"请输入要安装的库 (空格分隔, 可带版本/通道):")
     if not packages_input: print("未输入库名称，操作取消。"); return
     packages_list = packages_input.split()
-    command = ['conda', 'install', '-n', env_to_install_in] + packages_list + ['-y']
+    prefix = get_env_prefix(env_to_install_in)
+    if prefix and not any(p.startswith('-') for p in packages_list): # Options like -c make the offline check unreliable
+        index = package_index.get_package_index(prefix); pending = []
+        print("\n检查已安装的库:")
+        for spec in packages_list:
+            parsed = package_index.parse_conda_spec(spec)
+            status, installed = package_index.check_requirement(index, *parsed) if parsed else (package_index.STATUS_MISSING, None)
+            package_index.print_requirement_report([{'line': spec, 'status': status, 'installed': installed}])
+            if status != package_index.STATUS_INSTALLED: pending.append(spec)
+        if not pending: print(f"\n所有库均已安装在环境 '{env_to_install_in}' 中，无需安装。"); return
+        packages_list = pending; packages_input = ' '.join(pending)
+    command = conda_backend.build_command(['install', '-n', env_to_install_in] + local_mirror.get_conda_channel_args() + packages_list + ['-y'])
     print(f"\n将在环境 '{env_to_install_in}' 中尝试安装: {packages_input}...")
     try:
-        utils.run_command(command, check=True, verbose=True, capture_output=False, shell=False)
+        utils.run_command(command, check=True, verbose=True, capture_output=False, shell=False, stream=True)
         print(f"\n库安装命令已成功执行到环境 '{env_to_install_in}'。")
     except FileNotFoundError: print(f"错误: 'conda' 命令未找到。", file=sys.stderr)
     except subprocess.CalledProcessError as e:
@@ -1,5 +1,6 @@
 # global_tools/config.py
 from . import utils
+from . import conda_backend
 
 # Default values - can be overridden by user config file
 DEFAULT_PYTHON_VERSION = "3.10"
@@ -36,4 +37,5 @@ def configure_defaults():
     if new_proxy != current_proxy:
         set_default_git_proxy(new_proxy)
 
+    conda_backend.configure_backend()
     print("默认设置已更新。")
\ No newline at end of file
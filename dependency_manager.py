@@ -3,8 +3,29 @@ import os
 import sys
 import toml
 import re # Ensure re is imported
+import json
+import time
+import hashlib
+import traceback
+import subprocess
 from . import utils
 from . import config as tool_config # Import the config module
+from . import env_runner
+from . import conda_manager
+from . import package_index
+from . import import_scanner
+from . import requirements_parser
+from . import local_mirror
+
+def write_requirements_file(req_path, req_lines, header_lines=()):
+    """Writes requirements.txt with the tool's standard header comment."""
+    with open(req_path, 'w', encoding='utf-8') as f:
+        f.write("# Generated by environment auxiliary tool\n")
+        for header in header_lines: f.write(f"# {header}\n")
+        f.write("\n")
+        f.write("\n".join(req_lines))
+        f.write("\n") # Add trailing newline
+
 
 def convert_pyproject_to_req(project_root):
     """Converts pyproject.toml [tool.poetry.dependencies] or [project.dependencies] to requirements.txt."""
@@ -31,16 +52,11 @@ def convert_pyproject_to_req(project_root):
              # PEP 621 dependencies are often a list, need conversion
              dep_list = data['project']['dependencies']
              if isinstance(dep_list, list):
-                  # Basic conversion from list to dict for compatibility with existing logic
-                  # This assumes simple "package" or "package>=version" strings
+                  # PEP 508 strings are kept verbatim (extras, markers and URLs survive the round trip)
                   for item in dep_list:
-                      match = re.match(r'^([a-zA-Z0-9._-]+)\s*([~<>=!]=?.*)?$', item)
-                      if match:
-                          name = match.group(1)
-                          version_spec = match.group(2).strip() if match.group(2) else "*"
-                          dependencies[name] = version_spec
-                      else:
-                          print(f"警告: 无法解析 PEP621 依赖项 '{item}'，已跳过。", file=sys.stderr)
+                      record = requirements_parser.parse_requirement_string(str(item))
+                      if record and record.name: dependencies[record.name] = record
+                      else: print(f"警告: 无法解析 PEP621 依赖项 '{item}'，已跳过。", file=sys.stderr)
                   source_section = "[project.dependencies]"
              elif isinstance(dep_list, dict): # Also check if it's already a dict (less common for PEP621)
                   dependencies = dep_list
@@ -55,20 +71,10 @@ def convert_pyproject_to_req(project_root):
         for name, version_spec in dependencies.items():
             if name.lower() == 'python': continue # Skip python constraint
 
-            if isinstance(version_spec, str):
-                if version_spec == "*": req_lines.append(name)
-                else:
-                    # Attempt to map simple specifiers - THIS IS HIGHLY SIMPLISTIC
-                    # For robust conversion, external tools are better.
-                    spec = str(version_spec).replace('^', '>=').replace('~', '~=')
-                    # Crude check for common poetry/pep508 extras format
-                    if '[' in name and ']' in name: # e.g., requests[security]
-                         req_lines.append(f"{name}{spec}") # Pip understands this
-                    else:
-                         req_lines.append(f"{name}{spec}") # Simple name+spec
-
-            elif isinstance(version_spec, dict):
-                 # Handle complex cases like { version = "^1.0", optional = true } or git/path deps
+            if isinstance(version_spec, requirements_parser.Requirement): req_lines.append(version_spec.line); continue
+            line = poetry_dependency_to_requirement(name, version_spec)
+            if line: req_lines.append(line)
+            else:
                  print(f"警告: 依赖项 '{name}' 具有复杂定义，无法自动转换为 requirements.txt: {version_spec}", file=sys.stderr)
                  print("建议使用 'poetry export > requirements.txt' (如果使用Poetry) 或手动检查。")
 
@@ -79,12 +85,8 @@ def convert_pyproject_to_req(project_root):
                 print("操作取消。")
                 return
 
-        with open(req_path, 'w', encoding='utf-8') as f:
-            f.write("# Generated by environment auxiliary tool\n")
-            f.write(f"# Source: {os.path.basename(pyproject_path)} ({source_section})\n")
-            f.write("# WARNING: Automatic conversion might be incomplete for complex dependencies.\n\n")
-            f.write("\n".join(req_lines))
-            f.write("\n") # Add trailing newline
+        write_requirements_file(req_path, req_lines, [f"Source: {os.path.basename(pyproject_path)} ({source_section})",
+                                                      "WARNING: Automatic conversion might be incomplete for complex dependencies."])
         print(f"'{os.path.basename(req_path)}' 已生成/更新。请检查内容是否准确。")
 
     except FileNotFoundError: print(f"错误: 文件 '{os.path.basename(pyproject_path)}' 未找到。", file=sys.stderr)
@@ -104,9 +106,8 @@ def convert_req_to_pyproject(project_root):
     print(f"正在尝试基于 '{os.path.basename(req_path)}' 生成/更新 '{os.path.basename(pyproject_path)}'...")
 
     try:
-        with open(req_path, 'r', encoding='utf-8') as f:
-            # Filter empty lines and comments, keep original line for better parsing
-            lines = [line for line in f if line.strip() and not line.strip().startswith('#')]
+        # Streams structured records (extras, markers, URLs, -e, hashes; -r/-c includes resolved)
+        records = list(requirements_parser.parse_requirements_file(req_path))
 
         # --- Default pyproject structure (Poetry) ---
         # Use project dir name for package name suggestion
@@ -147,24 +148,26 @@ def convert_req_to_pyproject(project_root):
         pyproject_data["tool"]["poetry"]["dependencies"]["python"] = python_specifier
         print(f"设置 Python 依赖为: {python_specifier}")
 
-        # --- Parse requirements lines ---
-        for line in lines:
-            line = line.strip()
-            # Basic parsing: Handles name, specifiers. Doesn't handle complex URLs, options like -e.
-            # Regex tries to capture package name and the rest (version specifiers)
-            match = re.match(r'^([a-zA-Z0-9._-]+)\s*([~<>=!]=?.*)?$', line)
-            if match:
-                name = match.group(1)
-                version_spec = match.group(2).strip() if match.group(2) else "*" # Default to "*" if no specifier
-                # Simple check: don't add python itself as a package dependency
-                if name.lower() == 'python':
-                     continue
-                pyproject_data["tool"]["poetry"]["dependencies"][name] = version_spec
-                # print(f"  添加依赖: {name} = \"{version_spec}\"") # Debug
-            else:
-                print(f"警告: 无法完全解析行 '{line}'。已跳过。", file=sys.stderr)
-                print("  (可能包含编辑模式 '-e', URL, 或不支持的格式)")
-
+        # --- Convert requirement records ---
+        poetry_deps = pyproject_data["tool"]["poetry"]["dependencies"]; hashed = 0
+        for record in records:
+            if record.kind == 'option':
+                opt, value = record.options[0]
+                if opt in ('-i', '--index-url', '--extra-index-url'): # Package indexes become Poetry sources
+                    sources = pyproject_data["tool"]["poetry"].setdefault("source", [])
+                    sources.append({"name": "primary" if opt != '--extra-index-url' else f"extra{len(sources)}", "url": value})
+                else: print(f"警告: pip 选项 '{record.line}' 无对应的 pyproject 设置，已跳过。", file=sys.stderr)
+                continue
+            if record.constraint: print(f"提示: 约束 '{record.line}' (-c) 不会写入依赖列表。"); continue
+            converted = requirement_to_poetry_dependency(record)
+            if not converted:
+                print(f"警告: 无法转换行 '{record.line}' ({record.source}:{record.lineno})。已跳过。", file=sys.stderr)
+                continue
+            name, spec = converted
+            if name.lower() == 'python': continue # Simple check: don't add python itself as a package dependency
+            poetry_deps[name] = spec
+            if record.hashes: hashed += 1
+        if hashed: print(f"提示: {hashed} 个依赖的 --hash 校验值不写入 pyproject.toml (由 poetry.lock 管理)。")
 
         # Check if pyproject.toml already exists
         if os.path.exists(pyproject_path):
@@ -191,6 +194,125 @@ def convert_req_to_pyproject(project_root):
     except Exception as e: print(f"转换时发生错误: {e}", file=sys.stderr); import traceback; traceback.print_exc()
 
 
+# --- Import Name -> Distribution Mapping ---
+IMPORT_MAP_VERSION = 1
+
+def _get_import_map_path(prefix):
+    cache_dir = utils.get_cache_dir() / 'import_map'
+    utils.ensure_dir_exists(cache_dir)
+    return cache_dir / f"{hashlib.sha1(os.path.normcase(prefix).encode('utf-8')).hexdigest()[:16]}.json"
+
+def _top_level_from_record(record_path):
+    """Derives top-level import names from a dist's RECORD when top_level.txt is missing. SILENT."""
+    names = set()
+    try:
+        with open(record_path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                path = line.split(',', 1)[0].strip().strip('"')
+                first, sep, _ = path.partition('/')
+                if not first or first.startswith('..') or first == '__pycache__' or first.endswith(('.dist-info', '.data', '.egg-info')): continue
+                if sep: names.add(first) # Package directory
+                elif first.endswith(('.py', '.pyd', '.so')): names.add(first.split('.', 1)[0]) # Module or extension
+    except OSError: pass
+    return sorted(n for n in names if n.isidentifier())
+
+def _read_dist_import_entry(meta_dir):
+    """Returns [dist_name, version, [top-level imports]] for one *.dist-info / *.egg-info dir, or None. SILENT."""
+    metadata = package_index.read_dist_info_metadata(meta_dir) if meta_dir.endswith('.dist-info') else None
+    if metadata is None: # *.egg-info: name/version from PKG-INFO
+        fields = {}
+        try:
+            with open(os.path.join(meta_dir, 'PKG-INFO'), 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if not line.strip(): break
+                    key, sep, value = line.partition(':')
+                    if sep and key in ('Name', 'Version'): fields.setdefault(key, value.strip())
+        except OSError: return None
+        if 'Name' not in fields: return None
+        metadata = {'name': fields['Name'], 'version': fields.get('Version', '')}
+    try:
+        with open(os.path.join(meta_dir, 'top_level.txt'), 'r', encoding='utf-8') as f: top_level = sorted({l.strip().split('/')[0] for l in f if l.strip()})
+    except OSError: top_level = _top_level_from_record(os.path.join(meta_dir, 'RECORD'))
+    return [metadata['name'], metadata['version'], top_level]
+
+def build_import_map(prefix):
+    """
+    Builds the env's import-name -> distribution index from top_level.txt / RECORD.
+    The compact on-disk form ({meta_dir_name: [dist, version, [imports]]}) is refreshed
+    incrementally: when the env changes only newly added metadata dirs are read. SILENT.
+    """
+    key = package_index.get_index_validation_key(prefix); map_path = _get_import_map_path(prefix)
+    data = utils.load_json_file(map_path)
+    stored = data.get('dists', {}) if isinstance(data, dict) and data.get('version') == IMPORT_MAP_VERSION else {}
+    if stored and data.get('key') == key: return stored
+    meta_dirs = {}
+    for site_packages in package_index.get_site_packages_dirs(prefix):
+        try:
+            with os.scandir(site_packages) as it:
+                meta_dirs.update({e.name: e.path for e in it if e.name.endswith(('.dist-info', '.egg-info')) and e.is_dir()})
+        except OSError: continue
+    dists = {name: stored[name] for name in meta_dirs if name in stored} # Dir names carry the version, so unchanged dists are reusable
+    for name in meta_dirs.keys() - dists.keys():
+        entry = _read_dist_import_entry(meta_dirs[name])
+        if entry: dists[name] = entry
+    utils.save_json_file(map_path, {'version': IMPORT_MAP_VERSION, 'key': key, 'dists': dists})
+    return dists
+
+def get_import_mapping(prefix):
+    """Returns {import_name: [(dist_name, version), ...]} for an env (one dict lookup per import). SILENT."""
+    mapping = {}
+    for dist_name, version, top_level in build_import_map(prefix).values():
+        for module in top_level: mapping.setdefault(module, []).append((dist_name, version))
+    return mapping
+
+
+def generate_req_from_imports(project_root, env_name):
+    """
+    Generates requirements.txt from an in-process, parallel AST scan of the project's
+    imports (no pipreqs, no network). Imports are mapped to the env's installed distributions
+    via top_level.txt/RECORD (e.g. cv2 -> opencv-python, yaml -> PyYAML) and pinned.
+    """
+    req_path = os.path.join(project_root, 'requirements.txt')
+    print(f"\n正在扫描项目导入以生成 '{os.path.basename(req_path)}' (环境: {env_name or '无'})...")
+    if os.path.exists(req_path):
+        overwrite = utils.get_user_choice(f"'{os.path.basename(req_path)}' 已存在。是否覆盖?", ["否", "是"], default_index=0)
+        if overwrite == "否" or overwrite is None:
+            print("操作取消。")
+            return
+
+    try:
+        third_party, errors = import_scanner.find_third_party_imports(project_root)
+        for rel_path, error in errors.items(): print(f"警告: 跳过 '{rel_path}' ({error})", file=sys.stderr)
+        prefix = conda_manager.get_env_prefix(env_name) if env_name else None
+        mapping = get_import_mapping(prefix) if prefix else {}
+        existing = set()
+        if os.path.exists(req_path): # Names the old file already declares settle ambiguous imports
+            try: existing = {package_index.normalize_name(r.name) for r in requirements_parser.parse_requirements_file(req_path) if r.name}
+            except OSError: pass
+        req_lines = []; unresolved = []; ambiguous = []
+        for module in third_party:
+            providers = mapping.get(module)
+            if not providers: unresolved.append(module); continue
+            if len(providers) > 1:
+                declared = [(d, v) for d, v in providers if package_index.normalize_name(d) in existing]
+                if not declared:
+                    print(f"警告: 导入 '{module}' 由多个发行包提供: {', '.join(d for d, _ in providers)}，未自动添加，请手动选择。", file=sys.stderr)
+                    ambiguous.append((module, providers)); continue
+                providers = declared
+            req_lines.extend(f"{dist}=={version}" for dist, version in providers)
+        req_lines = sorted(set(req_lines), key=str.lower)
+        req_lines += [f"# {module}  # 多个候选发行包: {', '.join(f'{d}=={v}' for d, v in providers)}，请手动选择" for module, providers in ambiguous]
+        unresolved_count = len(unresolved) + len(ambiguous)
+        req_lines += [f"# {module}  # 未在环境中找到对应的发行包，请手动确认" for module in unresolved]
+        write_requirements_file(req_path, req_lines, [f"Source: import scan of {len(third_party)} third-party modules"])
+        print(f"'{os.path.basename(req_path)}' 已生成/更新 ({len(req_lines) - unresolved_count} 个依赖)。")
+        if unresolved: print(f"以下导入未能映射到已安装的发行包: {', '.join(unresolved)}")
+        print("注意：基于 import 语句生成，可能不包含所有依赖项（如插件或动态加载的库）。请务必检查文件内容。")
+    except Exception as e:
+        print(f"扫描项目导入时发生错误: {e}", file=sys.stderr)
+        import traceback; traceback.print_exc()
+
+
 def generate_req_pipreqs(project_root, env_name):
     """Generates requirements.txt using pipreqs within the specified Conda environment."""
     req_path = os.path.join(project_root, 'requirements.txt')
@@ -212,16 +334,13 @@ def generate_req_pipreqs(project_root, env_name):
     # Command to run pipreqs inside the conda environment
     # Use '--force' to overwrite existing requirements.txt
     # Specify project root explicitly for pipreqs
-    command = [
-        'conda', 'run', '-n', env_name, '--no-capture-output', # Allow output to show
-        'pipreqs', '.', '--encoding=utf-8', '--force'
-        # Consider adding common ignores: e.g. '--ignore .venv,.env,tests,docs'
-    ]
+    pipreqs_args = ['pipreqs', '.', '--encoding=utf-8', '--force']
+    # Consider adding common ignores: e.g. '--ignore .venv,.env,tests,docs'
 
     try:
         # Run command in the project root directory, show output
         print(f"运行 pipreqs (这可能需要一些时间)...")
-        result = utils.run_command(command, cwd=project_root, check=False, verbose=True) # verbose=True to see pipreqs output/errors
+        result = env_runner.run_in_env(env_name, pipreqs_args, cwd=project_root, check=False, verbose=True) # verbose=True to see pipreqs output/errors
 
         if result.returncode == 0:
              print(f"\npipreqs 成功完成。'{os.path.basename(req_path)}' 已生成/更新。")
@@ -241,23 +360,63 @@ def generate_req_pipreqs(project_root, env_name):
          print(f"运行 pipreqs 时发生异常: {e}", file=sys.stderr)
          import traceback; traceback.print_exc()
 
-# global_tools/dependency_manager.py
-import os
-import time # Import time module
-import sys
-import toml
-import re
-import traceback # Import traceback
-from . import utils
-from . import config as tool_config
-
-# ... (existing functions: convert_pyproject_to_req, convert_req_to_pyproject, generate_req_pipreqs) ...
+# --- Dependency Sync State ---
+SYNC_MANIFEST_FILE_NAME = "dep_sync.json"
+
+def _file_sha256(path):
+    with open(path, 'rb') as f: return hashlib.sha256(f.read()).hexdigest()
+
+def _normalize_dependency_records(records):
+    """Maps requirement records to {key: normalized spec}; the key carries extras, URL/path-only entries use the URL."""
+    deps = {}
+    for record in records:
+        if record.kind in ('option', 'include') or record.constraint: continue
+        if not record.name: deps[record.url] = ''; continue
+        key = package_index.normalize_name(record.name) + (f"[{','.join(record.extras)}]" if record.extras else '')
+        spec = f"@{record.url}" if record.url else ','.join(sorted(c for c in record.specifier.split(',') if c))
+        deps[key] = spec + (f";{record.marker}" if record.marker else '')
+    return deps
+
+def read_dependency_set(path):
+    """Returns {'hash', 'deps'} for requirements.txt or pyproject.toml (python itself excluded)."""
+    if os.path.basename(path) == 'pyproject.toml':
+        data = toml.load(path); lines = []
+        poetry_deps = data.get('tool', {}).get('poetry', {}).get('dependencies')
+        if isinstance(poetry_deps, dict):
+            for name, spec in poetry_deps.items():
+                if name.lower() == 'python': continue
+                lines.append(poetry_dependency_to_requirement(name, spec) or name)
+        else: lines = [str(d) for d in data.get('project', {}).get('dependencies', []) or []]
+        records = requirements_parser.parse_requirement_lines(lines, source=path)
+    else: records = requirements_parser.parse_requirements_file(path)
+    return {'hash': _file_sha256(path), 'deps': _normalize_dependency_records(records)}
+
+def diff_dependency_sets(req_deps, pyproj_deps):
+    """Per-package differences between the two dependency sets."""
+    return {'only_in_requirements': {n: s for n, s in req_deps.items() if n not in pyproj_deps},
+            'only_in_pyproject': {n: s for n, s in pyproj_deps.items() if n not in req_deps},
+            'version_mismatch': {n: [req_deps[n], pyproj_deps[n]] for n in req_deps if n in pyproj_deps and req_deps[n] != pyproj_deps[n]}}
+
+def _print_dependency_diff(diff, req_base, pyproj_base):
+    for name, spec in diff['only_in_requirements'].items(): print(f"  + 仅在 {req_base}: {name}{spec}")
+    for name, spec in diff['only_in_pyproject'].items(): print(f"  + 仅在 {pyproj_base}: {name}{spec}")
+    for name, (req_spec, pyproj_spec) in diff['version_mismatch'].items():
+        print(f"  ~ {name}: {req_base} '{req_spec or '*'}' / {pyproj_base} '{pyproj_spec or '*'}'")
+
+def _save_sync_manifest(project_root, req_path, pyproject_path, diff=None, last_action=None):
+    """Records both files' parsed dependency sets and hashes (plus the last diff) under the project."""
+    manifest = {'files': {}, 'updated': time.strftime('%Y-%m-%d %H:%M:%S')}
+    for path in (req_path, pyproject_path):
+        if os.path.exists(path): manifest['files'][os.path.basename(path)] = read_dependency_set(path)
+    if diff is not None: manifest['last_diff'] = diff
+    if last_action: manifest['last_action'] = last_action
+    utils.save_json_file(utils.get_project_cache_dir(project_root) / SYNC_MANIFEST_FILE_NAME, manifest)
 
-# --- Add the new function here ---
 def check_and_prompt_sync(project_root):
     """
-    Checks for pyproject.toml and requirements.txt, compares modification times,
-    and prompts the user to synchronize them if one is missing or significantly newer.
+    Checks pyproject.toml and requirements.txt and prompts the user to synchronize them
+    when one is missing or their parsed dependency sets differ. Direction is decided by
+    which file's content hash changed since the last recorded sync (never by mtimes).
     """
     pyproject_path = os.path.join(project_root, 'pyproject.toml')
     req_path = os.path.join(project_root, 'requirements.txt')
@@ -268,14 +427,6 @@ def check_and_prompt_sync(project_root):
         pyproj_exists = os.path.exists(pyproject_path)
         req_exists = os.path.exists(req_path)
 
-        # Get modification times (0 if file doesn't exist)
-        pyproj_mtime = os.path.getmtime(pyproject_path) if pyproj_exists else 0
-        req_mtime = os.path.getmtime(req_path) if req_exists else 0
-
-        # Time difference threshold in seconds (e.g., 5 seconds)
-        # If mod times are within this threshold, consider them 'concurrent'
-        time_threshold = 5
-
         action_taken = False # Flag to check if any sync action was performed
 
         print("\n--- 依赖文件同步检查 ---")
@@ -303,37 +454,38 @@ def check_and_prompt_sync(project_root):
                 action_taken = True
 
         elif pyproj_exists and req_exists:
-            time_diff = abs(pyproj_mtime - req_mtime)
-
-            # Only prompt if one file is significantly newer than the other
-            if time_diff > time_threshold:
-                if pyproj_mtime > req_mtime:
-                    newer_file, older_file = pyproj_base, req_base
-                    action = f"从较新的 {newer_file} 更新 {older_file}?"
-                    convert_func = convert_pyproject_to_req
-                else:
-                    newer_file, older_file = req_base, pyproj_base
-                    action = f"从较新的 {newer_file} 更新 {older_file}?"
-                    convert_func = convert_req_to_pyproject
-
-                print(f"检测到 '{newer_file}' 比 '{older_file}' 更新。")
-                choice = utils.get_user_choice(
-                    f"{action} (警告: 可能覆盖 '{older_file}' 中的手动修改)",
-                    ["否", "是"], default_index=0
-                )
-                if choice == "是":
-                    print(f"\n正在执行更新: {newer_file} -> {older_file}")
-                    convert_func(project_root)
-                    action_taken = True
+            req_set = read_dependency_set(req_path); pyproj_set = read_dependency_set(pyproject_path)
+            manifest = utils.load_json_file(utils.get_project_cache_dir(project_root) / SYNC_MANIFEST_FILE_NAME, default={}) or {}
+            recorded = manifest.get('files', {})
+
+            if req_set['deps'] == pyproj_set['deps']:
+                print(f"{req_base} 与 {pyproj_base} 的依赖集合一致，无需同步。")
+                if recorded.get(req_base, {}).get('hash') != req_set['hash'] or recorded.get(pyproj_base, {}).get('hash') != pyproj_set['hash']:
+                    _save_sync_manifest(project_root, req_path, pyproject_path, diff=diff_dependency_sets(req_set['deps'], pyproj_set['deps']))
             else:
-                # Files exist and modification times are close, do nothing automatically
-                print(f"检测到 {pyproj_base} 和 {req_base}，修改时间接近，无需同步。")
+                diff = diff_dependency_sets(req_set['deps'], pyproj_set['deps'])
+                print(f"{req_base} 与 {pyproj_base} 的依赖集合不一致:")
+                _print_dependency_diff(diff, req_base, pyproj_base)
+                req_changed = recorded.get(req_base, {}).get('hash') != req_set['hash']
+                pyproj_changed = recorded.get(pyproj_base, {}).get('hash') != pyproj_set['hash']
+                to_pyproj = f"从 {req_base} 更新 {pyproj_base}"; to_req = f"从 {pyproj_base} 更新 {req_base}"
+                if req_changed and not pyproj_changed: options, hint = [to_pyproj, to_req, "暂不同步"], f"自上次同步后 {req_base} 已修改。"
+                elif pyproj_changed and not req_changed: options, hint = [to_req, to_pyproj, "暂不同步"], f"自上次同步后 {pyproj_base} 已修改。"
+                elif req_changed: options, hint = ["暂不同步", to_pyproj, to_req], "无法确定同步方向 (两者都已修改或无同步记录)。"
+                else: options, hint = ["暂不同步", to_pyproj, to_req], "两个文件自上次检查后均未修改，但依赖集合仍不一致。"
+                print(hint)
+                choice = utils.get_user_choice("请选择同步方向 (警告: 可能覆盖目标文件中的手动修改):", options, default_index=0)
+                if choice in (to_pyproj, to_req):
+                    print(f"\n正在执行更新: {choice}")
+                    (convert_req_to_pyproject if choice == to_pyproj else convert_pyproject_to_req)(project_root)
+                    action_taken = True
+                    _save_sync_manifest(project_root, req_path, pyproject_path, diff=diff, last_action=choice)
+                elif choice is not None:
+                    _save_sync_manifest(project_root, req_path, pyproject_path, diff=diff, last_action="暂不同步")
 
         else: # Neither file exists
            print(f"未检测到依赖文件 ({req_base} / {pyproj_base})。")
 
-        # print("--- 依赖文件检查完成 ---") # Footer might be too noisy
-
         # Pause only if an action was taken and user confirmed it
         if action_taken:
             input("同步操作完成，按回车键继续...")
@@ -342,4 +494,246 @@ def check_and_prompt_sync(project_root):
         print(f"依赖文件同步检查时发生错误: {e}", file=sys.stderr)
         # Optionally print traceback for debugging
         # import traceback
-        # traceback.print_exc()
\ No newline at end of file
+        # traceback.print_exc()
+
+
+# --- Dependency Installation (delta mode) ---
+INSTALL_STAMP_FILE_NAME = "install_stamps.json"
+INSTALL_MODES = ('delta', 'full')
+
+def get_install_mode():
+    """'delta' (only install missing/mismatched requirements, default) or 'full' (always run the installer)."""
+    mode = utils.get_config_value("Install", "Mode", "delta").strip().lower()
+    return mode if mode in INSTALL_MODES else 'delta'
+
+def poetry_spec_to_pep440(spec):
+    """Translates a Poetry version constraint (^1.2, ~1.2, 1.2.3, *) to a PEP 440 specifier."""
+    spec = spec.strip()
+    if spec in ('', '*'): return ''
+    if spec[0] in '^~' and not spec.startswith('~='):
+        parts = [int(p) for p in re.findall(r'\d+', spec)] or [0]
+        if spec[0] == '^': # Bump the first non-zero component
+            idx = next((i for i, p in enumerate(parts) if p != 0), len(parts) - 1)
+        else: # ~1.2.3 -> <1.3 ; ~1 -> <2
+            idx = min(1, len(parts) - 1)
+        upper = parts[:idx] + [parts[idx] + 1]
+        return f">={spec[1:].strip()},<{'.'.join(str(p) for p in upper)}"
+    if re.match(r'^\d', spec): return f"=={spec}"
+    return spec
+
+def _split_vcs_url(url):
+    """'git+https://host/repo.git@v1#egg=x' -> ('https://host/repo.git', 'v1' or None)."""
+    url = url.split('#', 1)[0]
+    if url.startswith('git+'): url = url[4:]
+    base, sep, rev = url.rpartition('@')
+    if sep and '/' not in rev and '://' in base: return base, rev
+    return url, None
+
+def requirement_to_poetry_dependency(record):
+    """Maps a requirements_parser record to (name, Poetry dependency spec), or None if it has no name."""
+    target = record.url
+    is_remote = bool(target) and re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', target) is not None
+    name = record.name or (os.path.basename(os.path.normpath(target)) if target and not is_remote else None)
+    if not name: return None
+    spec = {}
+    if not target: spec['version'] = record.specifier or '*'
+    elif target.startswith('git+'):
+        spec['git'], rev = _split_vcs_url(target)
+        if rev: spec['rev'] = rev
+    elif is_remote: spec['url'] = target
+    else:
+        spec['path'] = target
+        if record.kind == 'editable': spec['develop'] = True
+    if record.extras: spec['extras'] = list(record.extras)
+    if record.marker: spec['markers'] = record.marker
+    return (name, spec['version']) if list(spec) == ['version'] else (name, spec)
+
+def poetry_dependency_to_requirement(name, spec):
+    """Maps a [tool.poetry.dependencies] entry to a PEP 508 line, or None if it cannot be expressed."""
+    if isinstance(spec, str): return f"{name}{poetry_spec_to_pep440(spec)}"
+    if not isinstance(spec, dict): return None
+    extras = f"[{','.join(spec['extras'])}]" if spec.get('extras') else ''
+    if 'git' in spec:
+        rev = spec.get('rev') or spec.get('tag') or spec.get('branch')
+        line = f"{name}{extras} @ git+{spec['git']}" + (f"@{rev}" if rev else '')
+    elif 'url' in spec: line = f"{name}{extras} @ {spec['url']}"
+    elif 'path' in spec: return f"-e {spec['path']}" if spec.get('develop') else spec['path']
+    elif 'version' in spec: line = f"{name}{extras}{poetry_spec_to_pep440(str(spec['version']))}"
+    else: return None
+    if spec.get('markers'): line += f" ; {spec['markers']}"
+    return line
+
+def read_pyproject_requirements(pyproject_path):
+    """
+    Reads dependencies from pyproject.toml as requirement lines.
+    Returns (lines, is_poetry). lines is None if a dependency (git/path/url) cannot be expressed as a line.
+    """
+    data = toml.load(pyproject_path)
+    poetry_deps = data.get('tool', {}).get('poetry', {}).get('dependencies')
+    if isinstance(poetry_deps, dict):
+        lines = []
+        for name, spec in poetry_deps.items():
+            if name.lower() == 'python': continue
+            if isinstance(spec, dict):
+                if 'version' not in spec or spec.get('optional'): return None, True
+                spec = spec['version']
+            if not isinstance(spec, str): return None, True
+            lines.append(f"{name}{poetry_spec_to_pep440(spec)}")
+        return lines, True
+    deps = data.get('project', {}).get('dependencies', [])
+    return ([str(d) for d in deps] if isinstance(deps, list) else None), False
+
+def _compute_install_stamp(prefix, dep_files):
+    """Hash of the dependency files' contents plus the env's package-state key."""
+    digest = hashlib.sha256()
+    for path in dep_files:
+        digest.update(os.path.basename(path).encode('utf-8'))
+        try:
+            with open(path, 'rb') as f: digest.update(f.read())
+        except OSError: digest.update(b'<missing>')
+    digest.update(json.dumps(package_index.get_index_validation_key(prefix)).encode('utf-8'))
+    return digest.hexdigest()
+
+def _load_install_stamps(project_root):
+    return utils.load_json_file(utils.get_project_cache_dir(project_root) / INSTALL_STAMP_FILE_NAME, default={}) or {}
+
+def _save_install_stamp(project_root, prefix, stamp):
+    stamps = _load_install_stamps(project_root); stamps[prefix] = stamp
+    utils.save_json_file(utils.get_project_cache_dir(project_root) / INSTALL_STAMP_FILE_NAME, stamps)
+
+def _run_pip_install(project_root, env_name, pip_args):
+    """Runs one `pip install` in the env. Returns True on success."""
+    try:
+        env_runner.run_in_env(env_name, ['pip', 'install'] + local_mirror.get_pip_args() + pip_args, cwd=project_root, check=True, stream=True)
+        print("依赖安装成功(pip)。"); return True
+    except Exception as e: print(f"Pip 安装失败: {e}", file=sys.stderr); return False
+
+def _run_poetry_install(project_root, env_name):
+    """Installs Poetry into the env, then runs `poetry install`. Returns True on success."""
+    print(f"检查/安装 Poetry 到环境 '{env_name}'...")
+    try:
+        env_runner.run_in_env(env_name, ['pip', 'install'] + local_mirror.get_pip_args() + ['poetry'], check=True)
+        print("Poetry 安装/验证成功。")
+    except subprocess.CalledProcessError as e: print(f"Poetry 安装失败 (返回码: {e.returncode})。", file=sys.stderr); return False
+    except Exception as e: print(f"安装 Poetry 时发生未知错误: {e}", file=sys.stderr); return False
+    print(f"正在运行 poetry install...")
+    try:
+        env_runner.run_in_env(env_name, ['poetry', 'install'], cwd=project_root, check=True, stream=True)
+        print("依赖安装成功(poetry)。"); return True
+    except FileNotFoundError: print("错误: 'poetry' 命令在安装后仍未找到？", file=sys.stderr)
+    except subprocess.CalledProcessError as e: print(f"Poetry install 失败 (返回码: {e.returncode})。", file=sys.stderr)
+    except Exception as e: print(f"Poetry install 时发生未知错误: {e}", file=sys.stderr)
+    return False
+
+def install_project_dependencies(project_root, env_name):
+    """
+    Installs the project's dependencies (requirements.txt, else pyproject.toml) into an env.
+    In delta mode an unchanged install stamp skips everything, otherwise only
+    missing/mismatched requirements are passed to a single installer call.
+    Returns None if no dependency file exists, else True/False for success.
+    """
+    req_file = os.path.join(project_root, 'requirements.txt'); proj_file = os.path.join(project_root, 'pyproject.toml')
+    if os.path.exists(req_file): dep_file = req_file
+    elif os.path.exists(proj_file): dep_file = proj_file
+    else: print("未找到依赖文件 (requirements.txt / pyproject.toml)。"); return None
+    print(f"找到 {os.path.basename(dep_file)}...")
+
+    is_poetry = False; records = None
+    try:
+        if dep_file == req_file: records = list(requirements_parser.parse_requirements_file(req_file))
+        else:
+            lines, is_poetry = read_pyproject_requirements(proj_file)
+            if lines is not None: records = list(requirements_parser.parse_requirement_lines(lines, source=proj_file))
+    except Exception as e: print(f"解析 '{os.path.basename(dep_file)}' 失败，将执行完整安装: {e}", file=sys.stderr)
+    stamp_files = [dep_file] + ([os.path.join(project_root, 'poetry.lock')] if is_poetry else [])
+    if records: # Files pulled in through -r/-c are part of the stamp too
+        stamp_files += sorted({r.source for r in records if os.path.abspath(r.source) != os.path.abspath(dep_file)})
+
+    prefix = conda_manager.get_env_prefix(env_name)
+    delta = get_install_mode() == 'delta' and prefix is not None
+    if delta:
+        if _load_install_stamps(project_root).get(prefix) == _compute_install_stamp(prefix, stamp_files):
+            print("依赖文件与环境均未变化 (安装戳匹配)，跳过安装。"); return True
+        results = package_index.check_requirement_records(prefix, records) if records is not None else None
+        if results is None: delta = False; print("依赖中包含无法离线判断的条目，将执行完整安装。")
+    if delta:
+        package_index.print_requirement_report(results)
+        pending = [item['line'] for item in results if item['status'] != package_index.STATUS_INSTALLED]
+        if not pending: print("所有依赖均已满足，无需安装。"); success = True
+        elif is_poetry: success = _run_poetry_install(project_root, env_name) # Poetry must honour poetry.lock
+        else: print(f"仅安装 {len(pending)} 个缺失/不匹配的依赖..."); success = _run_pip_install(project_root, env_name, pending)
+    elif dep_file == req_file: success = _run_pip_install(project_root, env_name, ['-r', 'requirements.txt'])
+    elif is_poetry or records is None: success = _run_poetry_install(project_root, env_name)
+    else: success = _run_pip_install(project_root, env_name, ['.'])
+
+    if success and prefix: _save_install_stamp(project_root, prefix, _compute_install_stamp(prefix, stamp_files))
+    return success
+
+
+# --- Environment Lock Files ---
+# A lock is a pair of files next to the project: an @EXPLICIT conda list (url#md5,
+# installed by `conda create --file` without solving) and pip pins installed with
+# --no-deps. Both are read straight from the env's metadata.
+LOCK_CONDA_FILE_NAME = "conda-explicit.lock"
+LOCK_PIP_FILE_NAME = "requirements.lock"
+
+def _pip_pin_from_dist_info(dist_info_dir, meta):
+    """Returns (requirement line, archive hash or None) for one pip-installed distribution, using direct_url.json."""
+    name, version = meta['name'], meta['version']
+    direct = utils.load_json_file(os.path.join(dist_info_dir, 'direct_url.json'))
+    if not isinstance(direct, dict) or not direct.get('url'): return f"{name}=={version}", None
+    url = direct['url']
+    if (direct.get('dir_info') or {}).get('editable'): return f"-e {url}", None
+    vcs = direct.get('vcs_info')
+    if vcs:
+        revision = vcs.get('commit_id') or vcs.get('requested_revision')
+        return f"{name} @ {vcs.get('vcs', 'git')}+{url}" + (f"@{revision}" if revision else ''), None
+    archive = direct.get('archive_info') or {}
+    hashes = archive.get('hashes') or {}
+    if 'sha256' in hashes: digest = f"sha256:{hashes['sha256']}"
+    else: digest = archive.get('hash', '').replace('=', ':', 1) or None
+    return f"{name} @ {url}", digest
+
+def collect_pip_pins(prefix):
+    """Lists (line, hash) pins for every distribution not installed by conda, sorted by name."""
+    dist_dirs = [os.path.join(sp, n) for sp in package_index.get_site_packages_dirs(prefix) for n in os.listdir(sp) if n.endswith('.dist-info')]
+    pins = []; conda_owned = package_index.get_conda_owned_dist_infos(prefix)
+    for dist_dir in dist_dirs:
+        meta = package_index.read_dist_info_metadata(dist_dir, conda_owned)
+        if not meta or meta['source'] == 'conda': continue
+        line, digest = _pip_pin_from_dist_info(dist_dir, meta)
+        pins.append((package_index.normalize_name(meta['name']), line, digest))
+    return [(line, digest) for _, line, digest in sorted(pins)]
+
+def freeze_env_to_lock(project_root, env_name):
+    """Writes conda-explicit.lock and requirements.lock for an env from conda-meta and dist-info. Returns True on success."""
+    prefix = conda_manager.get_env_prefix(env_name)
+    if not prefix: print(f"错误: 环境 '{env_name}' 不存在。", file=sys.stderr); return False
+    specs, subdir = conda_manager.get_explicit_specs(prefix)
+    if specs is None: print("错误: 部分 conda 包缺少下载地址，无法生成显式清单。", file=sys.stderr); return False
+    pins = collect_pip_pins(prefix)
+    conda_lock = os.path.join(project_root, LOCK_CONDA_FILE_NAME); pip_lock = os.path.join(project_root, LOCK_PIP_FILE_NAME)
+    conda_manager.write_explicit_file(conda_lock, specs, subdir, [f"Env: {env_name} (python {conda_manager.get_env_python_version(prefix) or '?'})"])
+    # pip's hash-checking mode is all-or-nothing, so hashes are only enforced when every pin has one
+    enforce = bool(pins) and all(digest for _, digest in pins)
+    lines = [f"{line} --hash={digest}" if enforce else (f"{line}  # sha256 {digest}" if digest else line) for line, digest in pins]
+    write_requirements_file(pip_lock, lines, [f"Env: {env_name}", "Install with: pip install --no-deps -r requirements.lock"])
+    print(f"已生成锁文件: {LOCK_CONDA_FILE_NAME} ({len(specs)} 个 conda 包), {LOCK_PIP_FILE_NAME} ({len(pins)} 个 pip 包)。")
+    if pins and not enforce: print("提示: 仅通过 URL 安装的包记录了归档哈希，锁文件未启用 pip 哈希校验。")
+    return True
+
+def create_env_from_lock(project_root):
+    """Recreates an env from the project's lock files without running any solver. Returns the env name or None."""
+    conda_lock = os.path.join(project_root, LOCK_CONDA_FILE_NAME); pip_lock = os.path.join(project_root, LOCK_PIP_FILE_NAME)
+    if not os.path.exists(conda_lock): print(f"错误: 未找到 '{LOCK_CONDA_FILE_NAME}'，请先生成锁文件。", file=sys.stderr); return None
+    env_name = utils.get_user_input("请输入新环境名称", default=utils.get_default_env_name(project_root))
+    if not env_name: print("环境名称不能为空。"); return None
+    if conda_manager.find_env_by_name(env_name, use_cache=False): print(f"错误: 环境 '{env_name}' 已存在。", file=sys.stderr); return None
+    print(f"正在从 '{LOCK_CONDA_FILE_NAME}' 创建环境 '{env_name}' (跳过求解)...")
+    if not conda_manager.create_env_from_explicit(env_name, conda_lock): return None
+    created_env = conda_manager.find_env_by_name(env_name, use_cache=False) or env_name
+    if os.path.exists(pip_lock) and any(r.kind != 'option' for r in requirements_parser.parse_requirements_file(pip_lock)):
+        print(f"正在安装 '{LOCK_PIP_FILE_NAME}' 中锁定的 pip 包 (--no-deps)...")
+        if not _run_pip_install(project_root, created_env, ['--no-deps', '-r', LOCK_PIP_FILE_NAME]): return created_env
+    print(f"环境 '{created_env}' 已按锁文件重建。")
+    return created_env
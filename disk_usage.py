@@ -0,0 +1,178 @@
+# global_tools/disk_usage.py
+import os
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import conda_manager
+from . import package_index
+
+DISK_USAGE_CACHE_DIR_NAME = "disk_usage"
+DISK_USAGE_CACHE_VERSION = 2
+PACKAGE_ARCHIVE_SUFFIXES = ('.conda', '.tar.bz2')
+
+def format_size(num_bytes):
+    """Human-readable size (B/KB/MB/GB/TB)."""
+    size = float(num_bytes or 0)
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024: return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def scan_inodes(root, exclude_paths=(), links=None):
+    """
+    Walks root with os.scandir without following symlinks. Returns {(st_dev, st_ino): size};
+    a file reachable through several hardlinks appears once. If links is a dict it is filled
+    with {inode: [st_nlink, paths seen under root]}. SILENT.
+    """
+    excluded = {os.path.normcase(os.path.normpath(p)) for p in exclude_paths}
+    inodes = {}; stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not excluded or os.path.normcase(entry.path) not in excluded: stack.append(entry.path)
+                            continue
+                        st = entry.stat(follow_symlinks=False)
+                        inodes[(st.st_dev, st.st_ino)] = st.st_size
+                        if links is not None: links.setdefault((st.st_dev, st.st_ino), [st.st_nlink, 0])[1] += 1
+                    except OSError: continue
+        except OSError: continue
+    return inodes
+
+# --- Per-Prefix Cache ---
+def _get_prefix_cache_path(prefix):
+    cache_dir = utils.get_cache_dir() / DISK_USAGE_CACHE_DIR_NAME
+    utils.ensure_dir_exists(cache_dir)
+    return cache_dir / f"{hashlib.sha1(os.path.normcase(prefix).encode('utf-8')).hexdigest()[:16]}.json"
+
+def get_prefix_usage(prefix, exclude_paths=(), use_cache=True):
+    """
+    (inode map, reclaimable bytes) of one env prefix, cached on disk and keyed on
+    conda-meta/history (plus site-packages) mtimes, so unchanged envs are not rescanned.
+    Reclaimable counts files whose every hardlink lies inside the prefix, i.e. what
+    deleting the env frees without scanning the package caches or other envs. SILENT.
+    """
+    try: device = os.stat(prefix).st_dev
+    except OSError: return {}, 0
+    key = [device, package_index.get_index_validation_key(prefix), sorted(exclude_paths)]
+    cache_path = _get_prefix_cache_path(prefix)
+    if use_cache:
+        data = utils.load_json_file(cache_path)
+        if isinstance(data, dict) and data.get('version') == DISK_USAGE_CACHE_VERSION and data.get('key') == key:
+            return {(dev, ino): size for dev, ino, size in data['inodes']}, data.get('reclaimable', 0)
+    links = {}; inodes = scan_inodes(prefix, exclude_paths, links)
+    reclaimable = sum(inodes[inode] for inode, (nlink, seen) in links.items() if seen >= nlink)
+    utils.save_json_file(cache_path, {'version': DISK_USAGE_CACHE_VERSION, 'key': key, 'reclaimable': reclaimable,
+                                      'inodes': [[dev, ino, size] for (dev, ino), size in inodes.items()]})
+    return inodes, reclaimable
+
+def get_prefix_inodes(prefix, exclude_paths=(), use_cache=True):
+    """Inode map of one env prefix (see get_prefix_usage). SILENT."""
+    return get_prefix_usage(prefix, exclude_paths, use_cache)[0]
+
+def get_pkgs_dirs(root_prefix=None):
+    """Package cache dirs: $CONDA_PKGS_DIRS, .condarc pkgs_dirs, then <root>/pkgs. SILENT."""
+    root_prefix = root_prefix or conda_manager.get_conda_root(); dirs = []
+    if os.environ.get('CONDA_PKGS_DIRS'): dirs += [d for d in os.environ['CONDA_PKGS_DIRS'].split(',') if d]
+    for condarc in reversed(conda_manager.get_condarc_paths(root_prefix)): dirs += conda_manager.read_condarc_list(condarc, 'pkgs_dirs')
+    if root_prefix: dirs.append(os.path.join(root_prefix, 'pkgs'))
+    dirs = [os.path.normpath(os.path.expandvars(os.path.expanduser(d))) for d in dirs]
+    return [d for d in dict.fromkeys(dirs) if os.path.isdir(d)]
+
+def _scan_pkgs_entry(path):
+    if os.path.isdir(path) and not os.path.islink(path): return scan_inodes(path)
+    try: st = os.lstat(path); return {(st.st_dev, st.st_ino): st.st_size}
+    except OSError: return {}
+
+# --- Analysis ---
+def analyze_disk_usage(max_workers=None, use_cache=True):
+    """
+    Scans every env prefix and the package caches concurrently and accounts each
+    inode once. Returns {'envs', 'packages', 'stray_dirs', 'total', ...} where each env has
+    'apparent' (all files), 'shared_pkgs' (hardlinked with the package cache), 'shared_envs' and 'unique'
+    (bytes freed by deleting it), and packages lists cache entries no env links to (reclaimable).
+    """
+    records = conda_manager.get_env_index(use_cache=False)
+    root_prefix = conda_manager.get_conda_root(); pkgs_dirs = get_pkgs_dirs(root_prefix)
+    envs_dirs = conda_manager.get_envs_dirs(root_prefix)
+    pkgs_entries = []
+    for pkgs_dir in pkgs_dirs:
+        try: pkgs_entries += [e.path for e in os.scandir(pkgs_dir) if e.name not in ('cache', 'urls', 'urls.txt') and not e.name.startswith('.')]
+        except OSError: continue
+    def scan_env(record):
+        exclude = pkgs_dirs + envs_dirs if record.get('is_base') else () # base contains pkgs/ and envs/
+        return get_prefix_inodes(record['prefix'], exclude_paths=exclude, use_cache=use_cache)
+    with ThreadPoolExecutor(max_workers=max_workers or min(16, (os.cpu_count() or 1) * 4)) as pool:
+        env_futures = [pool.submit(scan_env, r) for r in records]
+        pkgs_inode_maps = list(pool.map(_scan_pkgs_entry, pkgs_entries))
+        env_inode_maps = [f.result() for f in env_futures]
+
+    ref_counts = {}
+    for inodes in env_inode_maps:
+        for inode in inodes: ref_counts[inode] = ref_counts.get(inode, 0) + 1
+    pkgs_inodes = {}
+    for inodes in pkgs_inode_maps: pkgs_inodes.update(inodes)
+
+    envs = []
+    for record, inodes in zip(records, env_inode_maps):
+        apparent = shared_pkgs = shared_envs = unique = 0
+        for inode, size in inodes.items():
+            apparent += size
+            if inode in pkgs_inodes: shared_pkgs += size
+            elif ref_counts[inode] > 1: shared_envs += size
+            else: unique += size
+        envs.append({'name': record['name'], 'prefix': record['prefix'], 'is_base': record.get('is_base', False),
+                     'apparent': apparent, 'shared_pkgs': shared_pkgs, 'shared_envs': shared_envs, 'unique': unique, 'files': len(inodes)})
+
+    packages = []
+    for path, inodes in zip(pkgs_entries, pkgs_inode_maps):
+        size = sum(inodes.values()); linked = sum(s for i, s in inodes.items() if i in ref_counts)
+        is_archive = path.endswith(PACKAGE_ARCHIVE_SUFFIXES)
+        packages.append({'path': path, 'size': size, 'linked': linked, 'archive': is_archive, 'orphan': is_archive or linked == 0})
+
+    stray_dirs = []
+    known = {os.path.normcase(os.path.normpath(r['prefix'])) for r in records}
+    for envs_dir in envs_dirs:
+        try: entries = [e for e in os.scandir(envs_dir) if e.is_dir(follow_symlinks=False)]
+        except OSError: continue
+        for entry in entries: # Leftovers of interrupted creations/removals: no conda-meta, not a known env
+            if os.path.normcase(entry.path) not in known and not os.path.isdir(os.path.join(entry.path, 'conda-meta')) and not entry.name.startswith('.'):
+                stray_dirs.append({'path': entry.path, 'size': sum(scan_inodes(entry.path).values())})
+
+    all_inodes = dict(pkgs_inodes)
+    for inodes in env_inode_maps: all_inodes.update(inodes)
+    return {'generated': time.strftime('%Y-%m-%d %H:%M:%S'), 'envs': envs, 'packages': packages, 'stray_dirs': stray_dirs,
+            'pkgs_total': sum(pkgs_inodes.values()), 'total': sum(all_inodes.values()),
+            'reclaimable_pkgs': sum(p['size'] for p in packages if p['orphan'])}
+
+def get_env_size_labels(env_names):
+    """
+    Returns {env_name: 'size label'} for a list of envs, e.g. for delete prompts: the bytes
+    deleting each env frees (hardlinks into the package cache or other envs not counted),
+    from the per-prefix cache; no package cache scan. SILENT.
+    """
+    by_name = {r['name']: r for r in conda_manager.get_env_index()}
+    records = [by_name[name] for name in env_names if name in by_name and not by_name[name].get('is_base')]
+    if not records: return {}
+    with ThreadPoolExecutor(max_workers=min(16, len(records))) as pool:
+        usages = list(pool.map(lambda r: get_prefix_usage(r['prefix']), records))
+    return {r['name']: f"删除可释放 {format_size(reclaimable)}" for r, (_, reclaimable) in zip(records, usages)}
+
+def run_disk_usage_view():
+    """Menu action: prints per-env unique bytes and reclaimable package-cache orphans."""
+    print("正在并行统计环境与包缓存的磁盘占用 (硬链接只计一次)...")
+    start = time.perf_counter(); report = analyze_disk_usage()
+    print(f"\n{'环境':<28}{'文件总计':>12}{'与包缓存共享':>14}{'与其他环境共享':>16}{'独占 (可释放)':>16}")
+    for env in sorted(report['envs'], key=lambda e: e['unique'], reverse=True):
+        name = env['name'] + (" (模板)" if conda_manager.is_pool_env(env['name']) else "")
+        print(f"{name:<28}{format_size(env['apparent']):>12}{format_size(env['shared_pkgs']):>14}{format_size(env['shared_envs']):>16}{format_size(env['unique']):>16}")
+    orphans = sorted((p for p in report['packages'] if p['orphan']), key=lambda p: p['size'], reverse=True)
+    print(f"\n包缓存: {format_size(report['pkgs_total'])}，其中未被任何环境引用 (可回收): {format_size(report['reclaimable_pkgs'])} ({len(orphans)} 项)")
+    for package in orphans[:15]: print(f"  - {os.path.basename(package['path'])}: {format_size(package['size'])}{' (安装包归档)' if package['archive'] else ''}")
+    if len(orphans) > 15: print(f"  ... 另有 {len(orphans) - 15} 项")
+    if orphans: print("  提示: 可运行 'conda clean --packages --tarballs' 回收这些空间。")
+    for stray in report['stray_dirs']: print(f"残留目录 (非 conda 环境): {stray['path']} ({format_size(stray['size'])})")
+    print(f"\n实际磁盘占用合计: {format_size(report['total'])} (用时 {time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,109 @@
+# global_tools/env_audit.py
+import os
+import time
+import glob
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import conda_manager
+from . import package_index
+
+AUDIT_REPORT_FILE_NAME = "env_audit_report.json"
+MAX_LISTED_PATHS = 20 # Per problem type in the report; counts are always complete
+STATUS_OK, STATUS_WARNING, STATUS_ERROR = 'ok', 'warning', 'error'
+STATUS_LABELS = {STATUS_OK: "正常", STATUS_WARNING: "警告", STATUS_ERROR: "异常"}
+
+def _check_python(prefix, version):
+    """True if the interpreter recorded in conda-meta exists on disk (or the env has no python)."""
+    if not version: return True
+    if utils.is_windows(): return os.path.exists(os.path.join(prefix, 'python.exe'))
+    major_minor = '.'.join(version.split('.')[:2])
+    return os.path.exists(os.path.join(prefix, 'bin', f'python{major_minor}'))
+
+def _check_conda_files(prefix):
+    """
+    Stats every file listed in conda-meta/*.json. Returns (missing, broken_symlinks, size_mismatch, checked).
+    Sizes are compared only where paths_data matches the installed path (noarch
+    packages record pre-link paths) and the prefix was not rewritten at install time.
+    """
+    missing, broken, mismatched = [], [], []; checked = 0
+    for json_path in glob.glob(os.path.join(prefix, 'conda-meta', '*.json')):
+        data = utils.load_json_file(json_path) or {}
+        path_data = {e.get('_path') or e.get('path'): e for e in (data.get('paths_data') or {}).get('paths', [])}
+        for rel_path in data.get('files', []):
+            full_path = os.path.join(prefix, rel_path); checked += 1
+            if not os.path.lexists(full_path): missing.append(rel_path); continue
+            try: st = os.stat(full_path)
+            except OSError: broken.append(rel_path); continue
+            entry = path_data.get(rel_path) or {}
+            expected = entry.get('size_in_bytes')
+            if expected is not None and not entry.get('prefix_placeholder') and entry.get('path_type') == 'hardlink' \
+                    and not os.path.islink(full_path) and st.st_size != expected: mismatched.append(rel_path)
+    return missing, broken, mismatched, checked
+
+def _check_pip_records(prefix):
+    """Returns files listed in RECORD of pip-installed distributions that no longer exist."""
+    missing = []
+    for site_packages in package_index.get_site_packages_dirs(prefix):
+        for record_path in glob.glob(os.path.join(site_packages, '*.dist-info', 'RECORD')):
+            dist_info = os.path.dirname(record_path)
+            try:
+                with open(os.path.join(dist_info, 'INSTALLER'), 'r', encoding='utf-8') as f:
+                    if f.read().strip() == 'conda': continue # Already covered by conda-meta
+            except OSError: pass
+            try:
+                with open(record_path, 'r', encoding='utf-8', errors='replace') as f: lines = f.read().splitlines()
+            except OSError: continue
+            for line in lines:
+                rel_path = line.split(',', 1)[0]
+                if not rel_path or rel_path.endswith('.pyc'): continue
+                if not os.path.lexists(os.path.normpath(os.path.join(site_packages, rel_path))): missing.append(f"{os.path.basename(dist_info)}: {rel_path}")
+    return missing
+
+def audit_env(record):
+    """Audits one env from metadata only (no conda subprocess). Returns a report dict."""
+    prefix = record['prefix']; start = time.perf_counter()
+    report = {'name': record['name'], 'prefix': prefix, 'python': record.get('python'), 'issues': []}
+    if not os.path.isdir(os.path.join(prefix, 'conda-meta')):
+        report.update(status=STATUS_ERROR, issues=["缺少 conda-meta 目录"]); return report
+    report['python_ok'] = _check_python(prefix, record.get('python'))
+    missing, broken, mismatched, checked = _check_conda_files(prefix)
+    pip_missing = _check_pip_records(prefix)
+    overlap = sorted(r['name'] for r in package_index.get_package_index(prefix).values() if r.get('source') == 'conda+pip')
+    report.update(files_checked=checked, missing_files=missing[:MAX_LISTED_PATHS], missing_count=len(missing),
+                  broken_symlinks=broken[:MAX_LISTED_PATHS], broken_symlink_count=len(broken),
+                  size_mismatch=mismatched[:MAX_LISTED_PATHS], size_mismatch_count=len(mismatched),
+                  pip_missing_files=pip_missing[:MAX_LISTED_PATHS], pip_missing_count=len(pip_missing),
+                  pip_conda_overlap=overlap)
+    if not report['python_ok']: report['issues'].append(f"Python {record.get('python')} 解释器缺失")
+    if missing: report['issues'].append(f"{len(missing)} 个 conda 文件缺失")
+    if broken: report['issues'].append(f"{len(broken)} 个失效的符号链接")
+    if pip_missing: report['issues'].append(f"{len(pip_missing)} 个 pip 文件缺失")
+    if mismatched: report['issues'].append(f"{len(mismatched)} 个文件大小与记录不符 (可能被修改)")
+    if overlap: report['issues'].append(f"pip 覆盖了 conda 包: {', '.join(overlap)}")
+    errors = not report['python_ok'] or missing or broken or pip_missing
+    report['status'] = STATUS_ERROR if errors else (STATUS_WARNING if report['issues'] else STATUS_OK)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+def audit_all_envs(max_workers=None):
+    """Audits every env (including base) concurrently. Returns the report list in index order."""
+    records = conda_manager.get_env_index(use_cache=False)
+    records = [r for r in records if not conda_manager.is_pool_env(r['name'])]
+    if not records: return []
+    with ThreadPoolExecutor(max_workers=max_workers or min(16, len(records))) as pool:
+        return list(pool.map(audit_env, records))
+
+def run_env_audit():
+    """Menu action: audits all envs, prints a summary and writes the JSON report to the cache dir."""
+    print("正在并行检查所有环境 (仅读取元数据，不调用 conda)...")
+    start = time.perf_counter()
+    reports = audit_all_envs()
+    if not reports: print("未找到任何环境。"); return
+    for report in reports:
+        print(f"  [{STATUS_LABELS[report['status']]}] {report['name']} (Python {report.get('python') or '-'})")
+        for issue in report['issues']: print(f"      - {issue}")
+    report_path = utils.get_cache_dir() / AUDIT_REPORT_FILE_NAME
+    utils.save_json_file(report_path, {'generated': time.strftime('%Y-%m-%d %H:%M:%S'), 'envs': reports})
+    problems = sum(1 for r in reports if r['status'] != STATUS_OK)
+    print(f"\n检查完成: {len(reports)} 个环境, {problems} 个存在问题 (用时 {time.perf_counter() - start:.1f}s)。")
+    print(f"详细报告 (JSON): {report_path}")
@@ -0,0 +1,114 @@
+# global_tools/env_backup.py
+import os
+import sys
+import time
+import fnmatch
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import conda_manager
+from . import conda_backend
+from . import package_index
+
+BACKUP_DIR_NAME = "env_backups"
+BACKUP_INDEX_FILE_NAME = "index.json"
+BACKUP_INDEX_VERSION = 1
+DEFAULT_MAX_WORKERS = 4 # Each export is a conda process; more only thrashes the disk
+
+def get_backup_dir():
+    """[Backup] Directory, defaulting to env_backups in the tool cache dir. SILENT."""
+    value = utils.get_config_value("Backup", "Directory", "")
+    return os.path.abspath(os.path.expanduser(value)) if value else str(utils.get_cache_dir() / BACKUP_DIR_NAME)
+
+def get_backup_max_workers():
+    try: return max(1, int(utils.get_config_value("Backup", "MaxWorkers", str(DEFAULT_MAX_WORKERS))))
+    except ValueError: return DEFAULT_MAX_WORKERS
+
+def select_envs(pattern=None):
+    """Env records (base included, pool templates excluded) whose name matches a glob, case-insensitive. SILENT."""
+    records = [r for r in conda_manager.get_env_index(use_cache=False) if not conda_manager.is_pool_env(r['name'])]
+    if not pattern or pattern == '*': return records
+    patterns = [p.strip().lower() for p in pattern.split(',') if p.strip()]
+    return [r for r in records if any(fnmatch.fnmatchcase(r['name'].lower(), p) for p in patterns)]
+
+def export_env_to_file(record, output_path):
+    """
+    Streams `conda env export` straight into output_path (via a temp file, so an
+    interrupted export never replaces the previous backup). Returns None on success or an error message.
+    """
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    command = conda_backend.build_command(['env', 'export', '-p', record['prefix'], '--no-builds'])
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            result = subprocess.run(command, stdout=f, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            os.remove(tmp_path); error_lines = (result.stderr or '').strip().splitlines()
+            return error_lines[-1] if error_lines else f"返回码 {result.returncode}"
+        os.replace(tmp_path, output_path)
+    except OSError as e:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        return str(e)
+    return None
+
+def get_pip_state_mtime(prefix):
+    """
+    Latest mtime of the env's site-packages dirs. pip install/uninstall adds or
+    removes *.dist-info entries there without touching conda-meta/history. SILENT.
+    """
+    mtimes = [utils.get_path_mtime(d) for d in package_index.get_site_packages_dirs(prefix)]
+    return max((m for m in mtimes if m is not None), default=None)
+
+def backup_envs(records, backup_dir, max_workers=None, force=False):
+    """
+    Exports records concurrently into backup_dir/<env>.yml and updates index.json.
+    Envs whose conda-meta/history and site-packages mtimes match the index are skipped unless force.
+    Returns {'exported', 'skipped', 'failed': {name: error}}.
+    """
+    utils.ensure_dir_exists(backup_dir); index_path = os.path.join(backup_dir, BACKUP_INDEX_FILE_NAME)
+    index = utils.load_json_file(index_path)
+    if not isinstance(index, dict) or index.get('version') != BACKUP_INDEX_VERSION: index = {'version': BACKUP_INDEX_VERSION, 'envs': {}}
+    summary = {'exported': [], 'skipped': [], 'failed': {}}; todo = []
+    for record in records:
+        file_name = f"{record['name']}_environment.yml"
+        history_mtime = utils.get_path_mtime(os.path.join(record['prefix'], 'conda-meta', 'history'))
+        state = {'history_mtime': history_mtime, 'pip_mtime': get_pip_state_mtime(record['prefix'])}
+        entry = index['envs'].get(record['name'])
+        if not force and entry and all(entry.get(k) == v for k, v in state.items()) and 'pip_mtime' in entry \
+                and entry.get('prefix') == record['prefix'] and os.path.exists(os.path.join(backup_dir, entry['file'])):
+            summary['skipped'].append(record['name']); continue
+        todo.append((record, file_name, state))
+
+    def run(item):
+        record, file_name, state = item; start = time.perf_counter()
+        return item, export_env_to_file(record, os.path.join(backup_dir, file_name)), time.perf_counter() - start
+    if todo:
+        with ThreadPoolExecutor(max_workers=min(max_workers or get_backup_max_workers(), len(todo))) as pool:
+            for (record, file_name, state), error, seconds in pool.map(run, todo):
+                if error: summary['failed'][record['name']] = error; continue
+                index['envs'][record['name']] = {'file': file_name, 'prefix': record['prefix'], 'python': record.get('python'),
+                                                 **state, 'exported': time.strftime('%Y-%m-%d %H:%M:%S'),
+                                                 'seconds': round(seconds, 2)}
+                summary['exported'].append(record['name'])
+    index['generated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    utils.save_json_file(index_path, index)
+    return summary
+
+# --- Menu Action ---
+def run_bulk_backup():
+    """Menu action: asks for a name pattern and target dir, then backs up the matching envs."""
+    pattern = utils.get_user_input("请输入要备份的环境名称 (支持通配符, 逗号分隔)", default="*")
+    if not pattern: print("操作取消。"); return
+    records = select_envs(pattern)
+    if not records: print(f"没有匹配 '{pattern}' 的环境。"); return
+    backup_dir = utils.get_user_input("请输入备份目录", default=get_backup_dir())
+    if not backup_dir: print("操作取消。"); return
+    if os.path.abspath(os.path.expanduser(backup_dir)) != get_backup_dir(): utils.set_config_value("Backup", "Directory", backup_dir)
+    backup_dir = os.path.abspath(os.path.expanduser(backup_dir))
+    print(f"正在并行导出 {len(records)} 个环境 (最多 {get_backup_max_workers()} 个同时进行)...")
+    start = time.perf_counter()
+    summary = backup_envs(records, backup_dir)
+    for name in summary['exported']: print(f"  [已导出] {name}")
+    for name in summary['skipped']: print(f"  [未变化, 跳过] {name}")
+    for name, error in summary['failed'].items(): print(f"  [失败] {name}: {error}", file=sys.stderr)
+    print(f"\n备份完成 (用时 {time.perf_counter() - start:.1f}s)。索引文件: {os.path.join(backup_dir, BACKUP_INDEX_FILE_NAME)}")
@@ -0,0 +1,178 @@
+# global_tools/env_gc.py
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import conda_manager
+from . import conda_backend
+from . import project_detector
+from . import disk_usage
+
+ASSOCIATIONS_FILE_NAME = "env_associations.json"
+DEFAULT_SCAN_DEPTH = 3
+# Never descended into while looking for projects
+SKIP_DIR_NAMES = {'node_modules', '__pycache__', 'site-packages', 'venv', '.venv', 'env', 'dist', 'build', 'target'}
+
+# --- Project <-> Env Associations ---
+# {normcased project root: {'env': name, 'last_used': epoch}}, written whenever the
+# tool opens a project whose env exists or creates an env for it.
+def load_associations():
+    """The recorded associations (format above); also used by workspace_index. SILENT."""
+    data = utils.load_json_file(utils.get_cache_dir() / ASSOCIATIONS_FILE_NAME)
+    return data if isinstance(data, dict) else {}
+
+def record_env_association(project_root, env_name):
+    """Remembers that project_root uses env_name (also its last-used time). SILENT."""
+    if not project_root or not env_name: return
+    associations = load_associations()
+    associations[os.path.normcase(os.path.abspath(project_root))] = {'env': env_name, 'last_used': time.time()}
+    utils.save_json_file(utils.get_cache_dir() / ASSOCIATIONS_FILE_NAME, associations)
+
+# --- Workspace Scanning ---
+def get_workspace_roots():
+    """[GC] WorkspaceRoots: directories separated by os.pathsep. SILENT."""
+    value = utils.get_config_value("GC", "WorkspaceRoots", "")
+    return [os.path.abspath(os.path.expanduser(p.strip())) for p in value.split(os.pathsep) if p.strip()]
+
+def get_scan_depth():
+    try: return max(1, int(utils.get_config_value("GC", "ScanDepth", str(DEFAULT_SCAN_DEPTH))))
+    except ValueError: return DEFAULT_SCAN_DEPTH
+
+def list_subdirs(path):
+    """Sorted subdirectories a workspace walk descends into (no symlinks, dot dirs or SKIP_DIR_NAMES). Raises OSError."""
+    with os.scandir(path) as it:
+        return sorted(e.path for e in it if e.is_dir(follow_symlinks=False) and not e.name.startswith('.') and e.name not in SKIP_DIR_NAMES)
+
+def walk_workspace(roots, depth, visit, max_workers=None):
+    """
+    The bounded-depth walk shared by orphan GC and workspace_index. A root itself is
+    never visited (a workspace with a stray package.json must not hide its children);
+    each first-level subdirectory is one pool task, so large roots are walked in parallel.
+    visit(path, remaining, root) returns (result or None, child dirs to descend into);
+    children are followed while remaining > 0. Returns the non-None results.
+    """
+    tasks = []
+    for root in roots:
+        if not os.path.isdir(root): print(f"警告: 工作区目录 '{root}' 不存在，已跳过。", file=sys.stderr); continue
+        try: tasks += [(child, root) for child in list_subdirs(root)]
+        except OSError as e: print(f"警告: 无法读取 '{root}': {e}", file=sys.stderr)
+    def run(task):
+        top, root = task; results = []; stack = [(top, depth - 1)]
+        while stack:
+            path, remaining = stack.pop()
+            result, children = visit(path, remaining, root)
+            if result is not None: results.append(result)
+            if remaining > 0 and children: stack.extend((child, remaining - 1) for child in children)
+        return results
+    if not tasks: return []
+    with ThreadPoolExecutor(max_workers=max_workers or min(16, len(tasks))) as pool:
+        return [result for results in pool.map(run, tasks) for result in results]
+
+def scan_workspace_projects(roots, depth=None, max_workers=None):
+    """Finds projects under the workspace roots (see walk_workspace); a detected project is not descended into. Returns [(path, type)]. SILENT."""
+    def visit(path, remaining, root):
+        project_type = project_detector.detect_project_type(path)
+        if project_type != 'unknown': return (path, project_type), None
+        if remaining <= 0: return None, None
+        try: return None, list_subdirs(path)
+        except OSError: return None, None
+    return sorted(set(walk_workspace(roots, depth or get_scan_depth(), visit, max_workers)))
+
+# --- Orphan Detection ---
+def find_orphan_envs(roots=None, max_workers=None):
+    """
+    Maps projects to envs by the default-name rule and recorded associations and
+    returns (orphans, projects): orphans are env records no live project references,
+    each with 'last_used' (latest of association use and conda-meta/history mtime). Base and pool envs are never orphans.
+    """
+    projects = scan_workspace_projects(roots if roots is not None else get_workspace_roots(), max_workers=max_workers)
+    records = conda_manager.get_env_index(use_cache=False)
+    referenced = {utils.get_default_env_name(path).lower() for path, _ in projects}
+    associations = load_associations(); last_used = {}
+    for project_path, entry in associations.items():
+        env_key = str(entry.get('env', '')).lower()
+        last_used[env_key] = max(last_used.get(env_key, 0), entry.get('last_used', 0))
+        if os.path.isdir(project_path): referenced.add(env_key) # Recorded project still exists
+    orphans = []
+    for record in records:
+        key = record['name'].lower()
+        if record.get('is_base') or conda_manager.is_pool_env(record['name']) or key in referenced: continue
+        history_mtime = utils.get_path_mtime(os.path.join(record['prefix'], 'conda-meta', 'history'))
+        used = max(last_used.get(key, 0), (history_mtime or 0) / 1e9)
+        orphans.append(dict(record, last_used=used or None))
+    orphans.sort(key=lambda r: r['last_used'] or 0)
+    return orphans, projects
+
+def delete_envs(records, max_workers=None):
+    """
+    Removes several envs in one pass: each goes through `conda env remove -p` (so
+    pre-unlink scripts and menu/shortcut cleanup run), several at a time, and
+    environments.txt is pruned once at the end, since concurrent conda runs may
+    race on it. Returns names removed.
+    """
+    active_prefix = os.path.normcase(os.path.normpath(os.environ.get('CONDA_PREFIX', '')))
+    targets = [r for r in records if not r.get('is_base') and os.path.normcase(os.path.normpath(r['prefix'])) != active_prefix]
+    def remove(record):
+        try: result = utils.run_command(conda_backend.build_command(['env', 'remove', '-p', record['prefix'], '-y']), verbose=False, shell=False)
+        except Exception as e: print(f"删除 '{record['name']}' 失败: {e}", file=sys.stderr); return None
+        if result.returncode == 0: return record
+        print(f"删除 '{record['name']}' 失败 (返回码: {result.returncode})。", file=sys.stderr); return None
+    if not targets: return []
+    with ThreadPoolExecutor(max_workers=max_workers or min(4, len(targets))) as pool: # Each removal is a conda process
+        removed_records = [r for r in pool.map(remove, targets) if r]
+    removed = [r['name'] for r in removed_records]
+    removed_prefixes = {os.path.normcase(os.path.normpath(r['prefix'])) for r in removed_records}
+    env_txt = conda_manager.get_environments_txt_path()
+    try:
+        with open(env_txt, 'r', encoding='utf-8') as f: lines = f.read().splitlines()
+        kept = [line for line in lines if os.path.normcase(os.path.normpath(line.strip() or '.')) not in removed_prefixes]
+        if len(kept) != len(lines):
+            with open(env_txt, 'w', encoding='utf-8') as f: f.write(''.join(line + '\n' for line in kept))
+    except OSError: pass # Not every install has environments.txt
+    conda_manager.invalidate_env_cache()
+    return removed
+
+def _parse_selection(text, count):
+    """'1,3-5' / 'a' -> sorted 0-based indices; None if invalid."""
+    if text.strip().lower() in ('a', 'all'): return list(range(count))
+    indices = set()
+    for part in text.replace('，', ',').split(','):
+        part = part.strip()
+        if not part: continue
+        start, _, end = part.partition('-')
+        try: first, last = int(start), int(end or start)
+        except ValueError: return None
+        if not 1 <= first <= last <= count: return None
+        indices.update(range(first - 1, last))
+    return sorted(indices)
+
+# --- Menu Action ---
+def run_orphan_env_gc(project_root):
+    """Menu action: lists envs no project references and deletes a selection in one batch."""
+    roots = get_workspace_roots()
+    if not roots:
+        default_root = os.path.dirname(os.path.abspath(project_root))
+        value = utils.get_user_input(f"请输入要扫描的工作区目录 (多个用 '{os.pathsep}' 分隔)", default=default_root)
+        if not value: print("操作取消。"); return
+        utils.set_config_value("GC", "WorkspaceRoots", value); roots = get_workspace_roots()
+    print(f"正在并行扫描工作区: {', '.join(roots)} (深度 {get_scan_depth()})...")
+    start = time.perf_counter()
+    orphans, projects = find_orphan_envs(roots)
+    print(f"发现 {len(projects)} 个项目 (用时 {time.perf_counter() - start:.1f}s)。")
+    if not orphans: print("没有未被任何项目引用的环境。"); return
+    conda_manager.ensure_env_sizes(orphans)
+    print("\n以下环境未被任何项目引用 (最久未使用在前):")
+    for i, record in enumerate(orphans, 1):
+        used = time.strftime('%Y-%m-%d', time.localtime(record['last_used'])) if record['last_used'] else '未知'
+        size = disk_usage.format_size(record['size']) if record.get('size') else '-'
+        print(f"  {i}. {record['name']}  (最后使用: {used}, 大小: {size}, Python {record.get('python') or '-'})")
+    selection = utils.get_user_input("请输入要删除的编号 (如 1,3-5; a=全部; 回车取消)")
+    if not selection: print("操作取消。"); return
+    indices = _parse_selection(selection, len(orphans))
+    if indices is None: print("错误: 编号无效。", file=sys.stderr); return
+    selected = [orphans[i] for i in indices]
+    confirm = utils.get_user_choice(f"警告：确定要永久删除这 {len(selected)} 个环境?", ["否", "是"], 0)
+    if confirm != "是": print("删除操作已取消。"); return
+    removed = delete_envs(selected)
+    print(f"已删除 {len(removed)} 个环境: {', '.join(removed) if removed else '-'}")
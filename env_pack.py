@@ -0,0 +1,186 @@
+# global_tools/env_pack.py
+import io
+import os
+import re
+import sys
+import json
+import time
+import gzip
+import shutil
+import tarfile
+from . import utils
+from . import conda_manager
+from . import archive_engine
+
+PACK_SUFFIX = ".envpack.tar.gz"
+MANIFEST_NAME = ".env_pack/manifest.json"
+PACK_FORMAT_VERSION = 1
+
+# --- Prefix Rewriting ---
+def collect_prefix_files(prefix):
+    """
+    Lists files that embed the env prefix: {rel_path: 'text'|'binary'} from the
+    prefix_placeholder entries of conda-meta/*.json, plus script shebangs (pip entry points).
+    """
+    files = {}
+    meta_dir = os.path.join(prefix, 'conda-meta')
+    for name in os.listdir(meta_dir):
+        if not name.endswith('.json'): continue
+        data = utils.load_json_file(os.path.join(meta_dir, name)) or {}
+        for entry in (data.get('paths_data') or {}).get('paths', []):
+            if entry.get('prefix_placeholder'): files[entry.get('_path') or entry.get('path')] = entry.get('file_mode', 'text')
+    prefix_bytes = prefix.encode('utf-8')
+    for bin_dir in ('bin', 'Scripts'):
+        try: entries = list(os.scandir(os.path.join(prefix, bin_dir)))
+        except OSError: continue
+        for entry in entries:
+            rel_path = f"{bin_dir}/{entry.name}"
+            if rel_path in files or not entry.is_file(follow_symlinks=False): continue
+            try:
+                with open(entry.path, 'rb') as f: head = f.read(512)
+            except OSError: continue
+            if head.startswith(b'#!') and prefix_bytes in head.split(b'\n', 1)[0]: files[rel_path] = 'text'
+    return files
+
+def rewrite_prefix(path, old_prefix, new_prefix, mode):
+    """
+    Replaces old_prefix with new_prefix in one file. Text files are rewritten
+    freely; binary files keep their length (NUL padded C strings, like conda),
+    which requires the new prefix to be no longer than the old one. Returns True if rewritten.
+    """
+    old, new = old_prefix.encode('utf-8'), new_prefix.encode('utf-8')
+    try:
+        with open(path, 'rb') as f: data = f.read()
+    except OSError: return False
+    if old not in data: return False
+    if mode == 'binary':
+        if len(new) > len(old): print(f"警告: 新路径比原路径长，无法改写二进制文件 '{path}'。", file=sys.stderr); return False
+        padding = len(old) - len(new)
+        data = re.sub(re.escape(old) + b'([^\0]*?)\0', lambda m: new + m.group(1) + b'\0' * (padding + 1), data)
+    else: data = data.replace(old, new)
+    st = os.lstat(path)
+    try:
+        os.remove(path) # Break hardlinks into the package cache before writing
+        with open(path, 'wb') as f: f.write(data)
+        os.chmod(path, st.st_mode)
+    except OSError as e: print(f"警告: 改写 '{path}' 失败: {e}", file=sys.stderr); return False
+    return True
+
+# --- Pack / Unpack ---
+def pack_env(prefix, output_path, env_name=None, level=6, max_workers=None):
+    """Writes an env prefix into a relocatable .tar.gz with a prefix manifest. Returns the number of files packed."""
+    prefix = os.path.normpath(prefix)
+    manifest = {'version': PACK_FORMAT_VERSION, 'prefix': prefix, 'env_name': env_name, 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'platform': conda_manager.get_current_conda_subdir(), 'python': conda_manager.get_env_python_version(prefix),
+                'prefix_files': collect_prefix_files(prefix)}
+    count = 0; tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as raw:
+            writer = archive_engine.ParallelGzipWriter(raw, level=level, max_workers=max_workers)
+            with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+                data = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+                info = tarfile.TarInfo(MANIFEST_NAME); info.size = len(data); info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+                for dir_path, dir_names, file_names in os.walk(prefix):
+                    dir_names.sort()
+                    for name in sorted(file_names) + [d for d in dir_names if os.path.islink(os.path.join(dir_path, d))]:
+                        full_path = os.path.join(dir_path, name)
+                        arcname = os.path.relpath(full_path, prefix).replace(os.sep, '/')
+                        try: tar.add(full_path, arcname=arcname, recursive=False); count += 1
+                        except OSError as e: print(f"警告: 跳过 '{arcname}': {e}", file=sys.stderr)
+            writer.close()
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try: os.remove(tmp_path) # Don't leave a partial archive behind (also on Ctrl+C)
+        except OSError: pass
+        raise
+    return count
+
+def read_pack_manifest(archive_path):
+    """Reads the manifest stored as the archive's first member. SILENT."""
+    try:
+        with gzip.open(archive_path, 'rb') as stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                if member.name == MANIFEST_NAME: return json.loads(tar.extractfile(member).read().decode('utf-8'))
+                break
+    except (OSError, tarfile.TarError, ValueError): pass
+    return None
+
+def unpack_env(archive_path, target_prefix):
+    """
+    Extracts a packed env into target_prefix in one streaming pass, rewrites the
+    recorded prefix and registers the env in environments.txt. Works offline. Returns True on success.
+    """
+    target_prefix = os.path.abspath(target_prefix); manifest = None
+    if os.path.exists(target_prefix) and os.listdir(target_prefix): print(f"错误: 目标目录 '{target_prefix}' 非空。", file=sys.stderr); return False
+    utils.ensure_dir_exists(target_prefix)
+    try:
+        # gzip.open reads every member of the parallel-compressed stream (tarfile's own r|gz stops after the first)
+        with gzip.open(archive_path, 'rb') as stream, tarfile.open(fileobj=stream, mode='r|') as tar:
+            for member in tar:
+                if member.name == MANIFEST_NAME: manifest = json.loads(tar.extractfile(member).read().decode('utf-8')); continue
+                if member.name.startswith(('/', '..')) or '/../' in member.name: print(f"警告: 跳过不安全的路径 '{member.name}'。", file=sys.stderr); continue
+                tar.extract(member, target_prefix, set_attrs=True, **({'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}))
+    except BaseException:
+        shutil.rmtree(target_prefix, ignore_errors=True) # The prefix was empty before; drop the partial env
+        raise
+    if not manifest:
+        print("错误: 归档中缺少环境清单，可能不是由本工具打包的。", file=sys.stderr)
+        shutil.rmtree(target_prefix, ignore_errors=True); return False
+    if manifest.get('platform') != conda_manager.get_current_conda_subdir():
+        print(f"警告: 环境打包于 {manifest.get('platform')}，当前平台为 {conda_manager.get_current_conda_subdir()}。", file=sys.stderr)
+    old_prefix = manifest['prefix']; rewritten = 0
+    if old_prefix != target_prefix:
+        for rel_path, mode in manifest.get('prefix_files', {}).items():
+            if rewrite_prefix(os.path.join(target_prefix, rel_path), old_prefix, target_prefix, mode): rewritten += 1
+    print(f"已改写 {rewritten} 个包含原路径的文件。")
+    _register_env_prefix(target_prefix)
+    return True
+
+def _register_env_prefix(prefix):
+    """Appends a prefix to ~/.conda/environments.txt so conda lists it."""
+    env_txt = conda_manager.get_environments_txt_path()
+    try:
+        utils.ensure_dir_exists(os.path.dirname(env_txt))
+        with open(env_txt, 'a+', encoding='utf-8') as f:
+            f.seek(0)
+            if prefix in (line.strip() for line in f): return
+            f.write(prefix + '\n')
+    except OSError as e: print(f"警告: 无法登记环境路径: {e}", file=sys.stderr)
+    conda_manager.invalidate_env_cache()
+
+# --- Menu Actions ---
+def pack_env_interactive(project_root):
+    """Asks for an env and writes <env>.envpack.tar.gz into the project directory."""
+    envs = conda_manager.list_conda_envs(use_cache=False)
+    if not envs: print("没有找到可打包的环境。"); return
+    default_env = conda_manager.find_env_by_name(utils.get_default_env_name(project_root))
+    env_name = utils.get_user_choice("请选择要打包的环境:", envs, envs.index(default_env) if default_env in envs else None)
+    if not env_name: print("未选择环境。"); return
+    output_path = utils.get_user_input("请输入输出文件路径", default=os.path.join(project_root, f"{env_name}{PACK_SUFFIX}"))
+    if not output_path: print("操作取消。"); return
+    print(f"正在打包环境 '{env_name}' (多线程压缩)...")
+    start = time.perf_counter()
+    try: count = pack_env(conda_manager.get_env_prefix(env_name), output_path, env_name=env_name)
+    except Exception as e: print(f"打包失败: {e}", file=sys.stderr); return
+    size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    print(f"已打包 {count} 个文件到 '{output_path}' ({size_mb:.1f} MB, 用时 {time.perf_counter() - start:.1f}s)。")
+
+def unpack_env_interactive(project_root):
+    """Restores a packed env under the first envs dir (or a custom prefix)."""
+    archive_path = utils.get_user_input("请输入打包文件路径")
+    if not archive_path or not os.path.exists(archive_path): print("错误: 文件不存在。", file=sys.stderr); return
+    manifest = read_pack_manifest(archive_path)
+    if not manifest: print("错误: 无法读取打包清单。", file=sys.stderr); return
+    env_name = utils.get_user_input("请输入恢复后的环境名称", default=manifest.get('env_name') or utils.get_default_env_name(project_root))
+    if not env_name: print("操作取消。"); return
+    if conda_manager.find_env_by_name(env_name, use_cache=False): print(f"错误: 环境 '{env_name}' 已存在。", file=sys.stderr); return
+    envs_dirs = conda_manager.get_envs_dirs()
+    default_prefix = os.path.join(envs_dirs[0], env_name) if envs_dirs else os.path.abspath(env_name)
+    target_prefix = utils.get_user_input("请输入恢复位置", default=default_prefix)
+    if not target_prefix: print("操作取消。"); return
+    print(f"正在恢复 '{env_name}' (Python {manifest.get('python') or '?'}) 到 '{target_prefix}'...")
+    start = time.perf_counter()
+    try: success = unpack_env(archive_path, target_prefix)
+    except Exception as e: print(f"恢复失败: {e}", file=sys.stderr); return
+    if success: print(f"环境已恢复 (用时 {time.perf_counter() - start:.1f}s)，无需联网或求解。")
@@ -0,0 +1,124 @@
+# global_tools/env_runner.py
+import os
+import sys
+import glob
+import shutil
+import subprocess
+from . import utils
+from . import conda_manager
+
+# Activated environments keyed by prefix: {prefix: (validation_key, env_dict)}
+_activation_cache = {}
+
+EXECUTION_MODES = ('direct', 'conda_run')
+
+def get_execution_mode():
+    """'direct' (exec from <prefix>/bin with a cached activated env, default) or 'conda_run'."""
+    mode = utils.get_config_value("Execution", "Mode", "direct").strip().lower()
+    return mode if mode in EXECUTION_MODES else 'direct'
+
+def get_env_bin_dirs(prefix):
+    """Directories `conda activate` puts on PATH for a prefix, in order."""
+    if utils.is_windows():
+        return [prefix, os.path.join(prefix, 'Library', 'mingw-w64', 'bin'), os.path.join(prefix, 'Library', 'usr', 'bin'),
+                os.path.join(prefix, 'Library', 'bin'), os.path.join(prefix, 'Scripts'), os.path.join(prefix, 'bin')]
+    return [os.path.join(prefix, 'bin')]
+
+def _get_activate_scripts(prefix):
+    """Lists the env's activate.d scripts for the current platform, in the order conda runs them."""
+    pattern = '*.bat' if utils.is_windows() else '*.sh'
+    return sorted(glob.glob(os.path.join(prefix, 'etc', 'conda', 'activate.d', pattern)))
+
+def _read_state_env_vars(prefix):
+    """Reads variables set with `conda env config vars set` (conda-meta/state). SILENT."""
+    data = utils.load_json_file(os.path.join(prefix, 'conda-meta', 'state'), default={})
+    env_vars = data.get('env_vars', {}) if isinstance(data, dict) else {}
+    return {str(k): str(v) for k, v in env_vars.items()}
+
+def _activation_key(prefix, scripts):
+    """Changes whenever anything that influences activation changes."""
+    watched = [os.path.join(prefix, 'conda-meta', 'state'), os.path.join(prefix, 'etc', 'conda', 'activate.d')] + scripts
+    return tuple((path, utils.get_path_mtime(path)) for path in watched)
+
+def _source_activate_scripts(scripts, base_env):
+    """Runs activate.d scripts once in a shell and returns the variables they changed. SILENT."""
+    try:
+        if utils.is_windows():
+            calls = ' && '.join(f'call "{script}"' for script in scripts)
+            result = subprocess.run(f'{calls} && set', shell=True, capture_output=True, text=True, errors='replace', env=base_env)
+            lines = result.stdout.splitlines()
+        else:
+            # Source every script, then dump the environment NUL-separated so values may contain newlines
+            shell_cmd = 'for f in "$@"; do . "$f"; done; env -0'
+            result = subprocess.run(['bash', '-c', shell_cmd, 'activate'] + scripts, capture_output=True, env=base_env)
+            lines = result.stdout.decode('utf-8', errors='replace').split('\0')
+        if result.returncode != 0:
+            print(f"警告: 执行 activate.d 脚本失败 (返回码 {result.returncode})，将忽略这些脚本。", file=sys.stderr); return {}
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"警告: 无法执行 activate.d 脚本: {e}", file=sys.stderr); return {}
+    changed = {}
+    for line in lines:
+        key, sep, value = line.partition('=')
+        if sep and key and base_env.get(key) != value: changed[key] = value
+    return changed
+
+def build_activated_env(prefix, env_name=None):
+    """
+    Builds (and caches) the environment `conda activate` would produce for a prefix:
+    PATH, CONDA_PREFIX/CONDA_DEFAULT_ENV, `conda env config vars` and activate.d variables.
+    Returns a fresh dict each call so callers may modify it.
+    """
+    scripts = _get_activate_scripts(prefix)
+    key = _activation_key(prefix, scripts)
+    cached = _activation_cache.get(prefix)
+    if cached and cached[0] == key: return dict(cached[1])
+
+    env = dict(os.environ)
+    env['PATH'] = os.pathsep.join(get_env_bin_dirs(prefix) + [env.get('PATH', '')])
+    env['CONDA_PREFIX'] = prefix
+    env['CONDA_DEFAULT_ENV'] = env_name or os.path.basename(prefix)
+    env['CONDA_PROMPT_MODIFIER'] = f"({env['CONDA_DEFAULT_ENV']}) "
+    env['CONDA_SHLVL'] = str(int(env.get('CONDA_SHLVL', '0') or 0) + 1)
+    env.pop('PYTHONHOME', None)
+    env.update(_read_state_env_vars(prefix))
+    if scripts: env.update(_source_activate_scripts(scripts, env))
+    _activation_cache[prefix] = (key, env)
+    return dict(env)
+
+def build_conda_run_command(env_name, args):
+    """The legacy `conda run` wrapping of a command."""
+    return ['conda', 'run', '-n', env_name, '--no-capture-output'] + list(args)
+
+def build_prefix_command(prefix, args, env_name=None):
+    """
+    Resolves args[0] inside the env prefix. Returns (command, env) ready for
+    subprocess, or (None, None) if the executable is not in the env's own bin
+    dirs; the inherited PATH is not searched, so a missing pip never resolves to
+    another interpreter's (callers then fall back to `conda run`).
+    """
+    executable = shutil.which(args[0], path=os.pathsep.join(get_env_bin_dirs(prefix)))
+    if not executable: return None, None
+    return [executable] + list(args[1:]), build_activated_env(prefix, env_name)
+
+def build_env_command(env_name, args):
+    """
+    Returns (command, env) for running args inside env_name. Uses direct prefix
+    execution when possible and falls back to `conda run` otherwise. SILENT.
+    """
+    if get_execution_mode() == 'direct':
+        prefix = conda_manager.get_env_prefix(env_name)
+        if prefix:
+            command, env = build_prefix_command(prefix, args, env_name)
+            if command: return command, env
+    return build_conda_run_command(env_name, args), None
+
+def run_in_env(env_name, args, cwd=None, check=False, capture_output=False, verbose=True, stream=False):
+    """Runs a command inside a Conda env (see build_env_command) via utils.run_command."""
+    command, env = build_env_command(env_name, args)
+    return utils.run_command(command, cwd=cwd, check=check, capture_output=capture_output, env=env, shell=False, verbose=verbose, stream=stream)
+
+def run_in_prefix(prefix, args, cwd=None, check=False, capture_output=False, verbose=True):
+    """Like run_in_env, but for an env given by prefix (unnamed envs, or names shared by several prefixes)."""
+    command, env = build_prefix_command(prefix, args) if get_execution_mode() == 'direct' else (None, None)
+    if not command: command = ['conda', 'run', '-p', prefix, '--no-capture-output'] + list(args)
+    return utils.run_command(command, cwd=cwd, check=check, capture_output=capture_output, env=env, shell=False, verbose=verbose)
@@ -5,6 +5,7 @@ import os
 import subprocess
 import traceback
 from . import utils # Import utils from the same package
+from . import env_runner
 
 def open_docs_in_browser():
     """
@@ -86,9 +87,9 @@ def run_fastapi_dev_server(project_root, env_name):
     if use_reload:
         uvicorn_cmd_list.append("--reload")
 
-    conda_run_cmd = ['conda', 'run', '-n', env_name, '--no-capture-output'] + uvicorn_cmd_list
+    run_cmd, run_env = env_runner.build_env_command(env_name, uvicorn_cmd_list)
 
-    print(f"\n准备执行命令: {' '.join(conda_run_cmd)}")
+    print(f"\n准备执行命令: {' '.join(run_cmd)}")
     print(f"在环境 '{env_name}' 中启动服务器...")
     print("提示: 按 Ctrl+C 停止服务器。")
     print("-" * 30)
@@ -97,7 +98,7 @@ def run_fastapi_dev_server(project_root, env_name):
     try:
         # Run silently to show live server output directly
         # Use shell=False
-        utils.run_command(conda_run_cmd, cwd=project_root, check=False, capture_output=False, verbose=False, shell=False)
+        utils.run_command(run_cmd, cwd=project_root, check=False, capture_output=False, env=run_env, verbose=False, shell=False)
         print("-" * 30)
         print("服务器已停止。") # Message after server exits normally (e.g., non-reload mode)
 
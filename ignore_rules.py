@@ -0,0 +1,119 @@
+# global_tools/ignore_rules.py
+import os
+import re
+
+# Compiled ignore files keyed by path: {path: (mtime_ns, rules)}
+_compiled_cache = {}
+
+def _glob_to_regex(pattern):
+    """Translates one gitignore glob (without leading '!' or trailing '/') to a regex body."""
+    regex = []; i = 0; n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 3] == '**/': regex.append('(?:.*/)?'); i += 3; continue
+            if pattern[i:i + 2] == '**': regex.append('.*'); i += 2; continue
+            regex.append('[^/]*')
+        elif c == '?': regex.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1: regex.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end].replace('\\', '\\\\')
+                if body.startswith('!'): body = '^' + body[1:]
+                regex.append(f'[{body}]'); i = end
+        elif c == '\\' and i + 1 < n: regex.append(re.escape(pattern[i + 1])); i += 1
+        else: regex.append(re.escape(c))
+        i += 1
+    return ''.join(regex)
+
+def compile_ignore_lines(lines):
+    """
+    Compiles gitignore-style lines into rules: (regex, negated, dir_only).
+    Patterns with a slash (other than a trailing one) are anchored to the
+    ignore file's directory; others match at any depth.
+    """
+    rules = []
+    for raw in lines:
+        line = raw.rstrip('\n').rstrip('\r')
+        if not line.strip() or line.startswith('#'): continue
+        if not line.endswith('\\ '): line = line.rstrip() # Trailing spaces are ignored unless escaped
+        negated = line.startswith('!')
+        if negated: line = line[1:]
+        elif line.startswith('\\'): line = line[1:] # Escaped leading '!' or '#'
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line: continue
+        anchored = '/' in line
+        body = _glob_to_regex(line.lstrip('/'))
+        # The optional tail lets a directory rule also match everything below it
+        regex = re.compile(('^' if anchored else '^(?:.*/)?') + body + '(?P<tail>/.*)?$')
+        rules.append((regex, negated, dir_only))
+    return rules
+
+def load_ignore_file(path):
+    """Compiles an ignore file once; recompiles only when its mtime changes. SILENT."""
+    try: mtime = os.stat(path).st_mtime_ns
+    except OSError: return []
+    cached = _compiled_cache.get(path)
+    if cached and cached[0] == mtime: return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f: rules = compile_ignore_lines(f)
+    except OSError: rules = []
+    _compiled_cache[path] = (mtime, rules)
+    return rules
+
+def match_rules(rule_sets, rel_path, is_dir):
+    """
+    Applies rule sets ([(base_rel_dir, rules)], outermost first) to a '/'-separated
+    path relative to the walk root. Returns True (ignored), False (re-included) or None (no rule matched).
+    """
+    result = None
+    for base, rules in rule_sets:
+        if base:
+            if not rel_path.startswith(base + '/'): continue
+            local_path = rel_path[len(base) + 1:]
+        else: local_path = rel_path
+        for regex, negated, dir_only in rules:
+            match = regex.match(local_path)
+            if not match or (dir_only and not is_dir and not match.group('tail')): continue
+            result = not negated
+    return result
+
+def walk_files(root, exclude_dir_names=(), ignore_file_names=('.gitignore',), extra_rules=None, suffixes=None):
+    """
+    Walks root with os.scandir, pruning excluded and ignored directories before
+    descending. Ignore files found in any directory apply to that subtree.
+    Yields (rel_path, os.DirEntry) for regular files and symlinks to files (never
+    descending into or yielding symlinked directories), rel_path '/'-separated.
+    """
+    exclude_dir_names = set(exclude_dir_names)
+    base_rules = [('', extra_rules)] if extra_rules else []
+    stack = [(root, '', base_rules)]
+    while stack:
+        dir_path, rel_dir, rule_sets = stack.pop()
+        local_rules = []
+        for name in ignore_file_names:
+            rules = load_ignore_file(os.path.join(dir_path, name))
+            if rules: local_rules.extend(rules)
+        if local_rules: rule_sets = rule_sets + [(rel_dir, local_rules)]
+        try:
+            with os.scandir(dir_path) as it: entries = sorted(it, key=lambda e: e.name)
+        except OSError: continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try: is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError: continue
+            if is_dir:
+                if entry.name in exclude_dir_names: continue
+                if rule_sets and match_rules(rule_sets, rel_path, True): continue
+                subdirs.append((entry.path, rel_path, rule_sets))
+            else:
+                try: is_file = entry.is_file() # Skips symlinks to directories and dangling links
+                except OSError: continue
+                if not is_file: continue
+                if suffixes and not entry.name.endswith(suffixes): continue
+                if rule_sets and match_rules(rule_sets, rel_path, False): continue
+                yield rel_path, entry
+        stack.extend(reversed(subdirs)) # Keep a sorted, depth-first order
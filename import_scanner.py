@@ -0,0 +1,101 @@
+# global_tools/import_scanner.py
+import os
+import sys
+import ast
+import sysconfig
+from concurrent.futures import ProcessPoolExecutor
+from . import utils
+from . import ignore_rules
+
+# Directories never scanned, in addition to .gitignore rules
+DEFAULT_IGNORE_DIRS = {'.git', '.hg', '.svn', '.venv', 'venv', 'env', '.env', '.env_assist', 'node_modules', '__pycache__',
+                       '.tox', '.nox', '.mypy_cache', '.pytest_cache', '.ruff_cache', 'build', 'dist', 'site-packages', '.idea', '.vscode'}
+IMPORT_CACHE_FILE_NAME = "import_scan_cache.json"
+IMPORT_CACHE_VERSION = 1
+# Below this many changed files, parsing in-process beats starting a process pool
+PROCESS_POOL_THRESHOLD = 64
+
+def parse_file_imports(path):
+    """
+    Returns (sorted top-level module names imported by a .py file, error or None).
+    Relative imports are skipped. Module-level so it can run in a worker process.
+    """
+    try:
+        with open(path, 'rb') as f: tree = ast.parse(f.read(), filename=path)
+    except (SyntaxError, ValueError) as e: return [], f"语法错误: {e}"
+    except OSError as e: return [], f"读取失败: {e}"
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import): modules.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module: modules.add(node.module.split('.')[0])
+    return sorted(modules), None
+
+def get_stdlib_module_names():
+    """Names of standard-library top-level modules for the running interpreter."""
+    names = set(getattr(sys, 'stdlib_module_names', ())) | set(sys.builtin_module_names)
+    if not getattr(sys, 'stdlib_module_names', None): # Python < 3.10: list the stdlib directory
+        stdlib_dir = sysconfig.get_paths().get('stdlib')
+        try:
+            for entry in os.scandir(stdlib_dir):
+                if entry.name.endswith('.py'): names.add(entry.name[:-3])
+                elif entry.is_dir() and entry.name != 'site-packages': names.add(entry.name)
+            names.update(e.name.split('.')[0] for e in os.scandir(os.path.join(stdlib_dir, 'lib-dynload')))
+        except OSError: pass
+    names.add('__future__')
+    return names
+
+def get_local_module_names(rel_paths):
+    """
+    Top-level names importable from the project root or src/: modules directly
+    there and the first directory below it. Nested names (app/celery.py) are not
+    local: an absolute `import celery` still means the PyPI package.
+    """
+    names = set()
+    for rel_path in rel_paths:
+        parts = rel_path.split('/')
+        if parts[0] == 'src' and len(parts) > 1: parts = parts[1:] # src layout
+        names.add(parts[0][:-3] if len(parts) == 1 else parts[0])
+    return names
+
+def _load_scan_cache(project_root):
+    data = utils.load_json_file(utils.get_project_cache_dir(project_root) / IMPORT_CACHE_FILE_NAME)
+    if isinstance(data, dict) and data.get('version') == IMPORT_CACHE_VERSION: return data.get('files', {})
+    return {}
+
+def scan_project_imports(project_root, max_workers=None):
+    """
+    Scans every .py file of the project (honouring .gitignore and DEFAULT_IGNORE_DIRS)
+    and returns (imports, errors, rel_paths): imports maps module -> sorted files using it.
+    Per-file results are cached by (path, mtime, size); only changed files are re-parsed,
+    across a process pool when there are many of them.
+    """
+    cache = _load_scan_cache(project_root); new_cache = {}; pending = []
+    for rel_path, entry in ignore_rules.walk_files(project_root, exclude_dir_names=DEFAULT_IGNORE_DIRS, suffixes=('.py',)):
+        try: st = entry.stat()
+        except OSError: continue
+        cached = cache.get(rel_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size: new_cache[rel_path] = cached
+        else: new_cache[rel_path] = [st.st_mtime_ns, st.st_size, [], None]; pending.append(rel_path)
+
+    if pending:
+        paths = [os.path.join(project_root, p) for p in pending]
+        if len(pending) < PROCESS_POOL_THRESHOLD: results = map(parse_file_imports, paths)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool: results = list(pool.map(parse_file_imports, paths, chunksize=32))
+        for rel_path, (modules, error) in zip(pending, results): new_cache[rel_path][2:] = [modules, error]
+        print(f"已解析 {len(pending)} 个变更文件 (共 {len(new_cache)} 个 .py 文件)。")
+    if pending or len(new_cache) != len(cache):
+        utils.save_json_file(utils.get_project_cache_dir(project_root) / IMPORT_CACHE_FILE_NAME,
+                             {'version': IMPORT_CACHE_VERSION, 'files': new_cache})
+
+    imports = {}; errors = {}
+    for rel_path, (_, _, modules, error) in new_cache.items():
+        if error: errors[rel_path] = error
+        for module in modules: imports.setdefault(module, []).append(rel_path)
+    return imports, errors, sorted(new_cache)
+
+def find_third_party_imports(project_root, max_workers=None):
+    """Returns ({module: files}, errors) for imports that are neither stdlib nor project-local."""
+    imports, errors, rel_paths = scan_project_imports(project_root, max_workers=max_workers)
+    excluded = get_stdlib_module_names() | get_local_module_names(rel_paths)
+    return {m: files for m, files in sorted(imports.items()) if m not in excluded}, errors
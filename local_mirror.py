@@ -0,0 +1,234 @@
+# global_tools/local_mirror.py
+# A local conda channel plus a pip wheelhouse holding the union of the packages
+# installed in all envs. Layout under [Mirror] Directory:
+#   conda/<subdir>/<fn> + repodata.json, conda/records.json (all known records)
+#   wheels/*.whl|*.tar.gz
+# [Mirror] Mode decides how installs use it: off (default), prefer (mirror first,
+# remote channels/PyPI as fallback) or only (no network at all).
+import os
+import sys
+import time
+import shutil
+import hashlib
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import conda_manager
+from . import package_index
+from . import dependency_manager
+from . import env_runner
+from . import disk_usage
+
+MIRROR_DIR_NAME = "mirror"
+RECORDS_FILE_NAME = "records.json"
+MIRROR_MODES = ('off', 'prefer', 'only')
+REPODATA_FIELDS = ('name', 'version', 'build', 'build_number', 'depends', 'constrains', 'license', 'license_family',
+                   'md5', 'sha256', 'size', 'subdir', 'timestamp', 'noarch', 'track_features', 'features')
+DEFAULT_MAX_WORKERS = 8
+
+def get_mirror_dir():
+    """[Mirror] Directory, defaulting to mirror/ in the tool cache dir. SILENT."""
+    value = utils.get_config_value("Mirror", "Directory", "")
+    return os.path.abspath(os.path.expanduser(value)) if value else str(utils.get_cache_dir() / MIRROR_DIR_NAME)
+
+def get_channel_dir(): return os.path.join(get_mirror_dir(), 'conda')
+def get_wheelhouse_dir(): return os.path.join(get_mirror_dir(), 'wheels')
+
+def get_mirror_mode():
+    mode = utils.get_config_value("Mirror", "Mode", "off").strip().lower()
+    return mode if mode in MIRROR_MODES else 'off'
+
+def _get_max_workers():
+    try: return max(1, int(utils.get_config_value("Mirror", "MaxWorkers", str(DEFAULT_MAX_WORKERS))))
+    except ValueError: return DEFAULT_MAX_WORKERS
+
+# --- Install Arguments ---
+def get_conda_channel_args():
+    """conda args that point an install/create at the local channel for the current mode. SILENT."""
+    mode = get_mirror_mode(); channel_dir = get_channel_dir()
+    if mode == 'off' or not os.path.exists(os.path.join(channel_dir, 'noarch', 'repodata.json')): return []
+    channel = ['-c', Path(channel_dir).as_uri()]
+    return ['--override-channels'] + channel + ['--offline'] if mode == 'only' else channel
+
+def get_pip_args():
+    """pip install args that use the wheelhouse for the current mode. SILENT."""
+    mode = get_mirror_mode(); wheelhouse = get_wheelhouse_dir()
+    if mode == 'off' or not os.path.isdir(wheelhouse): return []
+    return (['--no-index'] if mode == 'only' else []) + ['--find-links', wheelhouse]
+
+# --- Conda Channel ---
+def _repodata_record(data, extracted_dir=None):
+    """Repodata entry for a package: info/repodata_record.json when extracted, else the conda-meta record."""
+    index = utils.load_json_file(os.path.join(extracted_dir, 'info', 'repodata_record.json')) if extracted_dir else None
+    source = dict(data, **index) if isinstance(index, dict) else data
+    record = {k: source[k] for k in REPODATA_FIELDS if source.get(k) not in (None, '')}
+    if record.get('subdir') == 'noarch' and 'noarch' not in record: # conda-meta omits it; linked paths tell python apart
+        record['noarch'] = 'python' if any('site-packages/' in f for f in data.get('files', [])) else 'generic'
+    return record
+
+def collect_env_packages(prefix):
+    """Conda packages of one env: [{'fn', 'url', 'source' (local archive or None), 'record'}]. SILENT."""
+    packages = []; meta_dir = os.path.join(prefix, 'conda-meta')
+    try: names = [n for n in os.listdir(meta_dir) if n.endswith('.json')]
+    except OSError: return packages
+    for name in names:
+        data = utils.load_json_file(os.path.join(meta_dir, name))
+        if not isinstance(data, dict) or not data.get('fn'): continue
+        source = data.get('package_tarball_full_path')
+        if source and not os.path.isfile(source):
+            source = next((p for p in (source + '.conda', source + '.tar.bz2') if os.path.isfile(p)), None)
+        packages.append({'fn': data['fn'], 'url': data.get('url'), 'source': source,
+                         'record': _repodata_record(data, data.get('extracted_package_dir'))})
+    return packages
+
+def collect_cache_packages():
+    """Packages available in the local package caches (same shape as collect_env_packages). SILENT."""
+    packages = []
+    for pkgs_dir in disk_usage.get_pkgs_dirs():
+        for entry in os.scandir(pkgs_dir):
+            data = utils.load_json_file(os.path.join(entry.path, 'info', 'repodata_record.json')) if entry.is_dir() else None
+            if not isinstance(data, dict) or not data.get('fn'): continue
+            archive = os.path.join(pkgs_dir, data['fn'])
+            if os.path.isfile(archive): packages.append({'fn': data['fn'], 'url': data.get('url'), 'source': archive, 'record': _repodata_record(data)})
+    return packages
+
+def _md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''): digest.update(block)
+    return digest.hexdigest()
+
+def _fetch_package(package, channel_dir):
+    """Places one archive in the channel: hardlink/copy from the cache, else download. Returns None or an error."""
+    record = package['record']; target = os.path.join(channel_dir, record.get('subdir') or 'noarch', package['fn'])
+    if os.path.isfile(target) and (not record.get('size') or os.path.getsize(target) == record['size']): return None
+    utils.ensure_dir_exists(os.path.dirname(target)); tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        if package['source']:
+            try: os.link(package['source'], tmp_path)
+            except OSError: shutil.copy2(package['source'], tmp_path)
+        elif package['url']:
+            with urllib.request.urlopen(package['url'], timeout=60) as response, open(tmp_path, 'wb') as f: shutil.copyfileobj(response, f)
+            if record.get('md5') and _md5(tmp_path) != record['md5']: os.remove(tmp_path); return "md5 校验失败"
+        else: return "没有本地归档或下载地址"
+        os.replace(tmp_path, target)
+    except OSError as e:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        return str(e)
+    return None
+
+def index_channel(channel_dir, records):
+    """Writes <subdir>/repodata.json for every record whose archive is in the channel (noarch always exists)."""
+    repodata = {'noarch': {'packages': {}, 'packages.conda': {}}}
+    for fn, record in records.items():
+        subdir = record.get('subdir') or 'noarch'
+        if not os.path.isfile(os.path.join(channel_dir, subdir, fn)): continue
+        key = 'packages.conda' if fn.endswith('.conda') else 'packages'
+        repodata.setdefault(subdir, {'packages': {}, 'packages.conda': {}})[key][fn] = record
+    for subdir, data in repodata.items():
+        utils.ensure_dir_exists(os.path.join(channel_dir, subdir))
+        utils.save_json_file(os.path.join(channel_dir, subdir, 'repodata.json'), dict(data, info={'subdir': subdir}, repodata_version=1))
+    return sum(len(d['packages']) + len(d['packages.conda']) for d in repodata.values())
+
+def build_conda_channel(channel_dir, packages, max_workers=None):
+    """
+    Adds packages to the channel concurrently, merges their records into records.json
+    and regenerates repodata.json. Returns (indexed count, {fn: error}).
+    """
+    utils.ensure_dir_exists(channel_dir)
+    unique = {p['fn']: p for p in packages}
+    with ThreadPoolExecutor(max_workers=max_workers or _get_max_workers()) as pool:
+        errors = {fn: e for fn, e in zip(unique, pool.map(lambda p: _fetch_package(p, channel_dir), unique.values())) if e}
+    records_path = os.path.join(channel_dir, RECORDS_FILE_NAME)
+    records = utils.load_json_file(records_path, default={}) or {}
+    records.update({fn: p['record'] for fn, p in unique.items() if fn not in errors})
+    utils.save_json_file(records_path, records)
+    return index_channel(channel_dir, records), errors
+
+# --- Pip Wheelhouse ---
+def _wheelhouse_keys(wheelhouse):
+    """Normalized 'name==version' of every file already in the wheelhouse."""
+    keys = set()
+    try: names = os.listdir(wheelhouse)
+    except OSError: return keys
+    for name in names:
+        if name.endswith('.whl'): parts = name[:-4].split('-') # Wheel names escape '-' in the project name
+        elif name.endswith(('.tar.gz', '.zip')): parts = name[:-7 if name.endswith('.tar.gz') else -4].rsplit('-', 1) # sdist: name-version
+        else: continue
+        if len(parts) >= 2: keys.add(f"{package_index.normalize_name(parts[0])}=={parts[1]}")
+    return keys
+
+def prefetch_wheels(records, wheelhouse, max_workers=None):
+    """
+    Runs one `pip download --no-deps` per env (in that env by prefix, so wheel tags
+    match) for its pinned pip packages missing from the wheelhouse. A pin is only
+    taken as present once its file is in the wheelhouse; pins whose download failed
+    are retried from the next env that has them. Returns (downloaded env count, {env: error}).
+    """
+    utils.ensure_dir_exists(wheelhouse); present = _wheelhouse_keys(wheelhouse); wanted = []; tried = set()
+    for record in records:
+        pins = {}
+        for line, _ in dependency_manager.collect_pip_pins(record['prefix']):
+            if '==' not in line or ' @ ' in line: continue
+            name, _, version = line.partition('==')
+            pins[f"{package_index.normalize_name(name)}=={version}"] = line
+        if pins: wanted.append((record, pins))
+    def download(job):
+        record, pins = job
+        try:
+            env_runner.run_in_prefix(record['prefix'], ['pip', 'download', '--no-deps', '-d', wheelhouse] + pins, check=True, capture_output=True, verbose=False)
+            return None
+        except Exception as e: return str(e)
+    downloaded = set(); failed = []
+    while True:
+        jobs = []; claimed = set()
+        for record, pins in wanted:
+            keys = [k for k in pins if k not in present and k not in claimed and (record['prefix'], k) not in tried]
+            if not keys: continue
+            claimed.update(keys); tried.update((record['prefix'], k) for k in keys)
+            jobs.append((record, sorted(pins[k] for k in keys), keys))
+        if not jobs: break
+        with ThreadPoolExecutor(max_workers=min(max_workers or _get_max_workers(), len(jobs))) as pool:
+            results = list(pool.map(download, [job[:2] for job in jobs]))
+        present = _wheelhouse_keys(wheelhouse) # Only files that actually arrived count
+        for (record, _, keys), error in zip(jobs, results):
+            if error is None: downloaded.add(record['prefix'])
+            else: failed.append((record, keys, error))
+    return len(downloaded), {record['name']: error for record, keys, error in failed if any(k not in present for k in keys)}
+
+# --- Menu Action ---
+def build_mirror():
+    """Builds/updates the channel and wheelhouse from every env (pool templates included)."""
+    records = conda_manager.get_env_index(use_cache=False)
+    print(f"正在收集 {len(records)} 个环境中的包...")
+    start = time.perf_counter(); packages = []
+    with ThreadPoolExecutor(max_workers=min(16, len(records) or 1)) as pool:
+        for env_packages in pool.map(lambda r: collect_env_packages(r['prefix']), records): packages += env_packages
+    count, errors = build_conda_channel(get_channel_dir(), packages)
+    print(f"conda 通道: {count} 个包已索引 ({get_channel_dir()})")
+    for fn, error in list(errors.items())[:10]: print(f"  [失败] {fn}: {error}", file=sys.stderr)
+    if len(errors) > 10: print(f"  ... 另有 {len(errors) - 10} 个包失败", file=sys.stderr)
+    downloaded, wheel_errors = prefetch_wheels(records, get_wheelhouse_dir())
+    print(f"pip 本地仓库: {len(_wheelhouse_keys(get_wheelhouse_dir()))} 个文件 ({get_wheelhouse_dir()})")
+    for env_name, error in wheel_errors.items(): print(f"  [失败] {env_name} 的 pip 包下载失败 (需联网或 pip 缓存): {error}", file=sys.stderr)
+    print(f"用时 {time.perf_counter() - start:.1f}s")
+
+def set_mirror_mode_interactive():
+    """Chooses how installs use the mirror ([Mirror] Mode)."""
+    labels = {'off': "off (不使用本地镜像)", 'prefer': "prefer (优先本地, 缺失时联网)", 'only': "only (完全离线)"}
+    options = [labels[m] for m in MIRROR_MODES]
+    choice = utils.get_user_choice("请选择安装时使用本地镜像的方式:", options, MIRROR_MODES.index(get_mirror_mode()))
+    if not choice: return
+    mode = MIRROR_MODES[options.index(choice)]
+    utils.set_config_value("Mirror", "Mode", mode)
+    print(f"本地镜像模式已设置为: {mode}")
+
+def run_mirror_menu():
+    """Menu action: builds/updates the mirror or chooses how installs use it."""
+    print(f"镜像目录: {get_mirror_dir()}  当前模式: {get_mirror_mode()}")
+    options = ["构建/更新本地镜像", "设置镜像使用模式", "返回"]
+    choice = utils.get_user_choice("请选择操作:", options)
+    if choice == options[0]: build_mirror()
+    elif choice == options[1]: set_mirror_mode_interactive()
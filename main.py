@@ -1,7 +1,6 @@
 # global_tools/main.py
 import os
 import sys
-import zipfile
 import re
 from pathlib import Path
 import traceback
@@ -18,6 +17,16 @@ from . import project_generator
 from . import script_generator
 from . import config as tool_config
 from . import fastapi_utils # <-- IMPORT the new module
+from . import env_runner
+from . import env_pack
+from . import env_audit
+from . import disk_usage
+from . import env_gc
+from . import env_backup
+from . import local_mirror
+from . import node_packager
+from . import archive_engine
+from . import workspace_index
 
 # --- Constants ---
 BANNER_FILE = Path(__file__).parent / "assets" / "banner.txt"
@@ -37,25 +46,27 @@ def get_active_conda_env():
     return None
 
 def package_nodejs_project(project_root):
-    """Packages Node.js project into zip."""
-    project_name=os.path.basename(project_root); zip_filename=f"{project_name}_package.zip"; zip_filepath=os.path.join(project_root,zip_filename)
-    exclude_list={'node_modules','.git','.vscode','dist','build','.DS_Store','Thumbs.db'}; exclude_patterns_end=('.log','.env','.zip','.tgz'); exclude_patterns_start=('.env.',)
-    root_path=Path(project_root); zip_filepath_path=Path(zip_filepath)
-    utils.clear_console(); print(f"\n--- 打包 Node.js 项目 ---"); print(f"正在打包 '{project_name}' 到 '{zip_filename}'...")
-    print(f"排除: {', '.join(exclude_list)}"); print(f"排除模式: {exclude_patterns_start}, {exclude_patterns_end}")
-    items_added=0
+    """Packages Node.js project into a zip/tar archive (format and level chosen by the user)."""
+    utils.clear_console(); print(f"\n--- 打包 Node.js 项目 ---")
+    options = archive_engine.prompt_archive_options()
+    if not options: print("操作取消。"); input("按回车键继续..."); return
+    fmt, level = options
+    project_name=os.path.basename(project_root); archive_filename=f"{project_name}_package{archive_engine.FORMATS[fmt]}"; archive_filepath=os.path.join(project_root,archive_filename)
+    archive_filepath_path=Path(archive_filepath)
+    print(f"正在打包 '{project_name}' 到 '{archive_filename}' (级别 {level})...")
+    print(f"排除: {', '.join(sorted(node_packager.EXCLUDE_DIR_NAMES | node_packager.EXCLUDE_FILE_NAMES))}"); print(f"排除模式: {node_packager.EXCLUDE_PREFIXES}, {node_packager.EXCLUDE_SUFFIXES}")
+    print(f"并遵循: {', '.join(node_packager.IGNORE_FILE_NAMES)}")
+    start=time.perf_counter()
     try:
-        with zipfile.ZipFile(zip_filepath_path,'w',zipfile.ZIP_DEFLATED) as zipf:
-            for item_path in root_path.rglob('*'):
-                relative_path = item_path.relative_to(root_path)
-                if item_path.resolve() == zip_filepath_path.resolve(): continue
-                if {part for part in relative_path.parts}.intersection(exclude_list): continue
-                item_name = item_path.name
-                if item_name.endswith(exclude_patterns_end) or item_name.startswith(exclude_patterns_start): continue
-                if item_path.is_file(): zipf.write(item_path, arcname=relative_path); items_added += 1
-        if items_added > 0: print(f"\n成功打包 ({items_added} 文件) 到: {zip_filepath}")
-        else: print("\n警告: 未添加任何文件。"); zip_filepath_path.unlink(missing_ok=True)
-    except Exception as e: print(f"\n打包出错: {e}", file=sys.stderr); zip_filepath_path.unlink(missing_ok=True)
+        files = [(relative_path, entry.path) for relative_path, entry in node_packager.iter_package_files(project_root, skip_paths=[archive_filepath])]
+        if not files: print("\n警告: 未添加任何文件。"); input("按回车键继续..."); return
+        manifest_path = str(utils.get_project_cache_dir(project_root) / archive_engine.PACKAGE_MANIFEST_FILE_NAME)
+        stats = archive_engine.create_archive(archive_filepath, files, fmt=fmt, level=level, manifest_path=manifest_path)
+        stored = f", {stats['stored']} 个已压缩资源直接存储" if stats['stored'] else ""
+        if stats['reused']: stored += f", {stats['reused']} 个未变化文件复用上次压缩结果"
+        print(f"\n成功打包 ({stats['files']} 文件{stored}) 到: {archive_filepath}")
+        print(f"大小: {disk_usage.format_size(stats['bytes_in'])} -> {disk_usage.format_size(stats['bytes_out'])} (用时 {time.perf_counter() - start:.1f}s)")
+    except Exception as e: print(f"\n打包出错: {e}", file=sys.stderr); archive_filepath_path.unlink(missing_ok=True)
     input("按回车键继续...")
 
 
@@ -75,7 +86,15 @@ def conda_menu(project_root):
             "打开环境命令行", # <-- New Option
             "删除选定环境",
             "导出环境配置 (.yml)",
+            "批量备份环境配置 (并行)",
+            "打包环境 (离线迁移)",
+            "从打包文件恢复环境",
             "列出所有环境",
+            "检查所有环境健康状况",
+            "磁盘占用分析",
+            "清理无项目引用的环境",
+            "预热/整理环境池",
+            "本地镜像 (离线快速安装)",
             "返回主菜单"
             ]
         choice = utils.get_user_choice("请选择操作:", options)
@@ -101,7 +120,14 @@ def conda_menu(project_root):
             current_env_name_cased = conda_manager.find_env_by_name(project_name_for_env) # Re-check
         elif choice == options[4]: # Export
             conda_manager.clone_current_env(project_root)
-        elif choice == options[5]: # List Environments
+        elif choice == options[5]: # Bulk Backup
+            utils.clear_console(); print("\n--- 批量备份环境配置 ---")
+            env_backup.run_bulk_backup()
+        elif choice == options[6]: # Pack
+            env_pack.pack_env_interactive(project_root)
+        elif choice == options[7]: # Unpack
+            env_pack.unpack_env_interactive(project_root)
+        elif choice == options[8]: # List Environments
             utils.clear_console(); print("\n--- 当前 Conda 环境列表 ---")
             env_list = conda_manager.list_conda_envs(use_cache=False)
             # --- CORRECTED BLOCK AGAIN ---
@@ -111,7 +137,22 @@ def conda_menu(project_root):
             else:
                 print("未能获取环境列表或列表为空。")
             # --- END CORRECTED BLOCK ---
-        elif choice == options[6]: # Return
+        elif choice == options[9]: # Audit All Envs
+            utils.clear_console(); print("\n--- 环境健康检查 ---")
+            env_audit.run_env_audit()
+        elif choice == options[10]: # Disk Usage
+            utils.clear_console(); print("\n--- 磁盘占用分析 ---")
+            disk_usage.run_disk_usage_view()
+        elif choice == options[11]: # Orphan Env GC
+            utils.clear_console(); print("\n--- 清理无项目引用的环境 ---")
+            env_gc.run_orphan_env_gc(project_root)
+        elif choice == options[12]: # Warm Env Pool
+            utils.clear_console(); print("\n--- 环境池 (模板环境) ---")
+            conda_manager.warm_env_pool()
+        elif choice == options[13]: # Local Mirror
+            utils.clear_console(); print("\n--- 本地 conda 通道与 pip 仓库 ---")
+            local_mirror.run_mirror_menu()
+        elif choice == options[14]: # Return
             action_taken = False; requires_pause = False; break
         else: # Invalid
             print("无效选项。"); action_taken = False; requires_pause = False
@@ -122,7 +163,8 @@ def python_dependency_menu(project_root, current_env_name_cased):
     """Handles the Python dependency tools submenu."""
     while True:
         utils.clear_console(); print("\n--- Python 依赖工具 ---")
-        options = ["检查/同步依赖文件 (req/toml)", "生成 requirements.txt (pipreqs)", "返回主菜单"]
+        options = ["检查/同步依赖文件 (req/toml)", "生成 requirements.txt (内置扫描)", "生成 requirements.txt (pipreqs)",
+                   "冻结环境到锁文件", "从锁文件重建环境 (免求解)", "返回主菜单"]
         choice = utils.get_user_choice("请选择操作:", options)
         if choice is None: break
         action_taken = False; requires_pause = True
@@ -131,6 +173,14 @@ def python_dependency_menu(project_root, current_env_name_cased):
             dependency_manager.check_and_prompt_sync(project_root)
             requires_pause = False
         elif choice == options[1]:
+            default_env_suggestion = current_env_name_cased or utils.get_default_env_name(project_root)
+            env_input = utils.get_user_input(f"请输入用于确定依赖版本的 Conda 环境", default=default_env_suggestion)
+            if env_input:
+                 env_to_use = conda_manager.find_env_by_name(env_input, use_cache=False)
+                 if env_to_use: dependency_manager.generate_req_from_imports(project_root, env_to_use); action_taken = True
+                 else: print(f"错误: 环境 '{env_input}' 不存在。", file=sys.stderr)
+            else: print("需要环境名称。")
+        elif choice == options[2]:
             default_env_suggestion = current_env_name_cased or utils.get_default_env_name(project_root)
             env_input = utils.get_user_input(f"请输入要运行 pipreqs 的 Conda 环境", default=default_env_suggestion)
             if env_input:
@@ -138,7 +188,16 @@ def python_dependency_menu(project_root, current_env_name_cased):
                  if env_to_use: dependency_manager.generate_req_pipreqs(project_root, env_to_use); action_taken = True
                  else: print(f"错误: 环境 '{env_input}' 不存在。", file=sys.stderr)
             else: print("需要环境名称。")
-        elif choice == options[2]: requires_pause=False; break
+        elif choice == options[3]:
+            default_env_suggestion = current_env_name_cased or utils.get_default_env_name(project_root)
+            env_input = utils.get_user_input(f"请输入要冻结的 Conda 环境", default=default_env_suggestion)
+            if env_input:
+                 env_to_use = conda_manager.find_env_by_name(env_input, use_cache=False)
+                 if env_to_use: dependency_manager.freeze_env_to_lock(project_root, env_to_use); action_taken = True
+                 else: print(f"错误: 环境 '{env_input}' 不存在。", file=sys.stderr)
+            else: print("需要环境名称。")
+        elif choice == options[4]: dependency_manager.create_env_from_lock(project_root); action_taken = True
+        elif choice == options[5]: requires_pause=False; break
         else: print("无效选项。"); requires_pause=False
         if action_taken and requires_pause: input("按回车键继续...")
 
@@ -192,40 +251,9 @@ def python_project_menu(project_root, current_env_name_cased):
             if newly_created_env:
                 current_env_name_cased = newly_created_env # Update local status immediately
                 print(f"\n尝试在 '{newly_created_env}' 中安装依赖...")
-                req_file=os.path.join(project_root,'requirements.txt'); proj_file=os.path.join(project_root,'pyproject.toml')
-                cmd_base = ['conda', 'run', '-n', newly_created_env, '--no-capture-output']
-                install_failed = False # Flag for installation failure
-
-                if os.path.exists(req_file):
-                    print(f"找到 requirements.txt..."); cmd = cmd_base + ['pip', 'install', '-r', 'requirements.txt']
-                    try: utils.run_command(cmd, cwd=project_root, check=True, verbose=True); print("依赖安装成功(pip)。")
-                    except Exception as e: print(f"Pip 安装失败: {e}", file=sys.stderr); install_failed=True
-                elif os.path.exists(proj_file):
-                    print(f"找到 pyproject.toml...")
-                    # --- >>> INSTALL POETRY FIRST <<< ---
-                    print(f"正在环境 '{newly_created_env}' 中安装 Poetry...")
-                    cmd_install_poetry = ['conda', 'run', '-n', newly_created_env, '--no-capture-output', 'pip', 'install', 'poetry']
-                    try:
-                        utils.run_command(cmd_install_poetry, check=True, verbose=True, shell=False) # Use shell=False
-                        print("Poetry 安装成功。")
-
-                        # --- Now run poetry install ---
-                        print(f"正在运行 poetry install...")
-                        cmd_poetry_install = cmd_base + ['poetry', 'install']
-                        try:
-                            utils.run_command(cmd_poetry_install, cwd=project_root, check=True, verbose=True, shell=False) # Use shell=False
-                            print("依赖安装成功(poetry)。")
-                        except FileNotFoundError: print("错误: 'poetry' 命令在安装后仍未找到？", file=sys.stderr); install_failed=True
-                        except subprocess.CalledProcessError as e: print(f"Poetry install 失败 (返回码: {e.returncode})。", file=sys.stderr); install_failed=True
-                        except Exception as e: print(f"Poetry install 时发生未知错误: {e}", file=sys.stderr); install_failed=True
-                    except subprocess.CalledProcessError as e:
-                        print(f"Poetry 安装失败 (返回码: {e.returncode})。", file=sys.stderr); install_failed=True
-                    except Exception as e:
-                         print(f"安装 Poetry 时发生未知错误: {e}", file=sys.stderr); install_failed=True
-                    # --- >>> END POETRY INSTALLATION <<< ---
-                else:
-                    print("未找到依赖文件 (requirements.txt / pyproject.toml)。")
-                    action_taken = False # No real action performed if no files found
+                install_result = dependency_manager.install_project_dependencies(project_root, newly_created_env)
+                if install_result is None: action_taken = False # No real action performed if no files found
+                install_failed = install_result is False
 
                 if install_failed: requires_pause = True # Ensure pause if install failed
             else: action_taken = False
@@ -237,36 +265,9 @@ def python_project_menu(project_root, current_env_name_cased):
                 env_to_use = conda_manager.find_env_by_name(env_input, use_cache=False)
                 if env_to_use:
                     print(f"\n尝试在 '{env_to_use}' 中安装依赖...")
-                    req_file=os.path.join(project_root,'requirements.txt'); proj_file=os.path.join(project_root,'pyproject.toml')
-                    cmd_base = ['conda', 'run', '-n', env_to_use, '--no-capture-output']
-                    install_failed = False
-                    if os.path.exists(req_file):
-                         print(f"找到 requirements.txt..."); cmd = cmd_base + ['pip', 'install', '-r', 'requirements.txt']
-                         try: utils.run_command(cmd, cwd=project_root, check=True, verbose=True); print("依赖安装成功(pip)。")
-                         except Exception as e: print(f"Pip 安装失败: {e}", file=sys.stderr); install_failed=True
-                    elif os.path.exists(proj_file):
-                        print(f"找到 pyproject.toml...")
-                        # --- >>> INSTALL POETRY FIRST <<< ---
-                        print(f"检查/安装 Poetry 到环境 '{env_to_use}'...")
-                        cmd_install_poetry = ['conda', 'run', '-n', env_to_use, '--no-capture-output', 'pip', 'install', 'poetry']
-                        try:
-                            utils.run_command(cmd_install_poetry, check=True, verbose=True, shell=False)
-                            print("Poetry 安装/验证成功。")
-                            # --- Now run poetry install ---
-                            print(f"正在运行 poetry install...")
-                            cmd_poetry_install = cmd_base + ['poetry', 'install']
-                            try:
-                                utils.run_command(cmd_poetry_install, cwd=project_root, check=True, verbose=True, shell=False)
-                                print("依赖安装成功(poetry)。")
-                            except FileNotFoundError: print("错误: 'poetry' 命令在安装后仍未找到？", file=sys.stderr); install_failed=True
-                            except subprocess.CalledProcessError as e: print(f"Poetry install 失败 (返回码: {e.returncode})。", file=sys.stderr); install_failed=True
-                            except Exception as e: print(f"Poetry install 时发生未知错误: {e}", file=sys.stderr); install_failed=True
-                        except subprocess.CalledProcessError as e: print(f"Poetry 安装失败 (返回码: {e.returncode})。", file=sys.stderr); install_failed=True
-                        except Exception as e: print(f"安装 Poetry 时发生未知错误: {e}", file=sys.stderr); install_failed=True
-                        # --- >>> END POETRY INSTALLATION <<< ---
-                    else:
-                        print("未找到依赖文件。")
-                        action_taken = False # No action if no files found
+                    install_result = dependency_manager.install_project_dependencies(project_root, env_to_use)
+                    if install_result is None: action_taken = False # No action if no files found
+                    install_failed = install_result is False
 
                     if install_failed: requires_pause = True
                 else: print(f"错误: 环境 '{env_input}' 不存在。", file=sys.stderr); action_taken = False
@@ -327,15 +328,14 @@ def nodejs_project_menu(project_root, current_env_name_cased):
              existing_env = conda_manager.find_env_by_name(new_env_input, use_cache=False)
              if existing_env: print(f"错误: 环境 '{existing_env}' 已存在。", file=sys.stderr); action_taken=False; continue
              print(f"正在创建环境 '{new_env_input}' 并安装 Node.js/pnpm...")
-             cmd_create = ['conda', 'create', '-n', new_env_input, 'nodejs', 'pnpm', '-c', 'conda-forge', '-y']
              try:
-                 utils.run_command(cmd_create, check=True, verbose=True)
+                 if not conda_manager.create_env_from_spec(new_env_input, ['nodejs', 'pnpm'], channels=['conda-forge']):
+                      print(f"创建 Node.js 环境 '{new_env_input}' 失败。", file=sys.stderr); action_taken=False; continue
                  created_env_name = conda_manager.find_env_by_name(new_env_input, use_cache=False) or new_env_input
                  print(f"环境 '{created_env_name}' 创建成功。"); current_env_name_cased = created_env_name; newly_created_env = created_env_name
                  print(f"\n尝试在 '{created_env_name}' 中运行 pnpm install...")
                  if os.path.exists(os.path.join(project_root, 'package.json')):
-                      cmd_inst = ['conda', 'run', '-n', created_env_name, '--no-capture-output', 'pnpm', 'install']
-                      try: utils.run_command(cmd_inst, cwd=project_root, check=True, verbose=True); print("pnpm install 成功。")
+                      try: env_runner.run_in_env(created_env_name, ['pnpm', 'install'], cwd=project_root, check=True); print("pnpm install 成功。")
                       except Exception as e: print(f"pnpm install 失败: {e}", file=sys.stderr)
                  else: print("未找到 package.json，跳过。")
              except Exception as e: print(f"创建 Node.js 环境失败: {e}", file=sys.stderr); action_taken=False
@@ -348,8 +348,7 @@ def nodejs_project_menu(project_root, current_env_name_cased):
                 if env_to_use:
                     print(f"\n尝试在 '{env_to_use}' 中运行 pnpm install...")
                     if os.path.exists(os.path.join(project_root, 'package.json')):
-                        cmd_inst = ['conda', 'run', '-n', env_to_use, '--no-capture-output', 'pnpm', 'install']
-                        try: utils.run_command(cmd_inst, cwd=project_root, check=True, verbose=True); print("pnpm install 成功。")
+                        try: env_runner.run_in_env(env_to_use, ['pnpm', 'install'], cwd=project_root, check=True); print("pnpm install 成功。")
                         except Exception as e: print(f"pnpm install 失败: {e}", file=sys.stderr)
                     else: print("未找到 package.json。")
                 else: print(f"错误: 环境 '{env_input}' 不存在。", file=sys.stderr); action_taken=False
@@ -374,8 +373,7 @@ def nodejs_project_menu(project_root, current_env_name_cased):
                         chosen_script = utils.get_user_choice("请选择要运行的脚本:", scripts_list, def_idx)
                         if chosen_script:
                              cmd_str = f"pnpm run {chosen_script}"; print(f"\n尝试在 '{env_to_use}' 运行 '{cmd_str}'..."); print("注意：按 Ctrl+C 停止。")
-                             cmd = ['conda', 'run', '-n', env_to_use, '--no-capture-output'] + cmd_str.split()
-                             try: utils.run_command(cmd, cwd=project_root, check=False, capture_output=False, verbose=False)
+                             try: env_runner.run_in_env(env_to_use, cmd_str.split(), cwd=project_root, check=False, verbose=False)
                              except KeyboardInterrupt: print("\n服务已由用户停止。"); requires_pause=False # No pause after stopping server
                              except FileNotFoundError: print(f"错误: 命令 '{cmd_str.split()[0]}' 未找到。", file=sys.stderr)
                              except Exception as e: print(f"运行 '{cmd_str}' 失败: {e}", file=sys.stderr)
@@ -410,20 +408,24 @@ def run_main_menu():
     try:
         project_root = utils.get_project_root(); print(f"当前项目目录: {project_root}")
     except Exception as e: print(f"错误: 无法确定项目根目录: {e}", file=sys.stderr); sys.exit(1)
-    project_type = project_detector.detect_project_type(project_root) # Silent detection
+    project_profile = project_detector.detect_project_profile(project_root, create_cache=True) # Silent, cached detection
+    project_type = project_profile['type']
     detected_type_display = project_type if project_type != 'unknown' else '未知'
-    print(f"检测到的项目类型: {detected_type_display}") # User-facing print
+    print(f"检测到的项目类型: {project_detector.describe_profile(project_profile)}") # User-facing print
     project_name_for_env = utils.get_default_env_name(project_root)
     current_env_name_cased = conda_manager.find_env_by_name(project_name_for_env)
+    recorded_env_name = None
 
     while True:
+        if current_env_name_cased != recorded_env_name: # Keeps the env out of orphan GC; written once per env change
+            env_gc.record_env_association(project_root, current_env_name_cased); recorded_env_name = current_env_name_cased
         utils.clear_console(); print("\n============== 主菜单 ==============")
         env_status = f"(关联环境: {current_env_name_cased})" if current_env_name_cased else "(未找到关联环境)"
         print(f"项目: {os.path.basename(project_root)} ({detected_type_display}) {env_status}")
         options = ["Conda 环境管理"]
         if project_type == 'python': options.extend(["Python 项目辅助", "Python 依赖工具"])
         elif project_type == 'node': options.append("Node.js 项目辅助")
-        options.extend(["Git 工具", "生成常见目录结构", "配置工具默认设置", "退出"])
+        options.extend(["工作区项目索引", "Git 工具", "生成常见目录结构", "配置工具默认设置", "退出"])
 
         choice = utils.get_user_choice("请选择功能:", options)
         if choice is None: choice = "退出"
@@ -454,6 +456,7 @@ def run_main_menu():
                     current_env_name_cased = nodejs_project_menu(project_root, current_env_name_cased)
                 else: utils.clear_console(); print("此选项仅适用于 Node.js 项目。"); input("按回车键继续...")
 
+            elif choice == "工作区项目索引": utils.clear_console(); workspace_index.run_workspace_index_menu(project_root)
             elif choice == "Git 工具": git_menu()
             elif choice == "生成常见目录结构": structure_menu(project_root)
             elif choice == "配置工具默认设置": utils.clear_console(); tool_config.configure_defaults(); input("按回车键继续...")
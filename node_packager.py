@@ -0,0 +1,24 @@
+# global_tools/node_packager.py
+import os
+from . import utils
+from . import ignore_rules
+
+# Never packaged, whatever the ignore files say
+EXCLUDE_DIR_NAMES = {'node_modules', '.git', '.vscode', 'dist', 'build', '.next', '.turbo', '.cache', utils.PROJECT_CACHE_DIR_NAME}
+EXCLUDE_FILE_NAMES = {'.DS_Store', 'Thumbs.db'}
+EXCLUDE_SUFFIXES = ('.log', '.env', '.zip', '.tgz', '.tar.gz', '.tar.xz', '.tar.zst')
+EXCLUDE_PREFIXES = ('.env.',)
+IGNORE_FILE_NAMES = ('.gitignore', '.npmignore')
+
+def iter_package_files(project_root, skip_paths=()):
+    """
+    Yields (rel_path, os.DirEntry) for every file to package. Excluded and
+    .gitignore/.npmignore-ignored directories are pruned before descending
+    (ignore files are compiled once per mtime); skip_paths (e.g. the output archive) are left out. SILENT.
+    """
+    skipped = {os.path.normcase(os.path.abspath(p)) for p in skip_paths}
+    for rel_path, entry in ignore_rules.walk_files(os.path.abspath(project_root), exclude_dir_names=EXCLUDE_DIR_NAMES, ignore_file_names=IGNORE_FILE_NAMES):
+        name = entry.name
+        if name in EXCLUDE_FILE_NAMES or name.endswith(EXCLUDE_SUFFIXES) or name.startswith(EXCLUDE_PREFIXES): continue
+        if skipped and os.path.normcase(entry.path) in skipped: continue
+        yield rel_path, entry
@@ -0,0 +1,230 @@
+# global_tools/package_index.py
+import os
+import re
+import glob
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from . import utils
+from . import requirements_parser
+
+# In-memory per-env indexes: {prefix: (validation_key, index)}
+_index_cache = {}
+PACKAGE_INDEX_VERSION = 2
+STATUS_INSTALLED, STATUS_MISSING, STATUS_CONFLICT = 'installed', 'missing', 'conflict'
+STATUS_LABELS = {STATUS_INSTALLED: "已安装", STATUS_MISSING: "需安装", STATUS_CONFLICT: "版本冲突"}
+
+# --- Names & Versions ---
+
+def normalize_name(name):
+    """PEP 503 name normalization (case-insensitive, runs of -_. collapsed to -)."""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+_PEP440_RE = re.compile(
+    r'^v?(?:(\d+)!)?(\d+(?:\.\d+)*)'                                   # epoch, release
+    r'(?:[-_.]?(a|alpha|b|beta|c|rc|pre|preview)[-_.]?(\d*))?'          # pre-release
+    r'(?:-(\d+)|[-_.]?(?:post|rev|r)[-_.]?(\d*))?'                     # post-release
+    r'(?:[-_.]?dev[-_.]?(\d*))?(?:\+[a-z0-9.]*)?$', re.IGNORECASE)      # dev-release, local
+_PRE_PHASES = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1, 'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+_INFINITY = float('inf')
+
+def version_key(version):
+    """
+    Sort key following PEP 440 ordering (epoch, release, pre, post, dev) without
+    third-party dependencies. Non-PEP 440 versions (e.g. conda's '1.1.1w') fall
+    back to their numeric release parts.
+    """
+    match = _PEP440_RE.match(version.strip())
+    if not match:
+        release = _release_parts(version)
+        while release and release[-1] == 0: release.pop()
+        return (0, tuple(release), (_INFINITY, 0), -1, _INFINITY)
+    epoch, release, pre_phase, pre_num, post_implicit, post_num, dev_num = match.groups()
+    release = [int(p) for p in release.split('.')]
+    while release and release[-1] == 0: release.pop() # 1.0 == 1.0.0
+    post = int(post_implicit or post_num or 0) if (post_implicit is not None or post_num is not None) else -1
+    dev = int(dev_num or 0) if dev_num is not None else _INFINITY
+    if pre_phase: pre = (_PRE_PHASES[pre_phase.lower()], int(pre_num or 0))
+    elif dev != _INFINITY and post == -1: pre = (-_INFINITY, 0) # 1.0.dev1 sorts before 1.0a1
+    else: pre = (_INFINITY, 0)
+    return (int(epoch or 0), tuple(release), pre, post, dev)
+
+def _release_parts(version):
+    return [int(p) for p in re.findall(r'\d+', version.split('+', 1)[0].split('-', 1)[0])]
+
+def version_matches(version, operator, expected):
+    """Evaluates one `<operator> <expected>` clause against an installed version."""
+    if operator == '===': return version.strip() == expected.strip()
+    if expected.endswith('.*') and operator in ('==', '!='):
+        prefix = _release_parts(expected[:-2]); matches = _release_parts(version)[:len(prefix)] == prefix
+        return matches if operator == '==' else not matches
+    installed, wanted = version_key(version), version_key(expected)
+    if operator == '==': return installed == wanted
+    if operator == '!=': return installed != wanted
+    if operator == '>=': return installed >= wanted
+    if operator == '<=': return installed <= wanted
+    if operator == '>': return installed > wanted
+    if operator == '<': return installed < wanted
+    if operator == '~=':
+        release = _release_parts(expected)
+        if len(release) < 2: return installed >= wanted
+        upper = '.'.join(str(p) for p in release[:-2] + [release[-2] + 1])
+        return installed >= wanted and installed < version_key(upper)
+    return False
+
+_SPEC_CLAUSE_RE = re.compile(r'^\s*(===|==|!=|~=|>=|<=|>|<)\s*([^\s,]+)\s*$')
+
+def specifier_satisfied(version, specifier):
+    """True if version satisfies a comma-separated PEP 440 specifier ('' or '*' always match)."""
+    if not specifier or specifier.strip() in ('', '*'): return True
+    for clause in specifier.split(','):
+        if not clause.strip(): continue
+        match = _SPEC_CLAUSE_RE.match(clause)
+        if not match or not version_matches(version, match.group(1), match.group(2)): return False
+    return True
+
+# --- Reading Env Metadata ---
+
+def get_site_packages_dirs(prefix):
+    """Lists the site-packages directories of an env prefix."""
+    if utils.is_windows(): candidates = [os.path.join(prefix, 'Lib', 'site-packages')]
+    else: candidates = glob.glob(os.path.join(prefix, 'lib', 'python*', 'site-packages'))
+    return [d for d in candidates if os.path.isdir(d)]
+
+def _read_conda_record(json_path, prefix=None):
+    """
+    Reads the fields we need from one conda-meta/*.json record, plus the normcased
+    absolute *.dist-info dirs listed in its files (resolved against prefix). Returns (record, dist_info_dirs). SILENT.
+    """
+    data = utils.load_json_file(json_path)
+    if not isinstance(data, dict) or 'name' not in data: return None, set()
+    dist_infos = set()
+    if prefix:
+        for path in data.get('files') or []:
+            head, sep, _ = path.partition('.dist-info/')
+            if sep: dist_infos.add(os.path.normcase(os.path.normpath(os.path.join(prefix, head + '.dist-info'))))
+    return {'name': data['name'], 'version': str(data.get('version', '')), 'build': data.get('build', ''),
+            'channel': data.get('channel', ''), 'source': 'conda'}, dist_infos
+
+def get_conda_owned_dist_infos(prefix):
+    """Normcased *.dist-info dirs that some conda package installed (listed in conda-meta/*.json files). SILENT."""
+    owned = set()
+    for json_path in glob.glob(os.path.join(prefix, 'conda-meta', '*.json')): owned |= _read_conda_record(json_path, prefix)[1]
+    return owned
+
+def read_dist_info_metadata(dist_info_dir, conda_owned=None):
+    """
+    Reads Name/Version from a *.dist-info/METADATA header and the INSTALLER. The source is
+    'conda' when conda_owned (see get_conda_owned_dist_infos) lists the dir; the INSTALLER
+    file only decides when the dir is not listed there. SILENT.
+    """
+    fields = {}
+    try:
+        with open(os.path.join(dist_info_dir, 'METADATA'), 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if not line.strip(): break # Headers end at the first blank line
+                key, sep, value = line.partition(':')
+                if sep and key in ('Name', 'Version') and key not in fields: fields[key] = value.strip()
+    except OSError: return None
+    if 'Name' not in fields: return None
+    try:
+        with open(os.path.join(dist_info_dir, 'INSTALLER'), 'r', encoding='utf-8') as f: installer = f.read().strip()
+    except OSError: installer = ''
+    owned = conda_owned is not None and os.path.normcase(os.path.normpath(dist_info_dir)) in conda_owned
+    return {'name': fields['Name'], 'version': fields.get('Version', ''), 'installer': installer or 'unknown',
+            'source': 'conda' if owned or installer == 'conda' else 'pip', 'dist_info': os.path.basename(dist_info_dir)}
+
+def get_index_validation_key(prefix):
+    """Changes when conda (history) or pip (site-packages dir mtime) changes the env."""
+    paths = [os.path.join(prefix, 'conda-meta', 'history')] + get_site_packages_dirs(prefix)
+    return [[path, utils.get_path_mtime(path)] for path in paths]
+
+def _get_index_cache_path(prefix):
+    cache_dir = utils.get_cache_dir() / 'package_index'
+    utils.ensure_dir_exists(cache_dir)
+    return cache_dir / f"{hashlib.sha1(os.path.normcase(prefix).encode('utf-8')).hexdigest()[:16]}.json"
+
+def build_package_index(prefix, max_workers=8):
+    """
+    Builds {normalized_name: record} for one env from conda-meta/*.json and
+    site-packages/*.dist-info/METADATA, reading files in parallel. Python
+    distributions keep their dist-info name/version; conda-only packages
+    (nodejs, openssl, ...) keep their conda record.
+    """
+    conda_files = glob.glob(os.path.join(prefix, 'conda-meta', '*.json'))
+    dist_dirs = [d for sp in get_site_packages_dirs(prefix) for d in glob.glob(os.path.join(sp, '*.dist-info'))]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        conda_entries = list(pool.map(lambda path: _read_conda_record(path, prefix), conda_files))
+        conda_owned = set().union(*(dist_infos for _, dist_infos in conda_entries))
+        dist_records = list(pool.map(lambda path: read_dist_info_metadata(path, conda_owned), dist_dirs))
+    index = {}
+    for record, _ in conda_entries:
+        if record: index[normalize_name(record['name'])] = record
+    for record in dist_records:
+        if not record: continue
+        key = normalize_name(record['name']); conda_record = index.get(key)
+        if conda_record and conda_record.get('source') == 'conda' and record['source'] == 'pip': record['source'] = 'conda+pip' # pip overwrote a conda package
+        index[key] = record
+    return index
+
+def get_package_index(prefix, use_cache=True):
+    """Returns the env's package index from memory, the on-disk cache, or a fresh build. SILENT."""
+    key = get_index_validation_key(prefix)
+    if use_cache:
+        cached = _index_cache.get(prefix)
+        if cached and cached[0] == key: return cached[1]
+        data = utils.load_json_file(_get_index_cache_path(prefix))
+        if isinstance(data, dict) and data.get('version') == PACKAGE_INDEX_VERSION and data.get('key') == key:
+            _index_cache[prefix] = (key, data['packages']); return data['packages']
+    index = build_package_index(prefix)
+    _index_cache[prefix] = (key, index)
+    utils.save_json_file(_get_index_cache_path(prefix), {'version': PACKAGE_INDEX_VERSION, 'key': key, 'packages': index})
+    return index
+
+# --- Requirement Checks ---
+
+_CONDA_SPEC_RE = re.compile(r'^(?:[^:\s]+::)?([A-Za-z0-9][A-Za-z0-9._-]*)\s*(.*)$')
+
+def parse_conda_spec(spec):
+    """Parses a conda match spec like 'numpy', 'conda-forge::numpy=1.24' or 'numpy>=1.2'. Returns (name, pep440 specifier)."""
+    match = _CONDA_SPEC_RE.match(spec.strip())
+    if not match: return None
+    name, version = match.group(1), match.group(2).replace(' ', '')
+    if not version: return name, ''
+    if re.match(r'^=[^=]', version): # conda 'name=1.2' means 1.2.*
+        version = version[1:].split('=', 1)[0] # Drop a trailing '=build'
+        return name, f"=={version}" if version.endswith('.*') else f"=={version}.*"
+    if version.startswith('==') and '=' in version[2:]: version = version[:2] + version[2:].split('=', 1)[0]
+    return name, version
+
+def check_requirement(index, name, specifier=''):
+    """Returns (status, installed_version) for one requirement against a package index."""
+    record = index.get(normalize_name(name))
+    if not record: return STATUS_MISSING, None
+    if specifier_satisfied(record.get('version', ''), specifier): return STATUS_INSTALLED, record.get('version')
+    return STATUS_CONFLICT, record.get('version')
+
+def check_requirement_records(prefix, records):
+    """
+    Checks parsed requirement records against an env. Returns a list of
+    {'line', 'name', 'specifier', 'status', 'installed'} dicts, or None if any
+    record cannot be evaluated offline (URLs, -e, options, constraints, hashes,
+    extras whose dependencies are not tracked, environment markers...).
+    """
+    index = get_package_index(prefix); results = []
+    for record in records:
+        if record.kind != 'requirement' or record.url or record.constraint or record.hashes or record.options: return None
+        if record.extras or record.marker: return None
+        status, installed = check_requirement(index, record.name, record.specifier)
+        results.append({'line': requirements_parser.format_requirement(record), 'name': record.name,
+                        'specifier': record.specifier, 'status': status, 'installed': installed})
+    return results
+
+def check_requirement_lines(prefix, lines, base_dir=None):
+    """Parses requirement lines (-r includes resolved from base_dir) and checks them, see check_requirement_records."""
+    return check_requirement_records(prefix, requirements_parser.parse_requirement_lines(lines, base_dir=base_dir))
+
+def print_requirement_report(results):
+    """Prints one status line per checked requirement."""
+    for item in results:
+        installed = f" (当前: {item['installed']})" if item['installed'] else ""
+        print(f"  [{STATUS_LABELS[item['status']]}] {item['line']}{installed}")
@@ -1,66 +1,212 @@
 # global_tools/project_detector.py
+# Builds a project profile from one scandir of the root plus a bounded-depth scan of
+# the usual source dirs: scored ecosystems, frameworks, tooling (poetry, PEP 621, pnpm...),
+# workspaces and monorepo sub-projects. The profile is cached in the project's
+# .env_assist dir, keyed on the mtimes of every scanned dir and every file read, so a
+# repeated detection is a few stats and one JSON read.
 import os
-import glob  # Import glob for file searching
+import re
+import json
+import toml
+from . import utils
 
-def detect_project_type(project_root):
-    """
-    Detects the project type based on characteristic files or presence of .py files.
-    Priority: Node -> Python (req/toml) -> Python (any .py) -> Unknown.
+PROFILE_FILE_NAME = "project_profile.json"
+PROFILE_VERSION = 2
+SCAN_DEPTH = 2 # Levels below each source dir
+MAX_SCAN_ENTRIES = 5000 # Bounds the source scan on huge trees
+READ_LIMIT = 64 * 1024 # Bytes read from entry files when looking for framework imports
 
-    Args:
-        project_root (str): The root directory of the project.
+# Marker file -> (ecosystem, score). Any Python marker makes the project Python (the primary
+# dev language), whatever the Node score; loose .py files only count when no marker does.
+# Scores rank the remaining (secondary) ecosystems.
+ECOSYSTEM_MARKERS = {
+    'pyproject.toml': ('python', 10), 'requirements.txt': ('python', 10), 'setup.py': ('python', 10), 'setup.cfg': ('python', 5),
+    'Pipfile': ('python', 10), 'poetry.lock': ('python', 5), 'uv.lock': ('python', 5), 'environment.yml': ('python', 3),
+    'package.json': ('node', 5), 'pnpm-lock.yaml': ('node', 5), 'yarn.lock': ('node', 3), 'package-lock.json': ('node', 3),
+    'pnpm-workspace.yaml': ('node', 3), 'tsconfig.json': ('node', 1),
+    'Cargo.toml': ('rust', 10), 'go.mod': ('go', 10), 'pom.xml': ('java', 10), 'build.gradle': ('java', 10),
+    'build.gradle.kts': ('java', 10), 'Gemfile': ('ruby', 10), 'composer.json': ('php', 10),
+}
+PRIMARY_ECOSYSTEMS = ('python', 'node') # The only values detect_project_type reports
+MONOREPO_MARKERS = {'lerna.json': 'lerna', 'nx.json': 'nx', 'turbo.json': 'turborepo', 'rush.json': 'rush'}
+SOURCE_DIR_NAMES = ('src', 'app', 'lib', 'packages', 'apps', 'services', 'libs')
+SUBPROJECT_MARKERS = ('package.json', 'pyproject.toml', 'setup.py', 'Cargo.toml', 'go.mod')
+SKIP_DIR_NAMES = {'node_modules', '__pycache__', 'dist', 'build', 'venv', 'site-packages'}
+ENTRY_FILE_NAMES = ('main.py', 'app.py', 'manage.py', 'wsgi.py', 'asgi.py', 'server.py')
+PYTHON_FRAMEWORKS = {'fastapi': 'fastapi', 'flask': 'flask', 'django': 'django', 'streamlit': 'streamlit'}
+NODE_FRAMEWORKS = {'next': 'next', 'react': 'react', 'vue': 'vue', 'svelte': 'svelte', 'express': 'express', '@nestjs/core': 'nestjs'}
+_IMPORT_PATTERN = re.compile(r'^\s*(?:from|import)\s+(' + '|'.join(PYTHON_FRAMEWORKS) + r')\b', re.MULTILINE)
+_REQUIREMENT_NAME = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
 
-    Returns:
-        str: 'python', 'node', or 'unknown'.
+def _requirement_name(line):
+    match = _REQUIREMENT_NAME.match(line)
+    return match.group(1).lower().replace('_', '-') if match and not line.lstrip().startswith('-') else None
+
+def _scan_root(project_root):
+    """One scandir of the root: ({name: is_dir}, py_files_found)."""
+    entries = {}
+    try:
+        with os.scandir(project_root) as it:
+            for entry in it:
+                try: entries[entry.name] = entry.is_dir()
+                except OSError: continue
+    except OSError: pass
+    return entries, any(name.endswith('.py') and not is_dir for name, is_dir in entries.items())
+
+def _scan_source_dirs(project_root, dir_names):
     """
-    project_type = 'unknown'  # Default
+    Bounded-depth scandir below the given root dirs. Returns (scanned dir rel paths,
+    .py file found, sub-project rel paths) - a sub-project is a dir holding a SUBPROJECT_MARKERS file.
+    """
+    scanned = []; py_found = False; subprojects = []; budget = MAX_SCAN_ENTRIES
+    stack = [(name, SCAN_DEPTH) for name in dir_names]
+    while stack and budget > 0:
+        rel_dir, remaining = stack.pop(); children = []; names = set()
+        try:
+            with os.scandir(os.path.join(project_root, rel_dir)) as it:
+                for entry in it:
+                    budget -= 1; names.add(entry.name)
+                    if entry.name.endswith('.py'): py_found = True
+                    elif remaining > 0 and entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.') and entry.name not in SKIP_DIR_NAMES:
+                        children.append(f"{rel_dir}/{entry.name}")
+        except OSError: continue
+        scanned.append(rel_dir)
+        if rel_dir not in dir_names and names.intersection(SUBPROJECT_MARKERS): subprojects.append(rel_dir)
+        stack.extend((child, remaining - 1) for child in children)
+    return scanned, py_found, sorted(subprojects)
 
-    # Check for Node.js first
-    package_json_path = os.path.join(project_root, 'package.json')
-    pnpm_lock_path = os.path.join(project_root, 'pnpm-lock.yaml')
-    is_node = os.path.exists(package_json_path) or os.path.exists(pnpm_lock_path)
-    if is_node:
-        project_type = 'node'
+def _python_dependencies(project_root, entries, read_files):
+    """(dependency names, tools, python_requires) from pyproject.toml, Pipfile and requirements*.txt."""
+    names = set(); tools = []; python_requires = None
+    if 'pyproject.toml' in entries:
+        read_files.append('pyproject.toml')
+        try: data = toml.load(os.path.join(project_root, 'pyproject.toml'))
+        except (OSError, toml.TomlDecodeError, ValueError): data = {}
+        project = data.get('project') or {}; poetry = (data.get('tool') or {}).get('poetry') or {}
+        if project:
+            tools.append('pep621'); python_requires = project.get('requires-python')
+            for spec in list(project.get('dependencies') or []) + [s for group in (project.get('optional-dependencies') or {}).values() for s in group]:
+                names.add(_requirement_name(str(spec)))
+        if poetry or 'poetry.lock' in entries:
+            tools.append('poetry'); deps = dict(poetry.get('dependencies') or {})
+            for group in (poetry.get('group') or {}).values(): deps.update(group.get('dependencies') or {})
+            python_requires = python_requires or (deps.get('python') if isinstance(deps.get('python'), str) else None)
+            names.update(n.lower() for n in deps if n != 'python')
+        build_backend = (data.get('build-system') or {}).get('build-backend') or ''
+        for tool in ('hatchling', 'pdm', 'flit', 'setuptools'):
+            if tool in build_backend: tools.append(tool)
+    if 'Pipfile' in entries:
+        tools.append('pipenv'); read_files.append('Pipfile')
+        try: names.update(n.lower() for n in (toml.load(os.path.join(project_root, 'Pipfile')).get('packages') or {}))
+        except (OSError, toml.TomlDecodeError, ValueError): pass
+    if 'uv.lock' in entries: tools.append('uv')
+    if 'setup.py' in entries and 'setuptools' not in tools: tools.append('setuptools')
+    for name in sorted(n for n, is_dir in entries.items() if not is_dir and n.startswith('requirements') and n.endswith('.txt')):
+        if 'pip' not in tools: tools.append('pip')
+        read_files.append(name)
+        try:
+            with open(os.path.join(project_root, name), 'r', encoding='utf-8', errors='replace') as f: names.update(_requirement_name(line) for line in f)
+        except OSError: pass
+    names.discard(None)
+    return names, tools, python_requires
 
-    # Check for Python marker files (requirements/pyproject)
-    pyproject_path = os.path.join(project_root, 'pyproject.toml')
-    requirements_path = os.path.join(project_root, 'requirements.txt')
-    is_python_markers = os.path.exists(pyproject_path) or os.path.exists(requirements_path)
+def _node_manifest(project_root, entries, read_files):
+    """(dependency names, tools, workspaces manager or None) from package.json and lock files."""
+    names = set(); tools = []; workspaces = None; data = {}
+    if 'package.json' in entries:
+        read_files.append('package.json')
+        try:
+            with open(os.path.join(project_root, 'package.json'), 'r', encoding='utf-8') as f: data = json.load(f)
+        except (OSError, ValueError): data = {}
+        if not isinstance(data, dict): data = {}
+        for key in ('dependencies', 'devDependencies', 'peerDependencies'): names.update(data.get(key) or {})
+    declared = str(data.get('packageManager') or '').split('@')[0]
+    for tool, lock in (('pnpm', 'pnpm-lock.yaml'), ('yarn', 'yarn.lock'), ('npm', 'package-lock.json'), ('bun', 'bun.lockb')):
+        if lock in entries or declared == tool: tools.append(tool)
+    if 'pnpm-workspace.yaml' in entries: workspaces = 'pnpm'
+    elif data.get('workspaces'): workspaces = 'yarn' if 'yarn' in tools else 'pnpm' if 'pnpm' in tools else 'npm'
+    return names, tools, workspaces
 
-    # If Python markers found, override Node detection (assuming primary dev is Python)
-    if is_python_markers:
-        project_type = 'python'
+def _entry_file_frameworks(project_root, entries, scanned, read_files):
+    """Frameworks imported by the usual entry files in the root and src/."""
+    found = set()
+    candidates = [n for n in ENTRY_FILE_NAMES if n in entries] + [f"src/{n}" for n in ENTRY_FILE_NAMES if 'src' in scanned]
+    for rel_path in candidates:
+        try:
+            with open(os.path.join(project_root, rel_path), 'r', encoding='utf-8', errors='replace') as f: found.update(_IMPORT_PATTERN.findall(f.read(READ_LIMIT)))
+        except OSError: continue
+        read_files.append(rel_path)
+    return found
 
-    # If still 'unknown', check for any .py files
-    if project_type == 'unknown':
-        # Check for .py files in the root and potentially common src dirs
-        py_files_found = False
-        # Check root directory
-        if glob.glob(os.path.join(project_root, '*.py')):
-            py_files_found = True
-        # Check common source directories (optional, adjust as needed)
-        elif glob.glob(os.path.join(project_root, 'src', '*.py')):
-            py_files_found = True
-        elif glob.glob(os.path.join(project_root, os.path.basename(project_root), '*.py')):
-            py_files_found = True
+def _build_profile(project_root):
+    """Scans the project. Returns (profile, cache key {rel_path: mtime_ns})."""
+    entries, py_in_root = _scan_root(project_root); read_files = []
+    package_dir = os.path.basename(os.path.normpath(project_root))
+    source_dirs = [n for n in SOURCE_DIR_NAMES + (package_dir, package_dir.replace('-', '_')) if entries.get(n)]
+    scanned, py_in_sources, subprojects = _scan_source_dirs(project_root, list(dict.fromkeys(source_dirs)))
+    scores = {}; markers = sorted(n for n in entries if n in ECOSYSTEM_MARKERS or n in MONOREPO_MARKERS)
+    for name in markers:
+        if name in ECOSYSTEM_MARKERS:
+            ecosystem, score = ECOSYSTEM_MARKERS[name]; scores[ecosystem] = scores.get(ecosystem, 0) + score
+    if py_in_root or py_in_sources: scores['python'] = scores.get('python', 0) + 1
+    py_names, py_tools, python_requires = _python_dependencies(project_root, entries, read_files)
+    node_names, node_tools, workspaces = _node_manifest(project_root, entries, read_files)
+    frameworks = {fw for pkg, fw in PYTHON_FRAMEWORKS.items() if pkg in py_names} | {fw for pkg, fw in NODE_FRAMEWORKS.items() if pkg in node_names}
+    if scores.get('python'): frameworks |= _entry_file_frameworks(project_root, entries, scanned, read_files)
+    if 'manage.py' in entries: frameworks.add('django')
+    monorepo_tools = [tool for name, tool in MONOREPO_MARKERS.items() if name in entries]
+    if any(ECOSYSTEM_MARKERS[n][0] == 'python' for n in markers if n in ECOSYSTEM_MARKERS): primary = 'python'
+    else: primary = next((e for e in ('node', 'python') if scores.get(e)), 'unknown') # Loose .py files last
+    profile = {
+        'type': primary,
+        'scores': scores, 'ecosystems': sorted(scores, key=lambda e: (e != primary, -scores[e])),
+        'frameworks': sorted(frameworks), 'tools': py_tools + node_tools + monorepo_tools,
+        'workspaces': workspaces, 'subprojects': subprojects,
+        'monorepo': bool(workspaces or monorepo_tools or len(subprojects) > 1),
+        'python_requires': python_requires, 'markers': markers,
+    }
+    key = {rel: utils.get_path_mtime(os.path.join(project_root, rel)) for rel in ['.'] + scanned + read_files}
+    return profile, key
 
-        if py_files_found:
-            project_type = 'python'
+def _cache_is_valid(project_root, cached):
+    if not isinstance(cached, dict) or cached.get('version') != PROFILE_VERSION or not isinstance(cached.get('key'), dict): return False
+    return all(utils.get_path_mtime(os.path.join(project_root, rel)) == mtime for rel, mtime in cached['key'].items())
 
-    return project_type
+def detect_project_profile(project_root, use_cache=True, create_cache=False):
+    """
+    Returns the project profile: {'type', 'scores', 'ecosystems', 'frameworks', 'tools',
+    'workspaces', 'subprojects', 'monorepo', 'python_requires', 'markers'}.
+    The cache is read when present and written when the project's .env_assist dir
+    already exists (or create_cache), so scanning arbitrary dirs leaves no files behind. SILENT.
+    """
+    cache_dir = os.path.join(project_root, utils.PROJECT_CACHE_DIR_NAME); cache_path = os.path.join(cache_dir, PROFILE_FILE_NAME)
+    if use_cache:
+        cached = utils.load_json_file(cache_path)
+        if _cache_is_valid(project_root, cached) and isinstance(cached.get('profile'), dict): return cached['profile']
+    if create_cache and not os.path.isdir(cache_dir) and os.path.isdir(project_root): utils.get_project_cache_dir(project_root) # Before the scan, so the new dir does not invalidate the key
+    profile, key = _build_profile(project_root)
+    if os.path.isdir(cache_dir): utils.save_json_file(cache_path, {'version': PROFILE_VERSION, 'key': key, 'profile': profile})
+    return profile
 
-    is_node = os.path.exists(package_json_path) or os.path.exists(pnpm_lock_path)
+def describe_profile(profile):
+    """Short display label, e.g. 'python (poetry, fastapi)' or 'node (pnpm, pnpm workspaces, monorepo: 3 个子项目)'. SILENT."""
+    details = profile.get('tools', []) + profile.get('frameworks', [])
+    if profile.get('workspaces'): details.append(f"{profile['workspaces']} workspaces")
+    if profile.get('monorepo'): details.append(f"monorepo: {len(profile.get('subprojects', []))} 个子项目")
+    others = [e for e in profile.get('ecosystems', []) if e != profile.get('type')]
+    if others: details.append("另含 " + '/'.join(others))
+    label = profile.get('type') if profile.get('type') != 'unknown' else '未知'
+    return f"{label} ({', '.join(details)})" if details else label
 
-    project_type = 'unknown'
-    if is_python and is_node:
-        # print("警告：检测到 Python 和 Node.js 的特征文件。将优先识别为 Python。") # REMOVED
-        project_type = 'python' # Prioritize Python if both exist
-    elif is_python:
-        # print("检测到 Python 项目。") # REMOVED
-        project_type = 'python'
-    elif is_node:
-        # print("检测到 Node.js 项目。") # REMOVED
-        project_type = 'node'
-    # else: # print("未能识别特定项目类型。") # REMOVED
+def detect_project_type(project_root):
+    """
+    Detects the project type from the (cached) project profile.
+    Python markers outweigh Node markers; loose .py files count only when no marker does.
 
-    return project_type # Just return the result
\ No newline at end of file
+    Args:
+        project_root (str): The root directory of the project.
+
+    Returns:
+        str: 'python', 'node', or 'unknown'.
+    """
+    return detect_project_profile(project_root)['type']
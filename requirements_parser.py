@@ -0,0 +1,162 @@
+# global_tools/requirements_parser.py
+import os
+import re
+import sys
+from collections import namedtuple
+
+# One record per logical line of a requirements file.
+#   kind: 'requirement' (PEP 508 name/spec or name @ url), 'url' (bare URL/path), 'editable' (-e),
+#         'option' (global options such as --index-url), 'include' (an unresolved -r/-c)
+#   constraint: True for records coming from a -c file
+Requirement = namedtuple('Requirement', ['kind', 'name', 'extras', 'specifier', 'url', 'marker', 'hashes',
+                                         'options', 'constraint', 'line', 'source', 'lineno'])
+
+# --- Compiled Patterns ---
+_NAME = r'[A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?'
+_REQUIREMENT_RE = re.compile(
+    r'^(?P<name>' + _NAME + r')\s*'
+    r'(?:\[(?P<extras>[^\]]*)\])?\s*'
+    r'(?:@\s*(?P<url>\S+)|\(?(?P<spec>(?:\s*(?:===|==|!=|~=|>=|<=|>|<)\s*[^\s,;()]+\s*,?)*)\s*\)?)?\s*'
+    r'(?:;\s*(?P<marker>.*?))?\s*$')
+_COMMENT_RE = re.compile(r'(^|\s+)#.*$')
+_OPTION_SPLIT_RE = re.compile(r'\s+(?=--?[A-Za-z])')
+_LONG_OPTION_RE = re.compile(r'^(--[^\s=]*)[\s=]?(.*)$', re.DOTALL)
+_ENV_VAR_RE = re.compile(r'\$\{([A-Z0-9_]+)\}')
+_EGG_RE = re.compile(r'[#&]egg=(' + _NAME + r')')
+_WHEEL_NAME_RE = re.compile(r'(?:^|/)(' + _NAME + r')-\d[^/]*\.whl$')
+_URL_LIKE_RE = re.compile(r'^(?:[a-zA-Z][a-zA-Z0-9+.-]*://|\.{0,2}[/\\]|[A-Za-z]:[/\\])')
+_ARCHIVE_SUFFIXES = ('.whl', '.zip', '.tar.gz', '.tgz', '.tar.bz2')
+_ARCHIVE_RE = re.compile(r'\.(?:whl|zip|tar\.gz|tgz|tar\.bz2)$')
+
+_INCLUDE_OPTIONS = {'-r': False, '--requirement': False, '-c': True, '--constraint': True}
+_EDITABLE_OPTIONS = ('-e', '--editable')
+
+# Parsed files keyed by (realpath, mtime_ns, size, constraint): the file's own records, -r/-c left
+# unresolved, so an edited included file is re-read even when the including file is unchanged
+_file_cache = {}
+
+def _split_option(token):
+    """'--opt=value' / '--opt value' / '-ovalue' -> (opt, value). The name ends at the first '=' or space."""
+    if token.startswith('--'):
+        match = _LONG_OPTION_RE.match(token)
+        return match.group(1), match.group(2).strip()
+    return token[:2], token[2:].lstrip('=').strip()
+
+def _strip_comment(line):
+    return (_COMMENT_RE.sub('', line) if '#' in line else line).strip()
+
+def _logical_lines(lines):
+    """Joins backslash continuations and strips comments. Yields (lineno, text)."""
+    buffer = []; start = None
+    for lineno, raw in enumerate(lines, 1):
+        line = raw.rstrip('\r\n')
+        if start is None: start = lineno
+        if line.endswith('\\') and not line.endswith('\\\\'):
+            buffer.append(line[:-1]); continue
+        buffer.append(line)
+        text = _strip_comment(' '.join(buffer) if len(buffer) > 1 else line)
+        buffer = []; first = start; start = None
+        if text: yield first, text
+    if buffer:
+        text = _strip_comment(' '.join(buffer))
+        if text: yield start, text
+
+def _name_from_url(url):
+    match = _EGG_RE.search(url) or _WHEEL_NAME_RE.search(url.split('#', 1)[0])
+    return match.group(1) if match else None
+
+def parse_requirement_string(text, source='<string>', lineno=0, constraint=False):
+    """Parses one PEP 508 requirement or bare URL/path (no pip options). Returns a Requirement or None."""
+    text = text.strip()
+    if '/' in text or '\\' in text or text.endswith(_ARCHIVE_SUFFIXES): # Cheap pre-check before the URL patterns
+        target = text.split(';', 1)[0].strip()
+        if _URL_LIKE_RE.match(target) or ('@' not in target and _ARCHIVE_RE.search(target)):
+            url, _, marker = text.partition(';')
+            return Requirement('url', _name_from_url(url.strip()), (), '', url.strip(), marker.strip() or None, (), (), constraint, text, source, lineno)
+    match = _REQUIREMENT_RE.match(text)
+    if not match: return None
+    extras = match.group('extras'); spec = match.group('spec'); marker = match.group('marker')
+    extras = tuple(sorted(e.strip().lower() for e in extras.split(',') if e.strip())) if extras else ()
+    specifier = ''.join(spec.split()).strip(',') if spec else ''
+    return Requirement('requirement', match.group('name'), extras, specifier, match.group('url'),
+                       marker.strip() or None if marker else None, (), (), constraint, text, source, lineno)
+
+def _parse_logical_line(text, source, lineno, constraint):
+    """Parses one logical line. Returns (record or None, include or None) where include is (path, is_constraint)."""
+    if '${' in text: text = _ENV_VAR_RE.sub(lambda m: os.environ.get(m.group(1), m.group(0)), text)
+    if text.startswith('-'):
+        opt, value = _split_option(text)
+        if opt in _INCLUDE_OPTIONS: return None, (value, _INCLUDE_OPTIONS[opt] or constraint)
+        if opt in _EDITABLE_OPTIONS:
+            target = value.split(';', 1)[0].strip()
+            return Requirement('editable', _name_from_url(target), (), '', target, None, (), (), constraint, text, source, lineno), None
+        return Requirement('option', None, (), '', None, None, (), ((opt, value),), constraint, text, source, lineno), None
+    parts = _OPTION_SPLIT_RE.split(text) if ' -' in text else [text]
+    record = parse_requirement_string(parts[0], source, lineno, constraint)
+    if record is None: return None, None
+    hashes = []; options = []
+    for token in parts[1:]:
+        opt, value = _split_option(token)
+        if opt == '--hash': hashes.append(value)
+        else: options.append((opt, value))
+    if hashes or options: record = record._replace(hashes=tuple(hashes), options=tuple(options), line=text)
+    return record, None
+
+def parse_requirement_lines(lines, source='<string>', base_dir=None, resolve_includes=True, constraint=False, _stack=()):
+    """
+    Streams Requirement records from requirements-file lines in a single pass.
+    -r/-c includes are resolved relative to base_dir (memoized, cycle-safe); unparsable
+    lines are reported on stderr and skipped.
+    """
+    for lineno, text in _logical_lines(lines):
+        record, include = _parse_logical_line(text, source, lineno, constraint)
+        if include:
+            path, is_constraint = include
+            if not resolve_includes or re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', path):
+                yield Requirement('include', None, (), '', path, None, (), (('-c' if is_constraint else '-r', path),), is_constraint, text, source, lineno)
+                continue
+            full_path = os.path.normpath(os.path.join(base_dir or os.getcwd(), os.path.expanduser(path)))
+            yield from _parse_included_file(full_path, is_constraint, _stack)
+        elif record: yield record
+        else: print(f"警告: 无法解析 {source}:{lineno} '{text}'，已跳过。", file=sys.stderr)
+
+def _parse_included_file(path, constraint, stack):
+    """Parses each file once per (path, mtime, size) and expands its includes on every call; detects include cycles."""
+    real_path = os.path.realpath(path)
+    if real_path in stack:
+        print(f"警告: 检测到循环包含 '{path}'，已跳过。", file=sys.stderr); return
+    try: st = os.stat(real_path)
+    except OSError:
+        print(f"警告: 包含的依赖文件 '{path}' 不存在，已跳过。", file=sys.stderr); return
+    key = (real_path, st.st_mtime_ns, st.st_size, constraint)
+    records = _file_cache.get(key)
+    if records is None:
+        with open(real_path, 'r', encoding='utf-8', errors='replace') as f:
+            records = list(parse_requirement_lines(f, source=path, base_dir=os.path.dirname(real_path), resolve_includes=False, constraint=constraint))
+        _file_cache[key] = records
+    for record in records:
+        if record.kind != 'include' or re.match(r'^[a-zA-Z][a-zA-Z0-9+.-]*://', record.url): yield record; continue
+        full_path = os.path.normpath(os.path.join(os.path.dirname(real_path), os.path.expanduser(record.url)))
+        yield from _parse_included_file(full_path, record.constraint, stack + (real_path,))
+
+def parse_requirements_file(path, resolve_includes=True):
+    """Streams Requirement records from a requirements file (see parse_requirement_lines)."""
+    if not resolve_includes:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            yield from parse_requirement_lines(f, source=path, base_dir=os.path.dirname(os.path.abspath(path)), resolve_includes=False)
+        return
+    yield from _parse_included_file(os.path.abspath(path), False, ())
+
+def format_requirement(record, include_hashes=True, include_options=True):
+    """Formats a record back into a requirements-file line."""
+    if record.kind == 'option': return ' '.join(f"{opt} {value}".strip() for opt, value in record.options)
+    if record.kind == 'include': return f"{record.options[0][0]} {record.url}"
+    if record.kind == 'editable': return f"-e {record.url}"
+    if record.kind == 'url': line = record.url
+    else:
+        line = record.name + (f"[{','.join(record.extras)}]" if record.extras else '')
+        line += f" @ {record.url}" if record.url else record.specifier
+    if record.marker: line += f" ; {record.marker}"
+    if include_options: line += ''.join(f" {opt}={value}" if value else f" {opt}" for opt, value in record.options)
+    if include_hashes: line += ''.join(f" --hash={h}" for h in record.hashes)
+    return line
@@ -4,7 +4,10 @@ import sys
 import os
 import platform # Import platform
 import configparser
+import json
 import re
+import time
+import collections
 from pathlib import Path
 from pypinyin import pinyin, Style
 
@@ -59,11 +62,16 @@ def is_windows():
     """Checks if the current operating system is Windows."""
     return platform.system() == "Windows"
 
-def run_command(command, cwd=None, capture_output=True, text=True, encoding='utf-8', env=None, check=False, shell=True, verbose=True):
+def run_command(command, cwd=None, capture_output=True, text=True, encoding='utf-8', env=None, check=False, shell=True, verbose=True, stream=False):
     """
     Runs a shell command. Suppresses command echo and stdout if verbose=False.
-    Always prints stderr if it exists.
+    Always prints stderr if it exists. stream=True (with capture_output=False)
+    uses run_command_streaming for per-phase progress and timings.
     """
+    if stream and not capture_output and streaming_enabled():
+        try: return run_command_streaming(command, cwd=cwd, env=env, check=check, shell=shell, verbose=verbose)
+        except FileNotFoundError:
+            print(f"错误：命令 '{command if isinstance(command, str) else command[0]}' 未找到。", file=sys.stderr); raise
     cmd_str = ' '.join(command) if isinstance(command, list) else command
     if verbose:
         print(f"执行命令 ({'shell' if shell else 'no shell'}): {cmd_str}")
@@ -158,4 +166,156 @@ def ensure_dir_exists(dir_path):
     """Ensures a directory exists, creating it if necessary."""
     path = Path(dir_path)
     try: path.mkdir(parents=True, exist_ok=True)
-    except Exception as e: print(f"错误: 无法创建目录 '{dir_path}': {e}", file=sys.stderr); raise
\ No newline at end of file
+    except Exception as e: print(f"错误: 无法创建目录 '{dir_path}': {e}", file=sys.stderr); raise
+
+def get_path_mtime(path):
+    """Returns the st_mtime_ns of a path, or None if it does not exist. SILENT."""
+    try: return os.stat(path).st_mtime_ns
+    except OSError: return None
+
+# --- Persistent Caches ---
+CACHE_DIR_NAME = ".env_assist_tool_cache"
+
+def get_cache_dir():
+    """Gets (and creates) the tool's cache directory in the user's home directory."""
+    cache_dir = Path.home() / CACHE_DIR_NAME
+    ensure_dir_exists(cache_dir)
+    return cache_dir
+
+PROJECT_CACHE_DIR_NAME = ".env_assist"
+
+def get_project_cache_dir(project_root):
+    """Gets (and creates) the per-project state directory, which git-ignores itself."""
+    cache_dir = Path(project_root) / PROJECT_CACHE_DIR_NAME
+    ensure_dir_exists(cache_dir)
+    gitignore_path = cache_dir / ".gitignore"
+    if not gitignore_path.exists():
+        try: gitignore_path.write_text("# Created by environment auxiliary tool\n*\n", encoding='utf-8')
+        except OSError: pass
+    return cache_dir
+
+def load_json_file(file_path, default=None):
+    """Loads a JSON file, returning default if it is missing or unreadable. SILENT."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f: return json.load(f)
+    except (OSError, ValueError): return default
+
+def save_json_file(file_path, data):
+    """Atomically writes data as JSON (temp file + rename). Returns True on success."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, file_path)
+        return True
+    except Exception as e:
+        print(f"警告: 无法写入缓存文件 '{file_path}': {e}", file=sys.stderr)
+        try: os.remove(tmp_path)
+        except OSError: pass
+        return False
+# --- Streaming Runner ---
+# run_command(stream=True) reads the merged stdout/stderr of conda/pip as it
+# arrives, maps lines to phases and reports how long each phase took. Only the
+# last STREAM_TAIL_LINES lines are kept (for error reports), never the whole output.
+STREAM_TAIL_LINES = 40
+TIMINGS_FILE_NAME = "operation_timings.json"
+MAX_TIMING_RECORDS = 200
+PHASE_LABELS = {'solve': "求解", 'download': "下载/解压", 'build': "构建", 'link': "链接/安装", 'other': "启动/其他"}
+# conda --json emits NUL-separated progress records ({"fetch": ..., "progress": ...}) on
+# versions that have them; newer versions stay silent until the final result, so the
+# text markers below are what normally drives the phases.
+CONDA_PHASE_MARKERS = (
+    ('Collecting package metadata', 'solve'), ('Solving environment', 'solve'),
+    ('Downloading and Extracting Packages', 'download'), ('Preparing transaction', 'link'),
+    ('Verifying transaction', 'link'), ('Executing transaction', 'link'),
+)
+PIP_PHASE_MARKERS = (
+    ('Collecting ', 'solve'), ('Looking in ', 'solve'), ('Requirement already satisfied', 'solve'), ('Processing ', 'solve'),
+    ('Downloading ', 'download'), ('Using cached ', 'download'), ('Saved ', 'download'),
+    ('Building wheel', 'build'), ('Preparing metadata', 'build'), ('Getting requirements to build', 'build'), ('Installing build dependencies', 'build'),
+    ('Installing collected packages', 'link'), ('Successfully installed', 'link'), ('Attempting uninstall', 'link'),
+)
+POETRY_PHASE_MARKERS = (
+    ('Updating dependencies', 'solve'), ('Resolving dependencies', 'solve'), ('Installing dependencies', 'link'),
+    ('Package operations', 'link'), ('Installing the current project', 'link'),
+)
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]|[\x08]')
+_CONDA_BAR_RE = re.compile(r'^(\S+)\s*\|\s*[\d.]+\s*\S+\s*\|\s*#*\s*\|\s*(\d+)%')
+
+def streaming_enabled():
+    """[Execution] StreamProgress = on (default) / off. SILENT."""
+    return get_config_value("Execution", "StreamProgress", "on").strip().lower() not in ('off', 'false', '0', 'no')
+
+def _select_phase_markers(cmd_str):
+    tool = next((os.path.basename(t).lower().split('.')[0] for t in cmd_str.split() if os.path.basename(t).lower().split('.')[0] in ('pip', 'pip3', 'poetry')), None)
+    if tool == 'poetry': return POETRY_PHASE_MARKERS
+    return PIP_PHASE_MARKERS if tool else CONDA_PHASE_MARKERS
+
+def _parse_stream_line(line, markers):
+    """Returns (phase or None, progress event or None) for one output line."""
+    if line.startswith('{') and '"fetch"' in line:
+        try:
+            record = json.loads(line)
+            return 'download', (record.get('fetch'), 100 if record.get('finished') else int(float(record.get('progress', 0)) * 100))
+        except ValueError: pass
+    for marker, phase in markers: # Markers can share a line with the last progress bar
+        if marker in line: return phase, None
+    match = _CONDA_BAR_RE.match(line)
+    if match: return 'download', (match.group(1), int(match.group(2)))
+    return None, None
+
+def _record_timings(command, phases, total, returncode):
+    path = get_cache_dir() / TIMINGS_FILE_NAME
+    records = load_json_file(path, default=[]) or []
+    records.append({'command': ' '.join(command[:4]) if isinstance(command, list) else command[:80], 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'total': round(total, 2), 'phases': {k: round(v, 2) for k, v in phases.items()}, 'returncode': returncode})
+    save_json_file(path, records[-MAX_TIMING_RECORDS:])
+
+def print_phase_breakdown(phases, total):
+    """Prints 'phase: seconds (share)' for a finished streamed command."""
+    print(f"耗时分布 (共 {total:.1f}s): " + ", ".join(
+        f"{PHASE_LABELS.get(p, p)} {s:.1f}s ({s / total * 100 if total else 0:.0f}%)" for p, s in phases.items()))
+
+def run_command_streaming(command, cwd=None, env=None, check=False, shell=True, verbose=True):
+    """
+    Runs a conda/pip command and consumes its output line by line (split on \\n, \\r
+    and NUL). Prints phase changes and download progress, records the per-phase
+    durations in the cache dir and returns a CompletedProcess whose stdout is the
+    output tail and whose `phases` attribute maps phase -> seconds.
+    """
+    cmd_str = ' '.join(command) if isinstance(command, list) else command
+    if verbose: print(f"执行命令 ({'shell' if shell else 'no shell'}, 流式): {cmd_str}")
+    markers = _select_phase_markers(cmd_str)
+    tail = collections.deque(maxlen=STREAM_TAIL_LINES); phases = {}; completed = set()
+    start = phase_start = time.perf_counter(); phase = 'other'; interactive = sys.stdout.isatty()
+    process = subprocess.Popen(command, cwd=cwd, env=env or os.environ, shell=shell, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    pending = b''
+    for chunk in iter(lambda: process.stdout.read1(65536) if hasattr(process.stdout, 'read1') else process.stdout.read(4096), b''):
+        pending += chunk
+        parts = re.split(rb'[\r\n\0]', pending); pending = parts.pop()
+        for raw in parts:
+            line = _ANSI_RE.sub('', raw.decode('utf-8', errors='replace')).strip()
+            if not line: continue
+            new_phase, progress = _parse_stream_line(line, markers)
+            if new_phase and new_phase != phase:
+                now = time.perf_counter(); phases[phase] = phases.get(phase, 0) + now - phase_start; phase_start = now; phase = new_phase
+                if interactive: print()
+                print(f"[{PHASE_LABELS.get(phase, phase)}] {line if not progress else ''}".rstrip())
+            if progress:
+                if progress[1] >= 100: completed.add(progress[0])
+                if interactive: print(f"\r  已完成 {len(completed)} 个包 (当前: {progress[0]} {progress[1]}%)".ljust(70), end='', flush=True)
+            elif verbose and not new_phase and line.strip('-\\|/ ') and line != 'done' and not line.startswith('... (more hidden)'): print(f"  {line}")
+            if not progress and line not in ('-', '\\', '|', '/', 'done'): tail.append(line)
+    if pending.strip(): tail.append(pending.decode('utf-8', errors='replace').strip())
+    returncode = process.wait(); total = time.perf_counter() - start
+    phases[phase] = phases.get(phase, 0) + time.perf_counter() - phase_start
+    phases = {p: s for p, s in phases.items() if s >= 0.05 or p != 'other'}
+    if interactive and completed: print()
+    if verbose: print_phase_breakdown(phases, total)
+    try: _record_timings(command, phases, total, returncode)
+    except Exception: pass # Timing history is best effort
+    result = subprocess.CompletedProcess(command, returncode, stdout='\n'.join(tail), stderr=None); result.phases = phases
+    if returncode != 0:
+        print("命令输出 (末尾):\n" + result.stdout, file=sys.stderr)
+        if check: raise subprocess.CalledProcessError(returncode, command, output=result.stdout)
+        print(f"命令执行警告: 返回码 {returncode}", file=sys.stderr)
+    return result
@@ -0,0 +1,213 @@
+# global_tools/workspace_index.py
+# SQLite index of every project under the workspace roots ([GC] WorkspaceRoots):
+# detected type/frameworks, associated env (and its Python), dependency files and
+# mtimes. Re-indexing is incremental: a directory whose mtime is unchanged reuses its
+# stored child list (no scandir), and a project whose dir and dependency files are
+# unchanged keeps its row without being re-detected. Env associations are re-resolved
+# on every run, since env changes do not touch project dirs.
+import os
+import json
+import time
+import sqlite3
+from . import utils
+from . import conda_manager
+from . import project_detector
+from . import env_gc
+
+INDEX_FILE_NAME = "workspace_index.sqlite3"
+INDEX_SCHEMA_VERSION = 1
+DEPENDENCY_FILE_NAMES = {'pyproject.toml', 'setup.py', 'setup.cfg', 'Pipfile', 'Pipfile.lock', 'poetry.lock', 'uv.lock', 'environment.yml',
+                         'package.json', 'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'pnpm-workspace.yaml',
+                         'Cargo.toml', 'go.mod', 'pom.xml', 'build.gradle', 'Gemfile', 'composer.json'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER, children TEXT, is_project INTEGER);
+CREATE TABLE IF NOT EXISTS projects (
+    path TEXT PRIMARY KEY, root TEXT, name TEXT, type TEXT, ecosystems TEXT, frameworks TEXT, tools TEXT,
+    python_requires TEXT, monorepo INTEGER, env_name TEXT, env_prefix TEXT, env_python TEXT,
+    dependency_files TEXT, dir_mtime_ns INTEGER, last_modified REAL, indexed_at REAL);
+CREATE INDEX IF NOT EXISTS projects_env_python ON projects (env_python);
+CREATE INDEX IF NOT EXISTS projects_type ON projects (type);
+"""
+
+def get_index_path():
+    return utils.get_cache_dir() / INDEX_FILE_NAME
+
+def _connect():
+    conn = sqlite3.connect(str(get_index_path())); conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS projects;")
+        conn.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _dependency_files(path):
+    """One scandir of a project dir: ({dependency file: mtime_ns}, newest mtime of its entries in seconds)."""
+    files = {}; newest = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try: st = entry.stat(follow_symlinks=False)
+                except OSError: continue
+                newest = max(newest, st.st_mtime)
+                if entry.name in DEPENDENCY_FILE_NAMES or (entry.name.startswith('requirements') and entry.name.endswith('.txt')):
+                    files[entry.name] = st.st_mtime_ns
+    except OSError: pass
+    return files, newest
+
+def _project_unchanged(row, mtime_ns):
+    if row is None or row['dir_mtime_ns'] != mtime_ns: return False
+    return all(utils.get_path_mtime(os.path.join(row['path'], name)) == mtime for name, mtime in json.loads(row['dependency_files']).items())
+
+def _visit(path, root, old_dirs, old_projects):
+    """
+    Visits one dir for env_gc.walk_workspace against the previous index state (read-only).
+    Returns ({'dir': dir row, 'project': changed project row or None, 'kept', 'detected', 'scanned'}, children) or (None, None).
+    """
+    mtime_ns = utils.get_path_mtime(path)
+    if mtime_ns is None: return None, None
+    result = {'dir': None, 'project': None, 'kept': False, 'detected': False, 'scanned': False}
+    old = old_dirs.get(path)
+    if old and old['mtime_ns'] == mtime_ns and old['is_project']:
+        if _project_unchanged(old_projects.get(path), mtime_ns):
+            result.update(dir=(path, mtime_ns, old['children'], 1), kept=True); return result, None
+    elif old and old['mtime_ns'] == mtime_ns: # Entries unchanged, so still not a project and same children
+        result['dir'] = (path, mtime_ns, old['children'], 0); return result, json.loads(old['children'])
+    result['detected'] = True
+    profile = project_detector.detect_project_profile(path)
+    if profile['type'] != 'unknown':
+        dependency_files, newest = _dependency_files(path)
+        result['project'] = {'path': path, 'root': root, 'name': os.path.basename(path), 'profile': profile, 'dependency_files': dependency_files,
+                             'dir_mtime_ns': mtime_ns, 'last_modified': newest}
+        result['dir'] = (path, mtime_ns, '[]', 1); return result, None
+    result['scanned'] = True
+    try: children = env_gc.list_subdirs(path)
+    except OSError: children = []
+    result['dir'] = (path, mtime_ns, json.dumps(children), 0)
+    return result, children
+
+def _resolve_envs(conn, records):
+    """Re-links every indexed project to its env: recorded association first, then the default-name rule."""
+    by_name = {r['name'].lower(): r for r in records}; associations = env_gc.load_associations(); updates = []
+    for row in conn.execute("SELECT path, name FROM projects"):
+        entry = associations.get(os.path.normcase(os.path.abspath(row['path'])))
+        record = by_name.get(str(entry.get('env', '')).lower()) if entry else None
+        record = record or by_name.get(utils.get_default_env_name(row['path']).lower())
+        if record and (record.get('is_base') or conda_manager.is_pool_env(record['name'])): record = None
+        updates.append((record['name'] if record else None, record['prefix'] if record else None, record.get('python') if record else None, row['path']))
+    conn.executemany("UPDATE projects SET env_name = ?, env_prefix = ?, env_python = ? WHERE path = ?", updates)
+
+def update_index(roots=None, depth=None, max_workers=None, full=False):
+    """
+    Walks the workspace roots with env_gc.walk_workspace and updates the index; full=True ignores the previous state. Rows under the roots that were not
+    seen again are removed. Returns stats {'projects', 'changed', 'dirs', 'scanned', 'detected', 'seconds'}. SILENT.
+    """
+    roots = roots if roots is not None else env_gc.get_workspace_roots(); depth = depth or env_gc.get_scan_depth()
+    start = time.perf_counter(); conn = _connect()
+    try:
+        old_dirs = {} if full else {r['path']: r for r in conn.execute("SELECT * FROM dirs")}
+        old_projects = {} if full else {r['path']: r for r in conn.execute("SELECT * FROM projects")}
+        results = env_gc.walk_workspace(roots, depth, lambda path, remaining, root: _visit(path, root, old_dirs, old_projects), max_workers)
+        dir_rows = [r['dir'] for r in results]; project_rows = [r['project'] for r in results if r['project']]
+        kept = [r['dir'][0] for r in results if r['kept']]
+        stats = {'dirs': len(results), 'scanned': sum(r['scanned'] for r in results), 'detected': sum(r['detected'] for r in results)}
+        now = time.time()
+        with conn:
+            seen_dirs = {row[0] for row in dir_rows}; seen_projects = {p['path'] for p in project_rows} | set(kept)
+            for root in roots:
+                prefix = os.path.join(root, '')
+                stale_dirs = [p for p in old_dirs if (p == root or p.startswith(prefix)) and p not in seen_dirs]
+                stale_projects = [p for p in old_projects if (p == root or p.startswith(prefix)) and p not in seen_projects]
+                conn.executemany("DELETE FROM dirs WHERE path = ?", [(p,) for p in stale_dirs])
+                conn.executemany("DELETE FROM projects WHERE path = ?", [(p,) for p in stale_projects])
+            if full: conn.execute("DELETE FROM dirs"); conn.execute("DELETE FROM projects")
+            conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", dir_rows)
+            conn.executemany("INSERT OR REPLACE INTO projects (path, root, name, type, ecosystems, frameworks, tools, python_requires, monorepo, "
+                             "dependency_files, dir_mtime_ns, last_modified, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [(p['path'], p['root'], p['name'], p['profile']['type'], ','.join(p['profile']['ecosystems']),
+                               ','.join(p['profile']['frameworks']), ','.join(p['profile']['tools']), p['profile'].get('python_requires'),
+                               int(p['profile'].get('monorepo', False)), json.dumps(p['dependency_files']), p['dir_mtime_ns'], p['last_modified'], now)
+                              for p in project_rows])
+            _resolve_envs(conn, conda_manager.get_env_index(use_cache=False))
+        stats.update(projects=len(seen_projects), changed=len(project_rows), seconds=time.perf_counter() - start)
+        return stats
+    finally: conn.close()
+
+# --- Queries ---
+def query_projects(python=None, no_env=False, project_type=None, framework=None, name=None):
+    """
+    Indexed projects matching every given filter, as dicts sorted by path. python matches the
+    associated env's version by prefix ('3.8' -> 3.8.x); framework/name match substrings. SILENT.
+    """
+    if not os.path.exists(get_index_path()): return []
+    clauses = []; params = []
+    if python: clauses.append("(env_python = ? OR env_python LIKE ?)"); params += [python, f"{python}.%"]
+    if no_env: clauses.append("env_name IS NULL")
+    if project_type: clauses.append("type = ?"); params.append(project_type)
+    if framework: clauses.append("(',' || frameworks || ',') LIKE ?"); params.append(f"%,{framework.lower()},%")
+    if name: clauses.append("name LIKE ?"); params.append(f"%{name}%")
+    conn = _connect()
+    try:
+        sql = "SELECT * FROM projects" + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY path"
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally: conn.close()
+
+def summarize_index():
+    """{'projects', 'no_env', 'by_type': {type: n}, 'by_python': {version: n}} from the index. SILENT."""
+    if not os.path.exists(get_index_path()): return {'projects': 0, 'no_env': 0, 'by_type': {}, 'by_python': {}}
+    conn = _connect()
+    try:
+        by_type = dict(conn.execute("SELECT type, COUNT(*) FROM projects GROUP BY type").fetchall())
+        by_python = {}
+        for version, count in conn.execute("SELECT env_python, COUNT(*) FROM projects WHERE env_python IS NOT NULL GROUP BY env_python"):
+            minor = '.'.join(str(version).split('.')[:2]); by_python[minor] = by_python.get(minor, 0) + count
+        no_env = conn.execute("SELECT COUNT(*) FROM projects WHERE env_name IS NULL").fetchone()[0]
+        return {'projects': sum(by_type.values()), 'no_env': no_env, 'by_type': by_type, 'by_python': by_python}
+    finally: conn.close()
+
+# --- Menu Action ---
+def _print_projects(rows):
+    if not rows: print("没有匹配的项目。"); return
+    for row in rows:
+        modified = time.strftime('%Y-%m-%d', time.localtime(row['last_modified'])) if row['last_modified'] else '-'
+        env = f"{row['env_name']} (Python {row['env_python'] or '-'})" if row['env_name'] else "无环境"
+        details = ', '.join(filter(None, [row['tools'], row['frameworks']]))
+        print(f"  {row['path']}  [{row['type']}{': ' + details if details else ''}]  {env}  修改: {modified}")
+    print(f"共 {len(rows)} 个项目。")
+
+def _run_update(project_root, full=False):
+    roots = env_gc.get_workspace_roots()
+    if not roots:
+        default_root = os.path.dirname(os.path.abspath(project_root))
+        value = utils.get_user_input(f"请输入要索引的工作区目录 (多个用 '{os.pathsep}' 分隔)", default=default_root)
+        if not value: print("操作取消。"); return
+        utils.set_config_value("GC", "WorkspaceRoots", value); roots = env_gc.get_workspace_roots()
+    print(f"正在并行{'重建' if full else '更新'}工作区索引: {', '.join(roots)} (深度 {env_gc.get_scan_depth()})...")
+    stats = update_index(roots, full=full)
+    print(f"索引完成: {stats['projects']} 个项目 ({stats['changed']} 个新增/变化), 遍历 {stats['dirs']} 个目录, "
+          f"其中 {stats['detected']} 个重新检测 (用时 {stats['seconds']:.2f}s)。")
+
+def run_workspace_index_menu(project_root):
+    """Menu action: updates the workspace index and answers fleet-wide queries."""
+    while True:
+        summary = summarize_index()
+        print(f"\n索引: {get_index_path()}  项目: {summary['projects']}  无环境: {summary['no_env']}")
+        if summary['by_python']: print("按环境 Python 版本: " + ', '.join(f"{v}: {n}" for v, n in sorted(summary['by_python'].items())))
+        options = ["增量更新索引", "完全重建索引", "按 Python 版本查询", "列出没有环境的项目", "按类型/框架查询", "按名称查询", "返回"]
+        choice = utils.get_user_choice("请选择操作:", options)
+        if choice is None or choice == options[6]: return
+        start = time.perf_counter()
+        if choice == options[0]: _run_update(project_root) # Incremental update
+        elif choice == options[1]: _run_update(project_root, full=True) # Full rebuild
+        elif choice == options[2]: # By env Python version
+            version = utils.get_user_input("请输入 Python 版本 (如 3.8)")
+            if version: _print_projects(query_projects(python=version))
+        elif choice == options[3]: _print_projects(query_projects(no_env=True)) # Projects without env
+        elif choice == options[4]: # By type / framework
+            value = utils.get_user_input("请输入项目类型 (python/node) 或框架名 (如 fastapi)")
+            if value: _print_projects(query_projects(project_type=value.lower()) if value.lower() in project_detector.PRIMARY_ECOSYSTEMS else query_projects(framework=value))
+        elif choice == options[5]: # By name
+            value = utils.get_user_input("请输入项目名称 (部分匹配)")
+            if value: _print_projects(query_projects(name=value))
+        if choice not in options[:2]: print(f"(查询用时 {(time.perf_counter() - start) * 1000:.1f}ms)")
+        input("按回车键继续...")